@@ -0,0 +1,237 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark offline e reprodutível do pipeline de devolução: ingestão de embeddings,
+carga dos índices, resolve_ean, busca vetorial e busca de notas, com latências p50/p95/p99,
+throughput e memória. Usa SQLite no lugar do Oracle e embeddings determinísticos no lugar
+da OCI, então roda sem credenciais. Exemplo:
+
+    python benchmark.py --produtos 1000000 --notas 1000000 --saida atual.json --comparar base.json
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import platform
+import resource
+import tempfile
+
+# === CONFIGURAÇÃO ===
+CONSULTAS = 500
+CONCORRENCIA = 16
+ERROS_DIGITACAO = 0.3       # fração das consultas com um caractere trocado
+
+
+def percentis(latencias):
+    if not latencias:
+        return {}
+    ordenadas = sorted(latencias)
+
+    def p(q):
+        return round(ordenadas[min(int(q * len(ordenadas)), len(ordenadas) - 1)] * 1000, 3)
+    return {"p50_ms": p(0.50), "p95_ms": p(0.95), "p99_ms": p(0.99), "max_ms": round(ordenadas[-1] * 1000, 3)}
+
+
+def memoria_mb():
+    # ru_maxrss vem em KB no Linux e em bytes no macOS
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(pico / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def configurar_ambiente(banco, diretorio_trabalho):
+    """Precisa rodar antes de importar os módulos do servidor, que leem a configuração no import."""
+    os.environ["DB_BACKEND"] = f"sqlite:{banco}"
+    os.environ["EMBEDDINGS_PROVEDOR"] = "fake"
+    os.environ["RESOLVE_EAN_MODO"] = "indice"
+    os.environ.setdefault("BUSCA_NOTAS_MODO", "indice")
+    os.environ["SNAPSHOT_DIR"] = os.path.join(diretorio_trabalho, "snapshot")
+    os.environ["CACHE_EMBEDDINGS_ARQUIVO"] = ""
+    # A passada concorrente repete as chamadas da sequencial: com o cache de resultados ligado
+    # ela mediria só hits do cache, não as ferramentas
+    os.environ["CACHE_RESULTADOS"] = "0"
+
+
+def _com_erro(texto, rng):
+    if len(texto) < 4 or rng.random() >= ERROS_DIGITACAO:
+        return texto
+    i = rng.randrange(1, len(texto) - 1)
+    return texto[:i] + rng.choice("aeiosrnt") + texto[i + 1:]
+
+
+def montar_carga(banco, consultas, rng):
+    """Consultas de produto (com erros de digitação) e de nota, amostradas da própria base."""
+    import sqlite3
+    connection = sqlite3.connect(banco)
+    total = connection.execute("SELECT MAX(rowid) FROM item_nota_fiscal").fetchone()[0] or 0
+    linhas = []
+    for rowid in rng.sample(range(1, total + 1), min(consultas, total)):
+        row = connection.execute("""
+            SELECT nf.nome_cliente, nf.estado, inf.codigo_ean, inf.descricao_produto, inf.valor_unitario
+            FROM item_nota_fiscal inf JOIN nota_fiscal nf ON nf.numero_nf = inf.numero_nf
+            WHERE inf.rowid = ?
+        """, (rowid,)).fetchone()
+        if row and row[3]:
+            linhas.append(row)
+    connection.close()
+    return [
+        {
+            "description": _com_erro(descricao.split(" - ")[0], rng),
+            "customer": cliente,
+            "location": estado,
+            "price": round(preco * rng.uniform(0.97, 1.03), 2) if preco else None,
+            "ean": ean
+        }
+        for cliente, estado, ean, descricao, preco in linhas
+    ]
+
+
+def _falhou(resultado):
+    return isinstance(resultado, dict) and "erro" in resultado
+
+
+async def medir(nome, chamadas, concorrencia):
+    """Roda as chamadas em sequência (latência) e depois com concorrência (throughput)."""
+    latencias, falhas = [], 0
+    for chamada in chamadas:
+        t0 = time.perf_counter()
+        resultado = await chamada()
+        latencias.append(time.perf_counter() - t0)
+        if _falhou(resultado):
+            falhas += 1
+
+    semaforo = asyncio.Semaphore(concorrencia)
+
+    async def limitada(chamada):
+        async with semaforo:
+            return await chamada()
+
+    t0 = time.perf_counter()
+    resultados = await asyncio.gather(*(limitada(chamada) for chamada in chamadas))
+    duracao = time.perf_counter() - t0
+
+    resultado = {
+        "chamadas": len(chamadas),
+        "falhas": falhas,
+        # Timeouts de @limitado e erros do banco só aparecem sob concorrência
+        "falhas_concorrentes": sum(1 for resultado in resultados if _falhou(resultado)),
+        **percentis(latencias),
+        "throughput_seq_rps": round(len(latencias) / sum(latencias), 1) if sum(latencias) else None,
+        "throughput_concorrente_rps": round(len(chamadas) / duracao, 1) if duracao else None
+    }
+    print(f"⏱️  {nome}: {resultado}")
+    return resultado
+
+
+async def executar(args, diretorio_trabalho):
+    rng = random.Random(args.semente)
+    relatorio = {
+        "parametros": vars(args),
+        "ambiente": {"python": platform.python_version(), "plataforma": platform.platform(), "cpus": os.cpu_count()},
+        "etapas": {}
+    }
+
+    if not args.sem_gerar:
+        import gerar_dados_sinteticos
+        t0 = time.perf_counter()
+        relatorio["base"] = gerar_dados_sinteticos.gerar(
+            args.banco, args.produtos, args.notas, args.itens_por_nota, args.semente
+        )
+        relatorio["etapas"]["geracao_s"] = round(time.perf_counter() - t0, 2)
+
+    import process_vector_products
+    t0 = time.perf_counter()
+    process_vector_products.main(completo=False)
+    relatorio["etapas"]["ingestao_embeddings_s"] = round(time.perf_counter() - t0, 2)
+
+    # Carga a frio (sem snapshot) e a quente (snapshot mmap já gravado)
+    import product_search
+    for etapa in ("carga_vetores_fria_s", "carga_vetores_quente_s"):
+        t0 = time.perf_counter()
+        product_search.BuscaProdutoSimilar()
+        relatorio["etapas"][etapa] = round(time.perf_counter() - t0, 2)
+
+    t0 = time.perf_counter()
+    import server_nf_items
+    server_nf_items.buscador._garantir_carregado()
+    server_nf_items.indice_lexico._garantir_carregado()
+    if server_nf_items.indice_notas is not None:
+        # Espera a carga em background; uma falha na carga é levantada aqui
+        server_nf_items.indice_notas._garantir_carregado()
+    relatorio["etapas"]["carga_servidor_s"] = round(time.perf_counter() - t0, 2)
+    relatorio["memoria_apos_carga_mb"] = memoria_mb()
+
+    carga = montar_carga(args.banco, args.consultas, rng)
+    s = server_nf_items
+    relatorio["ferramentas"] = {
+        "resolve_ean": await medir(
+            "resolve_ean", [lambda c=c: s.resolve_ean(c["description"]) for c in carga], args.concorrencia
+        ),
+        "buscar_produto_vetorizado": await medir(
+            "buscar_produto_vetorizado",
+            [lambda c=c: s.buscar_produto_vetorizado(c["description"]) for c in carga], args.concorrencia
+        ),
+        "buscar_notas_por_criterios": await medir(
+            "buscar_notas_por_criterios",
+            [lambda c=c: s.buscar_notas_por_criterios(c["customer"], c["location"], c["price"], c["ean"])
+             for c in carga],
+            args.concorrencia
+        ),
+        "resolver_devolucao_lote": await medir(
+            "resolver_devolucao_lote",
+            [lambda i=i: s.resolver_devolucao_lote(carga[i:i + 20]) for i in range(0, len(carga), 20)],
+            args.concorrencia
+        )
+    }
+    relatorio["memoria_pico_mb"] = memoria_mb()
+    return relatorio
+
+
+def comparar(atual, base):
+    """Imprime a variação percentual das métricas numéricas em relação ao relatório base."""
+    def variacao(a, b):
+        return f"{(a - b) / b * 100:+.1f}%" if b else "n/a"
+
+    print("\n📈 Comparação com a base:")
+    for etapa, valor in atual.get("etapas", {}).items():
+        anterior = base.get("etapas", {}).get(etapa)
+        if anterior is not None:
+            print(f"  {etapa}: {anterior} -> {valor} ({variacao(valor, anterior)})")
+    for ferramenta, metricas in atual.get("ferramentas", {}).items():
+        anteriores = base.get("ferramentas", {}).get(ferramenta, {})
+        for chave in ("p50_ms", "p95_ms", "p99_ms", "throughput_concorrente_rps"):
+            if metricas.get(chave) is not None and anteriores.get(chave) is not None:
+                print(f"  {ferramenta}.{chave}: {anteriores[chave]} -> {metricas[chave]} "
+                      f"({variacao(metricas[chave], anteriores[chave])})")
+    for chave in ("memoria_apos_carga_mb", "memoria_pico_mb"):
+        if chave in atual and chave in base:
+            print(f"  {chave}: {base[chave]} -> {atual[chave]} ({variacao(atual[chave], base[chave])})")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark offline do pipeline de devolução.")
+    parser.add_argument("--banco", help="Arquivo SQLite (padrão: diretório temporário)")
+    parser.add_argument("--sem-gerar", action="store_true", help="Usa a base existente em --banco sem gerar dados")
+    parser.add_argument("--produtos", type=int, default=100000)
+    parser.add_argument("--notas", type=int, default=250000)
+    parser.add_argument("--itens-por-nota", type=int, default=4)
+    parser.add_argument("--consultas", type=int, default=CONSULTAS)
+    parser.add_argument("--concorrencia", type=int, default=CONCORRENCIA)
+    parser.add_argument("--semente", type=int, default=42)
+    parser.add_argument("--saida", help="Grava o relatório JSON neste arquivo")
+    parser.add_argument("--comparar", help="Relatório JSON anterior para comparação")
+    args = parser.parse_args()
+
+    diretorio_trabalho = tempfile.mkdtemp(prefix="benchmark_")
+    args.banco = args.banco or os.path.join(diretorio_trabalho, "benchmark.db")
+    configurar_ambiente(args.banco, diretorio_trabalho)
+
+    relatorio = asyncio.run(executar(args, diretorio_trabalho))
+    if args.saida:
+        with open(args.saida, "w") as f:
+            json.dump(relatorio, f, indent=2, ensure_ascii=False)
+        print(f"💾 Relatório salvo em {args.saida}")
+    if args.comparar:
+        with open(args.comparar) as f:
+            comparar(relatorio, json.load(f))
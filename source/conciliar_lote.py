@@ -0,0 +1,308 @@
+# -*- coding: utf-8 -*-
+"""
+Conciliação em lote de notas de devolução: lê um arquivo JSONL ou CSV em streaming
+(campos customer, description, price, location e um identificador), resolve cada nota
+pelo fast path (resolve_ean -> buscar_notas_por_criterios) com concorrência limitada e
+grava um JSONL de resultados à medida que as notas terminam. As notas concluídas vão para
+um arquivo de checkpoint (número do registro e ID, na ordem da entrada), então uma
+execução interrompida continua de onde parou. Notas com falha (erro ou timeout) ficam fora
+do checkpoint e são tentadas de novo; no arquivo de resultados vale o último registro de
+cada ID:
+
+    python conciliar_lote.py devolucoes.jsonl resultados.jsonl --concorrencia 32
+"""
+import os
+import csv
+import json
+import time
+import heapq
+import random
+import asyncio
+import argparse
+import datetime
+from fast_path import validar_entrada, resolver_nota
+from servidor_http import configuracao_cliente
+
+# === CONFIGURAÇÃO ===
+CONCORRENCIA = int(os.environ.get("LOTE_CONCORRENCIA", "16"))
+TIMEOUT_NOTA = float(os.environ.get("LOTE_TIMEOUT_NOTA", "90"))   # segundos por nota (as duas ferramentas)
+INTERVALO_PROGRESSO = 10          # segundos entre relatórios de progresso
+AMOSTRA_LATENCIAS = 10000         # reservatório para p50/p95 sem guardar todas as latências
+FIM = object()
+
+
+class Estatisticas:
+    def __init__(self):
+        self.inicio = time.perf_counter()
+        self.processadas = 0
+        self.resolvidas = 0
+        self.falhas = 0
+        self.ja_processadas = 0
+        self.invalidas = 0
+        self.motivos = {}
+        self._amostra = []
+        self._rng = random.Random(0)
+
+    def registrar(self, status, motivo, latencia):
+        self.processadas += 1
+        if status == "resolvida":
+            self.resolvidas += 1
+        elif status == "falha":
+            self.falhas += 1
+        if motivo:
+            self.motivos[motivo] = self.motivos.get(motivo, 0) + 1
+        # Amostragem por reservatório: memória constante para qualquer tamanho de arquivo
+        if len(self._amostra) < AMOSTRA_LATENCIAS:
+            self._amostra.append(latencia)
+        else:
+            i = self._rng.randrange(self.processadas)
+            if i < AMOSTRA_LATENCIAS:
+                self._amostra[i] = latencia
+
+    def resumo(self):
+        decorrido = time.perf_counter() - self.inicio
+        ordenadas = sorted(self._amostra)
+
+        def p(q):
+            return round(ordenadas[min(int(q * len(ordenadas)), len(ordenadas) - 1)] * 1000, 1) if ordenadas else None
+        return {
+            "processadas": self.processadas,
+            "resolvidas": self.resolvidas,
+            "falhas": self.falhas,
+            "invalidas": self.invalidas,
+            "ja_processadas": self.ja_processadas,
+            "motivos": self.motivos,
+            "notas_por_s": round(self.processadas / decorrido, 1) if decorrido else None,
+            "p50_ms": p(0.50),
+            "p95_ms": p(0.95),
+            "decorrido_s": round(decorrido, 1)
+        }
+
+
+def ler_notas(caminho, campo_id):
+    """Gera (número do registro, id, registro) linha a linha; sem campo de ID, o id é o número."""
+    with open(caminho, newline="", encoding="utf-8") as f:
+        if caminho.lower().endswith(".csv"):
+            linhas = csv.DictReader(f)
+        else:
+            linhas = (json.loads(linha) for linha in f if linha.strip())
+        for numero, registro in enumerate(linhas, start=1):
+            yield numero, str(registro.get(campo_id) or numero), registro
+
+
+class Checkpoint:
+    """
+    Notas concluídas, uma linha "número<TAB>id" por registro, na ordem da entrada: conclusões
+    fora de ordem esperam em um buffer limitado até as anteriores terminarem. Com o arquivo
+    ordenado, a execução seguinte o percorre junto com a entrada, sem carregar os IDs em
+    memória. Cada execução regrava o checkpoint (anteriores + novas) em <caminho>.gravando e
+    só o troca no fim; se for interrompida, a próxima une os dois arquivos antes de começar.
+    """
+
+    def __init__(self, caminho, limite):
+        self.caminho = caminho
+        self.limite = limite
+        self._parcial = f"{caminho}.gravando"
+        self._consolidar()
+        self._anteriores = self._ler(caminho)
+        self._anterior = next(self._anteriores, None)
+        self._arquivo = open(self._parcial, "w", encoding="utf-8")
+        self._pendentes = {}             # número -> linha (None = não concluída), à espera das anteriores
+        self._proximo = 1
+        self._liberado = asyncio.Event()
+
+    @staticmethod
+    def _ler(caminho):
+        if not os.path.exists(caminho):
+            return
+        with open(caminho, encoding="utf-8") as f:
+            for linha in f:
+                numero, _, id_nota = linha.rstrip("\n").partition("\t")
+                if id_nota:
+                    yield int(numero), id_nota
+
+    def _consolidar(self):
+        if not os.path.exists(self._parcial):
+            return
+        # Execução anterior interrompida: os dois arquivos estão ordenados, então a união é em streaming
+        temporario = f"{self.caminho}.tmp"
+        with open(temporario, "w", encoding="utf-8") as f:
+            ultima = None
+            for entrada in heapq.merge(self._ler(self.caminho), self._ler(self._parcial)):
+                if entrada != ultima:
+                    f.write(f"{entrada[0]}\t{entrada[1]}\n")
+                ultima = entrada
+        os.replace(temporario, self.caminho)
+        os.remove(self._parcial)
+
+    def ja_concluida(self, numero, id_nota):
+        """Consultas em ordem crescente de número, acompanhando a leitura da entrada."""
+        while self._anterior is not None and self._anterior[0] < numero:
+            self._anterior = next(self._anteriores, None)
+        return self._anterior == (numero, id_nota)
+
+    async def reservar(self):
+        """Segura o produtor enquanto o buffer de conclusões fora de ordem estiver cheio."""
+        while len(self._pendentes) >= self.limite:
+            self._liberado.clear()
+            await self._liberado.wait()
+
+    def registrar(self, numero, id_nota, concluida):
+        self._pendentes[numero] = f"{numero}\t{id_nota}\n" if concluida else None
+        gravou = False
+        while self._proximo in self._pendentes:
+            linha = self._pendentes.pop(self._proximo)
+            if linha is not None:
+                self._arquivo.write(linha)
+                gravou = True
+            self._proximo += 1
+        if gravou:
+            self._arquivo.flush()
+        self._liberado.set()
+
+    def fechar(self, completo):
+        self._arquivo.close()
+        self._anteriores.close()
+        if completo:
+            os.replace(self._parcial, self.caminho)
+
+
+def _json_padrao(valor):
+    if isinstance(valor, (datetime.date, datetime.datetime)):
+        return valor.isoformat()
+    return str(valor)
+
+
+class FerramentaLocal:
+    """Chama a ferramenta do server_nf_items no próprio processo, com a interface ainvoke das ferramentas MCP."""
+
+    def __init__(self, fn):
+        self.fn = fn
+
+    async def ainvoke(self, argumentos):
+        return json.dumps(await self.fn(**argumentos), default=_json_padrao, ensure_ascii=False)
+
+
+async def conciliar(ferramentas, entrada, saida, checkpoint, campo_id, concorrencia):
+    estatisticas = Estatisticas()
+    fila = asyncio.Queue(maxsize=concorrencia * 2)   # limita quantas notas ficam em memória
+    concluidas = Checkpoint(checkpoint, limite=concorrencia * 4)
+    completo = False
+
+    with open(saida, "a", encoding="utf-8") as arquivo_saida:
+
+        def gravar(numero, id_nota, resultado, concluida):
+            arquivo_saida.write(json.dumps(resultado, default=_json_padrao, ensure_ascii=False) + "\n")
+            arquivo_saida.flush()
+            # Falhas (erros/timeouts) não entram no checkpoint: são tentadas de novo na próxima execução
+            concluidas.registrar(numero, id_nota, concluida)
+
+        async def trabalhador():
+            while True:
+                item = await fila.get()
+                if item is FIM:
+                    return
+                numero, id_nota, nota_entrada = item
+                inicio = time.perf_counter()
+                try:
+                    # Uma nota travada não pode prender o trabalhador indefinidamente
+                    nota, detalhes = await asyncio.wait_for(resolver_nota(nota_entrada, ferramentas), TIMEOUT_NOTA)
+                    if "erro" in detalhes:
+                        # {"erro": ...} de uma ferramenta (timeout, banco): falha, fora do checkpoint
+                        status, motivo, concluida = "falha", f"erro: {detalhes['erro']}", False
+                    else:
+                        status = "resolvida" if nota else "nao_resolvida"
+                        motivo = detalhes.get("motivo")
+                        concluida = True
+                except asyncio.TimeoutError:
+                    nota, detalhes, status, motivo, concluida = None, {}, "falha", f"erro: tempo limite de {TIMEOUT_NOTA}s", False
+                except Exception as e:
+                    nota, detalhes, status, motivo, concluida = None, {}, "falha", f"erro: {e}", False
+                latencia = time.perf_counter() - inicio
+                estatisticas.registrar(status, motivo if status != "falha" else "erro", latencia)
+                gravar(numero, id_nota, {
+                    "id": id_nota,
+                    "status": status,
+                    "motivo": motivo,
+                    "ean": detalhes.get("ean"),
+                    "nota": nota,
+                    "latencia_ms": round(latencia * 1000, 1)
+                }, concluida)
+
+        async def reportar():
+            while True:
+                await asyncio.sleep(INTERVALO_PROGRESSO)
+                print(f"⏳ {estatisticas.resumo()}")
+
+        # Um trabalhador que morre (ex.: erro de IO ao gravar) cancela o produtor, que senão
+        # ficaria parado para sempre na fila cheia
+        produtor = asyncio.current_task()
+
+        def _verificar(tarefa):
+            if not tarefa.cancelled() and tarefa.exception() is not None:
+                produtor.cancel()
+
+        trabalhadores = [asyncio.create_task(trabalhador()) for _ in range(concorrencia)]
+        for tarefa in trabalhadores:
+            tarefa.add_done_callback(_verificar)
+        progresso = asyncio.create_task(reportar())
+        try:
+            for numero, id_nota, registro in ler_notas(entrada, campo_id):
+                await concluidas.reservar()
+                if concluidas.ja_concluida(numero, id_nota):
+                    estatisticas.ja_processadas += 1
+                    concluidas.registrar(numero, id_nota, True)
+                    continue
+                nota_entrada = validar_entrada(dict(registro))
+                if nota_entrada is None:
+                    estatisticas.invalidas += 1
+                    gravar(numero, id_nota, {"id": id_nota, "status": "invalida", "motivo": "campos_obrigatorios"}, True)
+                    continue
+                await fila.put((numero, id_nota, nota_entrada))
+            for _ in trabalhadores:
+                await fila.put(FIM)
+            await asyncio.gather(*trabalhadores)
+            completo = True
+        except asyncio.CancelledError:
+            erros = [t.exception() for t in trabalhadores if t.done() and not t.cancelled() and t.exception()]
+            if erros:
+                raise erros[0]
+            raise
+        finally:
+            progresso.cancel()
+            for tarefa in trabalhadores:
+                tarefa.cancel()
+            concluidas.fechar(completo)
+
+    return estatisticas.resumo()
+
+
+async def main(args):
+    if args.em_processo:
+        import server_nf_items
+        ferramentas = {
+            "resolve_ean": FerramentaLocal(server_nf_items.resolve_ean),
+            "buscar_notas_por_criterios": FerramentaLocal(server_nf_items.buscar_notas_por_criterios)
+        }
+        return await conciliar(ferramentas, args.entrada, args.saida, args.checkpoint, args.campo_id, args.concorrencia)
+
+    from langchain_mcp_adapters.client import MultiServerMCPClient
+    async with MultiServerMCPClient(configuracao_cliente()) as client:
+        ferramentas = {t.name: t for t in client.get_tools()}
+        return await conciliar(ferramentas, args.entrada, args.saida, args.checkpoint, args.campo_id, args.concorrencia)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Concilia um arquivo de notas de devolução em lote.")
+    parser.add_argument("entrada", help="Arquivo .jsonl ou .csv com customer, description, price, location")
+    parser.add_argument("saida", help="Arquivo .jsonl de resultados (aberto em modo append)")
+    parser.add_argument("--checkpoint", help="IDs já concluídos (padrão: <saida>.checkpoint)")
+    parser.add_argument("--campo-id", default="id", help="Campo com o identificador da nota")
+    parser.add_argument("--concorrencia", type=int, default=CONCORRENCIA)
+    parser.add_argument("--em-processo", action="store_true",
+                        help="Chama as ferramentas no próprio processo, sem subir o servidor MCP")
+    args = parser.parse_args()
+    args.checkpoint = args.checkpoint or f"{args.saida}.checkpoint"
+
+    resumo = asyncio.run(main(args))
+    print(f"✅ Concluído: {json.dumps(resumo, ensure_ascii=False)}")
@@ -0,0 +1,286 @@
+# -*- coding: utf-8 -*-
+"""
+Memória da conversa do agente (main.py) com orçamento de tokens.
+
+- Os turnos recentes vão inteiros para o LLM; quando o histórico passa do orçamento, os
+  turnos mais antigos são dobrados em um resumo contínuo (pelo LLM, ou extrativo se ele falhar).
+- Saídas grandes de ferramentas (listas de notas) são guardadas fora do prompt e trocadas por
+  uma referência compacta ("ref-3"), que o agente expande com a ferramenta consultar_memoria.
+- EANs e notas já resolvidos ficam registrados: aparecem no contexto da sessão e chamadas
+  repetidas das ferramentas de consulta são respondidas pela memória, sem ir ao servidor.
+"""
+import os
+import json
+import math
+from collections import OrderedDict
+from langchain_core.messages import HumanMessage, AIMessage, ToolMessage, SystemMessage
+from fast_path import parse_resultado, linhas_notas
+
+# === CONFIGURAÇÃO ===
+ORCAMENTO_TOKENS = int(os.environ.get("MEMORIA_ORCAMENTO_TOKENS", "4000"))   # histórico + contexto da sessão
+TURNOS_MINIMOS = int(os.environ.get("MEMORIA_TURNOS_MINIMOS", "1"))          # turnos recentes nunca resumidos
+RESUMO_MAX_TOKENS = int(os.environ.get("MEMORIA_RESUMO_MAX_TOKENS", "400"))
+SAIDA_MAX_TOKENS = int(os.environ.get("MEMORIA_SAIDA_MAX_TOKENS", "300"))    # acima disso a saída vira referência
+FATOS_MAX = int(os.environ.get("MEMORIA_FATOS_MAX", "100"))                  # EANs/notas/chamadas lembrados (LRU)
+FRACAO_FATOS = 0.25                       # parte do orçamento que a lista de EANs/notas pode ocupar no contexto
+REFERENCIAS_MAX = int(os.environ.get("MEMORIA_REFERENCIAS_MAX", "50"))
+CARACTERES_POR_TOKEN = 4                  # estimativa sem tokenizer do modelo
+NOTAS_NA_REFERENCIA = 10                  # números de nota listados na referência compacta
+
+# Consultas sem efeito colateral: a mesma chamada na mesma sessão é respondida pela memória
+FERRAMENTAS_REUTILIZAVEIS = {"resolve_ean", "buscar_produto_hibrido", "buscar_produto_vetorizado", "buscar_notas_por_criterios"}
+
+PROMPT_RESUMO = (
+    "Resuma a conversa abaixo entre um usuário e um agente de conciliação de notas fiscais de devolução, "
+    "em português e em no máximo {palavras} palavras. Mantenha clientes, estados, preços, EANs e números "
+    "de nota citados e o que ficou resolvido ou pendente; omita detalhes de ferramentas."
+)
+
+
+def estimar_tokens(texto):
+    return math.ceil(len(texto) / CARACTERES_POR_TOKEN)
+
+
+def _texto(conteudo):
+    """Conteúdo de mensagem/ferramenta como texto (ferramentas MCP podem devolver lista de textos)."""
+    if isinstance(conteudo, str):
+        return conteudo
+    if isinstance(conteudo, list):
+        return "\n".join(c if isinstance(c, str) else str(c.get("text", c)) if isinstance(c, dict) else str(c) for c in conteudo)
+    return str(conteudo)
+
+
+def _tokens_mensagem(mensagem):
+    tokens = estimar_tokens(_texto(mensagem.content))
+    for chamada in getattr(mensagem, "tool_calls", None) or []:
+        tokens += estimar_tokens(chamada["name"] + json.dumps(chamada["args"], ensure_ascii=False, default=str))
+    return tokens + 4                     # papel e separadores
+
+
+def _normalizar(valor):
+    if isinstance(valor, str):
+        return " ".join(valor.split()).lower()
+    return valor
+
+
+def _chave(nome, argumentos):
+    argumentos = {campo: _normalizar(valor) for campo, valor in argumentos.items() if valor is not None}
+    return nome, json.dumps(argumentos, sort_keys=True, ensure_ascii=False, default=str)
+
+
+def _guardar(dicionario, chave, valor, maximo):
+    dicionario[chave] = valor
+    dicionario.move_to_end(chave)
+    while len(dicionario) > maximo:
+        dicionario.popitem(last=False)
+
+
+class MemoriaConversa:
+    """
+    Histórico limitado por ORCAMENTO_TOKENS. `resumidor` é uma função async texto -> resumo
+    (normalmente o próprio LLM do agente); sem ela, ou se falhar, o resumo é extrativo.
+    """
+
+    def __init__(self, resumidor=None, orcamento=ORCAMENTO_TOKENS, turnos_minimos=TURNOS_MINIMOS):
+        self.resumidor = resumidor
+        self.orcamento = orcamento
+        self.turnos_minimos = turnos_minimos
+        self.turnos = []                  # cada turno: lista de mensagens (pergunta, chamadas, resposta)
+        self.resumo = ""
+        self.referencias = OrderedDict()  # "ref-N" -> saída completa da ferramenta
+        self.chamadas = OrderedDict()     # (ferramenta, argumentos) -> saída
+        self.eans = OrderedDict()         # descrição normalizada -> {"ean", "descricao", "similaridade"}
+        self.notas = OrderedDict()        # (cliente, estado, preco, ean) -> {"linhas", "notas"}
+        self._proxima_referencia = 1
+        self.estatisticas = {"turnos": 0, "resumos": 0, "turnos_resumidos": 0, "saidas_compactadas": 0, "reutilizacoes": 0}
+
+    # === HISTÓRICO ENVIADO AO LLM ===
+
+    def contexto(self):
+        """Mensagem de sistema com o resumo dos turnos antigos e os EANs/notas já resolvidos."""
+        partes = []
+        if self.resumo:
+            partes.append(f"Resumo da conversa até aqui:\n{self.resumo}")
+        # Fatos mais recentes primeiro, até a fração do orçamento reservada para eles
+        disponivel = int(self.orcamento * FRACAO_FATOS)
+        eans, notas = [], []
+        for descricao, fato in reversed(self.eans.items()):
+            linha = f"- \"{descricao}\" → EAN {fato['ean']} ({fato['descricao']})"
+            disponivel -= estimar_tokens(linha)
+            if disponivel < 0:
+                break
+            eans.append(linha)
+        for (cliente, estado, preco, ean), fato in reversed(self.notas.items()):
+            numeros = ", ".join(str(n) for n in fato["notas"]) or "nenhuma"
+            linha = f"- cliente {cliente}, {estado}, preço {preco}, EAN {ean} → notas {numeros} ({fato['linhas']} linha(s))"
+            disponivel -= estimar_tokens(linha)
+            if disponivel < 0:
+                break
+            notas.append(linha)
+        if eans:
+            partes.append("EANs já resolvidos nesta sessão:\n" + "\n".join(eans))
+        if notas:
+            partes.append("Buscas de notas já feitas nesta sessão:\n" + "\n".join(notas))
+        if not partes:
+            return None
+        partes.append("Reaproveite esses dados em vez de repetir as consultas; referências ref-N "
+                      "podem ser expandidas com a ferramenta consultar_memoria.")
+        return SystemMessage(content="\n\n".join(partes))
+
+    def mensagens(self, pergunta):
+        """Entrada do agente para a nova pergunta: contexto da sessão, turnos recentes e a pergunta."""
+        contexto = self.contexto()
+        historico = [mensagem for turno in self.turnos for mensagem in turno]
+        return ([contexto] if contexto else []) + historico + [HumanMessage(content=pergunta)]
+
+    def tokens(self):
+        contexto = self.contexto()
+        total = _tokens_mensagem(contexto) if contexto else 0
+        return total + sum(_tokens_mensagem(m) for turno in self.turnos for m in turno)
+
+    # === REGISTRO DOS TURNOS ===
+
+    async def registrar_turno(self, entrada, saida):
+        """
+        Guarda as mensagens novas do agente (`saida` = result["messages"] de ainvoke com `entrada`),
+        compactando saídas grandes de ferramentas, e resume os turnos antigos se passar do orçamento.
+        """
+        pergunta = entrada[-1]
+        novas = saida[len(entrada):]
+        await self._adicionar([pergunta] + [self._compactar(m) for m in novas])
+
+    async def registrar_resposta(self, pergunta, resposta):
+        """Turno resolvido fora do agente (fast path): só pergunta e resposta."""
+        await self._adicionar([HumanMessage(content=pergunta), AIMessage(content=resposta)])
+
+    async def _adicionar(self, turno):
+        self.turnos.append(turno)
+        self.estatisticas["turnos"] += 1
+        excedente = self.tokens() - self.orcamento
+        if excedente <= 0 or len(self.turnos) <= self.turnos_minimos:
+            return
+        # Dobra de uma vez os turnos mais antigos necessários para voltar ao orçamento (uma chamada de resumo)
+        antigos = []
+        while excedente > 0 and len(self.turnos) > self.turnos_minimos:
+            turno = self.turnos.pop(0)
+            antigos.append(turno)
+            excedente -= sum(_tokens_mensagem(m) for m in turno)
+        await self._resumir(antigos)
+
+    def _compactar(self, mensagem):
+        if not isinstance(mensagem, ToolMessage):
+            return mensagem
+        texto = _texto(mensagem.content)
+        if estimar_tokens(texto) <= SAIDA_MAX_TOKENS:
+            return mensagem
+        referencia = f"ref-{self._proxima_referencia}"
+        self._proxima_referencia += 1
+        _guardar(self.referencias, referencia, texto, REFERENCIAS_MAX)
+        self.estatisticas["saidas_compactadas"] += 1
+        return mensagem.model_copy(update={"content": self._descrever(referencia, mensagem.name, texto)})
+
+    @staticmethod
+    def _descrever(referencia, ferramenta, texto):
+        """Referência compacta: para listas de notas, quantidade, total e números das notas."""
+        resultado = parse_resultado(texto)
+        if ferramenta == "buscar_notas_por_criterios":
+            linhas, mais_resultados = linhas_notas(resultado)
+            if isinstance(linhas, list) and all(isinstance(linha, dict) and "numero_nota" in linha for linha in linhas):
+                numeros = list(dict.fromkeys(linha["numero_nota"] for linha in linhas))
+                descricao = f"[{referencia}] {len(linhas)} linha(s)"
+                if isinstance(resultado, dict) and resultado.get("total") is not None:
+                    descricao += f" de {resultado['total']}"
+                descricao += f", {len(numeros)} nota(s): {', '.join(str(n) for n in numeros[:NOTAS_NA_REFERENCIA])}"
+                if len(numeros) > NOTAS_NA_REFERENCIA:
+                    descricao += " ..."
+                if linhas:
+                    descricao += f". Primeira linha: {json.dumps(linhas[0], ensure_ascii=False, default=str)}"
+                if mais_resultados:
+                    descricao += ". Há mais resultados."
+                return descricao + f" Conteúdo completo: consultar_memoria(\"{referencia}\")."
+        inicio = texto[:SAIDA_MAX_TOKENS * CARACTERES_POR_TOKEN // 2]
+        return f"[{referencia}] {inicio}... (saída resumida; conteúdo completo: consultar_memoria(\"{referencia}\"))"
+
+    async def _resumir(self, turnos):
+        transcricao = "\n".join(self._transcrever(turno) for turno in turnos)
+        anterior = f"Resumo anterior:\n{self.resumo}\n\n" if self.resumo else ""
+        resumo = None
+        if self.resumidor is not None:
+            try:
+                resumo = (await self.resumidor(anterior + transcricao)).strip()
+            except Exception as e:
+                print(f"[ERRO] Falha ao resumir a conversa: {e}")
+        if not resumo:
+            resumo = (self.resumo + "\n" + transcricao).strip()
+        # O resumo também tem teto: do extrativo (ou de um LLM prolixo) fica o trecho mais recente
+        limite = RESUMO_MAX_TOKENS * CARACTERES_POR_TOKEN
+        self.resumo = resumo if len(resumo) <= limite else "..." + resumo[-limite:]
+        self.estatisticas["resumos"] += 1
+        self.estatisticas["turnos_resumidos"] += len(turnos)
+
+    @staticmethod
+    def _transcrever(turno):
+        """Pergunta e resposta final do turno; as chamadas de ferramentas ficam de fora (os fatos já estão guardados)."""
+        linhas = []
+        for mensagem in turno:
+            if isinstance(mensagem, HumanMessage):
+                linhas.append(f"Usuário: {_texto(mensagem.content)}")
+            elif isinstance(mensagem, AIMessage) and not mensagem.tool_calls and mensagem.content:
+                linhas.append(f"Agente: {_texto(mensagem.content)}")
+        return "\n".join(linhas)
+
+    # === REAPROVEITAMENTO DE CONSULTAS ===
+
+    def consultar_ferramenta(self, nome, argumentos):
+        """Saída de uma chamada idêntica já feita nesta sessão, ou None."""
+        if nome not in FERRAMENTAS_REUTILIZAVEIS:
+            return None
+        chave = _chave(nome, argumentos)
+        if chave not in self.chamadas:
+            return None
+        self.chamadas.move_to_end(chave)
+        self.estatisticas["reutilizacoes"] += 1
+        return self.chamadas[chave]
+
+    def registrar_ferramenta(self, nome, argumentos, saida):
+        """Guarda a saída de uma consulta bem-sucedida e extrai os EANs/notas resolvidos."""
+        if nome not in FERRAMENTAS_REUTILIZAVEIS:
+            return
+        resultado = parse_resultado(saida)
+        if isinstance(resultado, dict) and "erro" in resultado:
+            return
+        _guardar(self.chamadas, _chave(nome, argumentos), saida, FATOS_MAX)
+
+        if nome == "resolve_ean" and isinstance(resultado, dict) and resultado.get("ean"):
+            self._registrar_ean(argumentos.get("description"), resultado["ean"], resultado.get("descricao"), resultado.get("similaridade"))
+        elif nome == "buscar_produto_hibrido" and isinstance(resultado, dict) and resultado.get("resultados"):
+            melhor = resultado["resultados"][0]
+            self._registrar_ean(argumentos.get("descricao"), melhor["ean"], melhor.get("descricao"), melhor.get("score"))
+        elif nome == "buscar_notas_por_criterios":
+            linhas, _ = linhas_notas(resultado)
+            if isinstance(linhas, list) and all(isinstance(linha, dict) and "numero_nota" in linha for linha in linhas):
+                chave = tuple(argumentos.get(campo) for campo in ("cliente", "estado", "preco", "ean"))
+                notas = list(dict.fromkeys(linha["numero_nota"] for linha in linhas))[:NOTAS_NA_REFERENCIA]
+                _guardar(self.notas, chave, {"linhas": len(linhas), "notas": notas}, FATOS_MAX)
+
+    def _registrar_ean(self, descricao, ean, descricao_produto, similaridade):
+        if descricao:
+            _guardar(self.eans, _normalizar(descricao), {"ean": ean, "descricao": descricao_produto, "similaridade": similaridade}, FATOS_MAX)
+
+    def expandir(self, referencia):
+        """Conteúdo completo de uma saída compactada."""
+        referencia = referencia.strip().strip("[]\"'")
+        if referencia not in self.referencias:
+            return {"erro": f"Referência {referencia} não encontrada (pode ter expirado)."}
+        return self.referencias[referencia]
+
+    def resumo_estatisticas(self):
+        return {
+            **self.estatisticas,
+            "turnos_no_historico": len(self.turnos),
+            "tokens_estimados": self.tokens(),
+            "orcamento_tokens": self.orcamento,
+            "eans": len(self.eans),
+            "buscas_notas": len(self.notas),
+            "referencias": len(self.referencias)
+        }
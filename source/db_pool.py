@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+import os
+import time
+import threading
+from contextlib import contextmanager, asynccontextmanager
+import oracledb
+import telemetria
+
+# === CONFIGURAÇÃO ORACLE COM WALLET ===
+WALLET_PATH = os.environ.get("WALLET_PATH", "/WALLET_PATH/Wallet_oradb23ai")  # Altere conforme seu ambiente
+DB_ALIAS = os.environ.get("DB_ALIAS", "oradb23ai_high")                        # Alias definido no tnsnames.ora
+USERNAME = os.environ.get("DB_USER", "USER")                                   # Usuário do banco
+PASSWORD = os.environ.get("DB_PASSWORD", "Password")                           # Senha do usuário
+
+# === CONFIGURAÇÃO DO POOL ===
+POOL_MIN = int(os.environ.get("DB_POOL_MIN", "1"))
+POOL_MAX = int(os.environ.get("DB_POOL_MAX", "8"))
+POOL_INCREMENT = int(os.environ.get("DB_POOL_INCREMENT", "1"))
+POOL_STMT_CACHE = int(os.environ.get("DB_POOL_STMT_CACHE", "50"))    # Statements em cache por sessão
+POOL_PING_INTERVAL = int(os.environ.get("DB_POOL_PING_INTERVAL", "60"))  # Segundos até revalidar sessão ociosa
+POOL_WAIT_TIMEOUT = int(os.environ.get("DB_POOL_WAIT_TIMEOUT", "5000"))  # ms aguardando sessão livre
+
+# "oracle" ou "sqlite:/caminho/banco.db" (stand-in local usado pelo benchmark offline)
+DB_BACKEND = os.environ.get("DB_BACKEND", "oracle")
+
+os.environ["TNS_ADMIN"] = WALLET_PATH
+
+_pool = None
+_pool_async = None
+_lock = threading.Lock()
+_metricas = {
+    "checkouts": 0,
+    "falhas_checkout": 0,
+    "espera_total_ms": 0.0,
+    "espera_max_ms": 0.0,
+}
+
+
+def obter_pool(
+        wallet_path=WALLET_PATH,
+        db_alias=DB_ALIAS,
+        username=USERNAME,
+        password=PASSWORD
+):
+    """Retorna o pool compartilhado, criando-o na primeira chamada."""
+    global _pool
+    if _pool is None:
+        with _lock:
+            if _pool is None and DB_BACKEND.startswith("sqlite:"):
+                import sqlite_backend
+                _pool = sqlite_backend.PoolSQLite(DB_BACKEND[len("sqlite:"):], POOL_MAX)
+            elif _pool is None:
+                os.environ["TNS_ADMIN"] = wallet_path
+                _pool = oracledb.create_pool(**_parametros_pool(wallet_path, db_alias, username, password))
+    return _pool
+
+
+def obter_pool_async(
+        wallet_path=WALLET_PATH,
+        db_alias=DB_ALIAS,
+        username=USERNAME,
+        password=PASSWORD
+):
+    """Pool assíncrono (oracledb thin) usado pelas ferramentas MCP async."""
+    global _pool_async
+    if _pool_async is None:
+        with _lock:
+            if _pool_async is None and DB_BACKEND.startswith("sqlite:"):
+                import sqlite_backend
+                _pool_async = sqlite_backend.PoolSQLiteAsync(DB_BACKEND[len("sqlite:"):], POOL_MAX)
+            elif _pool_async is None:
+                os.environ["TNS_ADMIN"] = wallet_path
+                _pool_async = oracledb.create_pool_async(**_parametros_pool(wallet_path, db_alias, username, password))
+    return _pool_async
+
+
+def _parametros_pool(wallet_path, db_alias, username, password):
+    return dict(
+        user=username,
+        password=password,
+        dsn=db_alias,
+        config_dir=wallet_path,
+        wallet_location=wallet_path,
+        wallet_password=password,
+        min=POOL_MIN,
+        max=POOL_MAX,
+        increment=POOL_INCREMENT,
+        stmtcachesize=POOL_STMT_CACHE,
+        ping_interval=POOL_PING_INTERVAL,
+        getmode=oracledb.POOLGETMODE_TIMEDWAIT,
+        wait_timeout=POOL_WAIT_TIMEOUT
+    )
+
+
+def _registrar_checkout(espera_ms):
+    with _lock:
+        _metricas["checkouts"] += 1
+        _metricas["espera_total_ms"] += espera_ms
+        _metricas["espera_max_ms"] = max(_metricas["espera_max_ms"], espera_ms)
+
+
+def _registrar_falha():
+    with _lock:
+        _metricas["falhas_checkout"] += 1
+
+
+@contextmanager
+def conexao():
+    """Empresta uma conexão do pool e a devolve ao final do bloco."""
+    pool = obter_pool()
+    inicio = time.perf_counter()
+    with telemetria.etapa("db.checkout"):
+        try:
+            connection = pool.acquire()
+        except Exception:
+            _registrar_falha()
+            raise
+    _registrar_checkout((time.perf_counter() - inicio) * 1000)
+    try:
+        yield connection
+    finally:
+        pool.release(connection)
+
+
+@asynccontextmanager
+async def conexao_async():
+    """Versão assíncrona de conexao(), sobre o pool async."""
+    pool = obter_pool_async()
+    inicio = time.perf_counter()
+    with telemetria.etapa("db.checkout"):
+        try:
+            connection = await pool.acquire()
+        except Exception:
+            _registrar_falha()
+            raise
+    _registrar_checkout((time.perf_counter() - inicio) * 1000)
+    try:
+        yield connection
+    finally:
+        await pool.release(connection)
+
+
+def verificar_saude():
+    """Faz um ping em uma sessão do pool; retorna True se o banco respondeu."""
+    try:
+        with conexao() as connection:
+            connection.ping()
+        return True
+    except Exception as e:
+        print(f"[ERRO] Health check do pool falhou: {e}")
+        return False
+
+
+def metricas_pool():
+    """Snapshot das métricas do pool (sessões abertas/ocupadas e tempo de espera)."""
+    with _lock:
+        metricas = dict(_metricas)
+    checkouts = metricas["checkouts"]
+    metricas["espera_media_ms"] = round(metricas["espera_total_ms"] / checkouts, 3) if checkouts else 0.0
+    metricas["espera_total_ms"] = round(metricas["espera_total_ms"], 3)
+    metricas["espera_max_ms"] = round(metricas["espera_max_ms"], 3)
+    for nome, pool in (("sync", _pool), ("async", _pool_async)):
+        if pool is not None:
+            metricas[nome] = {
+                "abertas": pool.opened,
+                "ocupadas": pool.busy,
+                "min": pool.min,
+                "max": pool.max,
+                "stmt_cache": pool.stmtcachesize
+            }
+    return metricas
+
+
+async def verificar_saude_async():
+    try:
+        async with conexao_async() as connection:
+            await connection.ping()
+        return True
+    except Exception as e:
+        print(f"[ERRO] Health check do pool falhou: {e}")
+        return False
+
+
+def fechar_pool():
+    global _pool
+    with _lock:
+        if _pool is not None:
+            _pool.close(force=True)
+            _pool = None
+
+
+async def fechar_pool_async():
+    global _pool_async
+    pool, _pool_async = _pool_async, None
+    if pool is not None:
+        await pool.close(force=True)
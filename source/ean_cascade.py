@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+import os
+import time
+import threading
+import telemetria
+
+# === CONFIGURAÇÃO DA CASCATA ===
+# Confiança mínima (0 a 1) para cada camada encerrar a cascata
+LIMIAR_LEXICO = float(os.environ.get("CASCATA_LIMIAR_LEXICO", "0.8"))
+LIMIAR_VETORIAL = float(os.environ.get("CASCATA_LIMIAR_VETORIAL", "0.6"))
+LIMIAR_FUZZY = float(os.environ.get("CASCATA_LIMIAR_FUZZY", "0.85"))
+PONTOS_POR_TERMO = 3                      # pontuação máxima de um termo no índice léxico / fn_busca_avancada
+
+
+class _Estatisticas:
+    def __init__(self, camadas):
+        self._lock = threading.Lock()
+        self.chamadas = 0
+        self.sem_resultado = 0
+        self.abaixo_do_limiar = 0
+        self.camadas = {
+            nome: {"tentativas": 0, "aceitas": 0, "falhas": 0, "latencia_total_ms": 0.0, "latencia_max_ms": 0.0}
+            for nome in camadas
+        }
+
+    def registrar_camada(self, nome, latencia_ms, aceita, falhou):
+        with self._lock:
+            camada = self.camadas[nome]
+            camada["tentativas"] += 1
+            camada["aceitas"] += aceita
+            camada["falhas"] += falhou
+            camada["latencia_total_ms"] += latencia_ms
+            camada["latencia_max_ms"] = max(camada["latencia_max_ms"], latencia_ms)
+
+    def registrar_final(self, encontrado, aceito):
+        with self._lock:
+            self.chamadas += 1
+            self.sem_resultado += not encontrado
+            self.abaixo_do_limiar += encontrado and not aceito
+
+    def resumo(self):
+        with self._lock:
+            camadas = {}
+            for nome, c in self.camadas.items():
+                camadas[nome] = {
+                    "tentativas": c["tentativas"],
+                    "aceitas": c["aceitas"],
+                    "falhas": c["falhas"],
+                    # Fração das chamadas da cascata resolvidas nesta camada (hit rate)
+                    "taxa_resolucao": round(c["aceitas"] / self.chamadas, 4) if self.chamadas else None,
+                    "taxa_aceite": round(c["aceitas"] / c["tentativas"], 4) if c["tentativas"] else None,
+                    "latencia_media_ms": round(c["latencia_total_ms"] / c["tentativas"], 3) if c["tentativas"] else None,
+                    "latencia_max_ms": round(c["latencia_max_ms"], 3)
+                }
+            return {
+                "chamadas": self.chamadas,
+                "sem_resultado": self.sem_resultado,
+                "abaixo_do_limiar": self.abaixo_do_limiar,
+                "camadas": camadas
+            }
+
+
+class ResolvedorCascata:
+    """
+    Resolve o EAN tentando as camadas da mais barata para a mais cara e parando na primeira
+    cuja confiança atinge o limiar. Cada camada é (nome, função async descricao -> candidato
+    ou None, limiar); o candidato é {"ean", "descricao", "similaridade", "confianca"}, com
+    confiança de 0 a 1. Se nenhuma camada atingir o limiar, retorna o candidato de maior
+    confiança marcado com "confiavel": False.
+    """
+
+    def __init__(self, camadas):
+        self.camadas = camadas
+        self.estatisticas = _Estatisticas([nome for nome, _, _ in camadas])
+
+    async def resolver(self, descricao):
+        melhor = None
+        for nome, buscar, limiar in self.camadas:
+            inicio = time.perf_counter()
+            with telemetria.etapa(f"cascata.{nome}") as span:
+                falhou = False
+                try:
+                    candidato = await buscar(descricao)
+                except Exception as e:
+                    print(f"[ERRO] Camada {nome} da cascata falhou: {e}")
+                    candidato, falhou = None, True
+                aceito = candidato is not None and candidato["confianca"] >= limiar
+                span.set_attribute("cascata.aceito", aceito)
+                if candidato is not None:
+                    span.set_attribute("cascata.confianca", candidato["confianca"])
+            self.estatisticas.registrar_camada(nome, (time.perf_counter() - inicio) * 1000, aceito, falhou)
+            if aceito:
+                self.estatisticas.registrar_final(True, True)
+                return {**candidato, "camada": nome, "confiavel": True}
+            if candidato is not None and (melhor is None or candidato["confianca"] > melhor[1]["confianca"]):
+                melhor = (nome, candidato)
+
+        self.estatisticas.registrar_final(melhor is not None, False)
+        if melhor is None:
+            return {"erro": "EAN não encontrado com os critérios fornecidos."}
+        return {**melhor[1], "camada": melhor[0], "confiavel": False}
+
+
+def criar_resolvedor(indice_lexico, buscador, ranking_lexico, executar, executor):
+    """
+    Cascata padrão: 1) EAN ou título exato (dicionários do índice léxico), 2) índice de
+    tokens (índice léxico, ou fn_busca_avancada sem ele), 3) busca por embeddings e
+    4) fuzzy. `ranking_lexico` é a função async do resolve_ean e `executar` roda funções
+    de CPU no executor do servidor.
+    """
+    async def exato(descricao):
+        produto = await executar(indice_lexico.buscar_exato, descricao)
+        if produto is None:
+            return None
+        return {"ean": produto["codigo"], "descricao": produto["descricao"], "similaridade": None, "confianca": 1.0}
+
+    async def lexico(descricao):
+        ranking = await ranking_lexico(descricao)
+        if not ranking:
+            return None
+        termos = max(len(descricao.split()), 1)
+        confianca = min(ranking[0]["similaridade"] / (PONTOS_POR_TERMO * termos), 1.0)
+        # Empate com outro produto no topo: o índice de tokens sozinho não decide
+        if len(ranking) > 1 and ranking[1]["similaridade"] == ranking[0]["similaridade"] \
+                and ranking[1]["codigo"] != ranking[0]["codigo"]:
+            confianca /= 2
+        return {
+            "ean": ranking[0]["codigo"],
+            "descricao": ranking[0]["descricao"],
+            "similaridade": ranking[0]["similaridade"],
+            "confianca": round(confianca, 4)
+        }
+
+    async def vetorial(descricao):
+        resultado = await buscador.buscar_produtos_similares_async(descricao, executor, fallback_fuzzy=False)
+        if not resultado["semanticos"]:
+            return None
+        melhor = resultado["semanticos"][0]
+        return {
+            "ean": melhor["codigo"],
+            "descricao": melhor["descricao"],
+            "similaridade": melhor["similaridade"],
+            "confianca": round(melhor["similaridade"] / 100, 4)
+        }
+
+    async def fuzzy(descricao):
+        melhores = await executar(buscador.buscar_fuzzy, descricao, 1)
+        if not melhores:
+            return None
+        return {
+            "ean": melhores[0]["codigo"],
+            "descricao": melhores[0]["descricao"],
+            "similaridade": melhores[0]["score_fuzzy"],
+            "confianca": round(melhores[0]["score_fuzzy"] / 100, 4)
+        }
+
+    camadas = []
+    if indice_lexico is not None:
+        camadas.append(("exato", exato, 1.0))
+    camadas += [
+        ("lexico", lexico, LIMIAR_LEXICO),
+        ("vetorial", vetorial, LIMIAR_VETORIAL),
+        ("fuzzy", fuzzy, LIMIAR_FUZZY),
+    ]
+    return ResolvedorCascata(camadas)
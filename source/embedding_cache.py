@@ -0,0 +1,236 @@
+# -*- coding: utf-8 -*-
+import os
+import re
+import time
+import pickle
+import atexit
+import threading
+import unicodedata
+from collections import OrderedDict
+import numpy as np
+
+# === CONFIGURAÇÃO DO CACHE ===
+CACHE_MAX_ITENS = int(os.environ.get("CACHE_EMBEDDINGS_MAX", "2048"))
+CACHE_TTL = float(os.environ.get("CACHE_EMBEDDINGS_TTL", "86400"))    # segundos; 0 = sem expiração
+CACHE_ARQUIVO = os.environ.get("CACHE_EMBEDDINGS_ARQUIVO", "")       # vazio = somente em memória
+CACHE_SALVAR_A_CADA = int(os.environ.get("CACHE_EMBEDDINGS_SALVAR_A_CADA", "50"))
+CACHE_VERSAO = 2                     # formato do arquivo: cabeçalho (modelo, dimensão) + itens
+
+
+def normalizar_texto(texto):
+    """Chave do cache: minúsculas, espaços colapsados e Unicode em NFC."""
+    texto = unicodedata.normalize("NFC", texto)
+    return re.sub(r"\s+", " ", texto).strip().lower()
+
+
+class CacheEmbeddings:
+    """
+    Cache LRU/TTL de embeddings de consulta, indexado pelo texto normalizado.
+    Opcionalmente persiste em arquivo para sobreviver a reinícios do servidor. O arquivo
+    guarda o `modelo` (provedor e id do modelo) e a dimensão dos vetores: um arquivo de
+    outro modelo ou dimensão é descartado na carga, e um vetor de dimensão diferente
+    limpa o cache.
+    """
+
+    def __init__(
+            self,
+            max_itens=CACHE_MAX_ITENS,
+            ttl=CACHE_TTL,
+            arquivo=CACHE_ARQUIVO,
+            salvar_a_cada=CACHE_SALVAR_A_CADA,
+            modelo=None
+    ):
+        self.max_itens = max_itens
+        self.ttl = ttl
+        self.arquivo = arquivo
+        self.salvar_a_cada = salvar_a_cada
+        self.modelo = modelo
+        self.dimensao = None
+        self._itens = OrderedDict()   # chave -> (timestamp, vetor)
+        self._lock = threading.Lock()
+        self._pendentes = 0
+        self._lock_arquivo = threading.Lock()
+        self._salvando = False
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirados = 0
+
+        if self.arquivo:
+            self._carregar()
+            atexit.register(self.salvar)
+
+    def _expirado(self, timestamp, agora):
+        return self.ttl > 0 and agora - timestamp > self.ttl
+
+    def _consultar(self, chave, agora):
+        """Procura a chave no cache (com o lock adquirido), contabilizando hit/miss."""
+        item = self._itens.get(chave)
+        if item is not None and self._expirado(item[0], agora):
+            del self._itens[chave]
+            self.expirados += 1
+            item = None
+        if item is None:
+            self.misses += 1
+            return None
+        self._itens.move_to_end(chave)
+        self.hits += 1
+        return item[1]
+
+    def obter(self, texto, calcular):
+        """Retorna o embedding de `texto`, chamando `calcular(texto)` apenas em caso de miss."""
+        chave = normalizar_texto(texto)
+        agora = time.time()
+        with self._lock:
+            vetor = self._consultar(chave, agora)
+        if vetor is not None:
+            return vetor
+
+        vetor = np.asarray(calcular(texto), dtype=np.float64)
+        self.inserir(chave, vetor, agora)
+        return vetor
+
+    async def obter_async(self, texto, calcular_async):
+        """Como obter(), mas aguardando `calcular_async(texto)` (ex.: aembed_query)."""
+        chave = normalizar_texto(texto)
+        agora = time.time()
+        with self._lock:
+            vetor = self._consultar(chave, agora)
+        if vetor is not None:
+            return vetor
+
+        vetor = np.asarray(await calcular_async(texto), dtype=np.float64)
+        self.inserir(chave, vetor, agora)
+        return vetor
+
+    def _separar_faltantes(self, textos, agora):
+        resultado = [None] * len(textos)
+        faltantes = {}
+        with self._lock:
+            for i, texto in enumerate(textos):
+                chave = normalizar_texto(texto)
+                vetor = self._consultar(chave, agora)
+                if vetor is not None:
+                    resultado[i] = vetor
+                else:
+                    faltantes.setdefault(chave, (texto, []))[1].append(i)
+        return resultado, faltantes
+
+    def _preencher_faltantes(self, resultado, faltantes, vetores, agora):
+        for (chave, (_, posicoes)), vetor in zip(faltantes.items(), vetores):
+            vetor = np.asarray(vetor, dtype=np.float64)
+            self.inserir(chave, vetor, agora)
+            for i in posicoes:
+                resultado[i] = vetor
+        return resultado
+
+    def obter_lote(self, textos, calcular_lote):
+        """
+        Embeddings de vários textos; os misses são calculados em uma única chamada
+        `calcular_lote(lista)` (ex.: embed_documents).
+        """
+        agora = time.time()
+        resultado, faltantes = self._separar_faltantes(textos, agora)
+        if faltantes:
+            vetores = calcular_lote([texto for texto, _ in faltantes.values()])
+            self._preencher_faltantes(resultado, faltantes, vetores, agora)
+        return resultado
+
+    async def obter_lote_async(self, textos, calcular_lote_async):
+        agora = time.time()
+        resultado, faltantes = self._separar_faltantes(textos, agora)
+        if faltantes:
+            vetores = await calcular_lote_async([texto for texto, _ in faltantes.values()])
+            self._preencher_faltantes(resultado, faltantes, vetores, agora)
+        return resultado
+
+    def inserir(self, chave, vetor, timestamp=None):
+        salvar = False
+        with self._lock:
+            if self.dimensao != len(vetor):
+                if self._itens:
+                    print(f"⚠️ Cache de embeddings descartado: dimensão {self.dimensao} -> {len(vetor)}")
+                    self._itens.clear()
+                self.dimensao = len(vetor)
+            self._itens[chave] = (timestamp or time.time(), vetor)
+            self._itens.move_to_end(chave)
+            while len(self._itens) > self.max_itens:
+                self._itens.popitem(last=False)
+                self.evictions += 1
+            self._pendentes += 1
+            if self.arquivo and self._pendentes >= self.salvar_a_cada and not self._salvando:
+                self._salvando = salvar = True
+        if salvar:
+            # Gravação em thread própria: inserir() roda no caminho das consultas (inclusive no event loop)
+            threading.Thread(target=self._salvar_em_background, daemon=True).start()
+
+    def _salvar_em_background(self):
+        try:
+            self.salvar()
+        except Exception as e:
+            print(f"[ERRO] Falha ao salvar o cache de embeddings: {e}")
+        finally:
+            self._salvando = False
+
+    def _carregar(self):
+        if not os.path.exists(self.arquivo):
+            return
+        try:
+            with open(self.arquivo, "rb") as f:
+                conteudo = pickle.load(f)
+        except Exception as e:
+            print(f"[ERRO] Cache de embeddings ignorado: {e}")
+            return
+        if not isinstance(conteudo, dict) or conteudo.get("versao") != CACHE_VERSAO:
+            print("⚠️ Cache de embeddings descartado: arquivo sem cabeçalho de modelo (formato antigo)")
+            return
+        if conteudo["modelo"] != self.modelo:
+            print(f"⚠️ Cache de embeddings descartado: gerado com {conteudo['modelo']}, modelo atual {self.modelo}")
+            return
+        self.dimensao = conteudo["dimensao"]
+        itens = conteudo["itens"]
+        agora = time.time()
+        for chave, (timestamp, vetor) in itens.items():
+            if not self._expirado(timestamp, agora):
+                self._itens[chave] = (timestamp, vetor)
+        while len(self._itens) > self.max_itens:
+            self._itens.popitem(last=False)
+
+    def salvar(self):
+        if not self.arquivo:
+            return
+        with self._lock:
+            conteudo = {
+                "versao": CACHE_VERSAO,
+                "modelo": self.modelo,
+                "dimensao": self.dimensao,
+                "itens": OrderedDict(self._itens)
+            }
+            self._pendentes = 0
+        # Serializa gravações concorrentes (thread de background e atexit) no mesmo temporário
+        with self._lock_arquivo:
+            temporario = f"{self.arquivo}.{os.getpid()}.tmp"
+            with open(temporario, "wb") as f:
+                pickle.dump(conteudo, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temporario, self.arquivo)
+
+    def limpar(self):
+        with self._lock:
+            self._itens.clear()
+            self._pendentes = 0
+
+    def estatisticas(self):
+        with self._lock:
+            consultas = self.hits + self.misses
+            return {
+                "itens": len(self._itens),
+                "max_itens": self.max_itens,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / consultas, 4) if consultas else 0.0,
+                "evictions": self.evictions,
+                "expirados": self.expirados,
+                "persistente": bool(self.arquivo),
+                "modelo": self.modelo,
+                "dimensao": self.dimensao
+            }
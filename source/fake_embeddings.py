@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+import os
+import time
+import zlib
+import asyncio
+import numpy as np
+
+# === CONFIGURAÇÃO ===
+DIMENSAO = int(os.environ.get("EMBEDDINGS_FAKE_DIMENSAO", "384"))
+LATENCIA_MS = float(os.environ.get("EMBEDDINGS_FAKE_LATENCIA_MS", "0"))   # simula o round trip da OCI
+
+
+class EmbeddingsFake:
+    """
+    Embedder determinístico para testes e benchmark offline: trigramas de caracteres
+    espalhados por hashing (crc32) em um vetor normalizado. Textos parecidos ficam próximos,
+    então a busca vetorial e o fallback fuzzy se comportam de forma plausível.
+    Implementa a interface do OCIGenAIEmbeddings e o encode() do SentenceTransformer.
+    """
+
+    def __init__(self, dimensao=DIMENSAO, latencia_ms=LATENCIA_MS):
+        self.dimensao = dimensao
+        self.latencia_ms = latencia_ms
+
+    def _vetor(self, texto):
+        texto = f"  {texto.lower()}  "
+        vetor = np.zeros(self.dimensao, dtype=np.float32)
+        for i in range(len(texto) - 2):
+            h = zlib.crc32(texto[i:i + 3].encode("utf-8"))
+            vetor[h % self.dimensao] += 1.0 if (h >> 16) & 1 else -1.0
+        norma = np.linalg.norm(vetor)
+        return vetor / norma if norma else vetor
+
+    def _esperar(self):
+        if self.latencia_ms:
+            time.sleep(self.latencia_ms / 1000)
+
+    def embed_query(self, texto):
+        self._esperar()
+        return self._vetor(texto).tolist()
+
+    def embed_documents(self, textos):
+        self._esperar()
+        return [self._vetor(texto).tolist() for texto in textos]
+
+    async def aembed_query(self, texto):
+        if self.latencia_ms:
+            await asyncio.sleep(self.latencia_ms / 1000)
+        return self._vetor(texto).tolist()
+
+    async def aembed_documents(self, textos):
+        if self.latencia_ms:
+            await asyncio.sleep(self.latencia_ms / 1000)
+        return [self._vetor(texto).tolist() for texto in textos]
+
+    def encode(self, textos, batch_size=None, convert_to_numpy=True):
+        return np.vstack([self._vetor(texto) for texto in textos]) if textos else np.empty((0, self.dimensao))
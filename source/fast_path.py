@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+import os
+import re
+import json
+
+# === CONFIGURAÇÃO ===
+FAST_PATH_ATIVO = os.environ.get("FAST_PATH", "1") != "0"
+CAMPOS_OBRIGATORIOS = ("customer", "description", "price", "location")
+# Resposta de resolve_ean quando nenhum produto corresponde: resultado válido, não uma falha
+EAN_NAO_ENCONTRADO = "EAN não encontrado com os critérios fornecidos."
+
+_BLOCO_JSON = re.compile(r"\{.*\}", re.DOTALL)
+
+
+def detectar_entrada_estruturada(texto):
+    """
+    Retorna o dicionário da nota de devolução se o texto for o JSON do exemplo do prompt
+    (customer, description, price, location); senão None.
+    """
+    bloco = _BLOCO_JSON.search(texto)
+    if not bloco:
+        return None
+    try:
+        entrada = json.loads(bloco.group(0))
+    except ValueError:
+        return None
+    return validar_entrada(entrada)
+
+
+def validar_entrada(entrada):
+    """Confere os campos obrigatórios e converte o preço; retorna None se a nota estiver incompleta."""
+    if not isinstance(entrada, dict) or any(entrada.get(campo) in (None, "") for campo in CAMPOS_OBRIGATORIOS):
+        return None
+    try:
+        entrada["price"] = float(entrada["price"])
+    except (TypeError, ValueError):
+        return None
+    return entrada
+
+
+def parse_resultado(resultado):
+    """Resultados das ferramentas MCP chegam como texto JSON (ou lista de textos, para listas)."""
+    if isinstance(resultado, list):
+        return [parse_resultado(item) for item in resultado]
+    if isinstance(resultado, str):
+        try:
+            return json.loads(resultado)
+        except ValueError:
+            return resultado
+    return resultado
+
+
+def linhas_notas(resultado):
+    """Aceita a lista de dicionários ou a página compacta ({"colunas", "linhas", ...}) de buscar_notas_por_criterios."""
+    if isinstance(resultado, dict) and "linhas" in resultado:
+        return [dict(zip(resultado["colunas"], linha)) for linha in resultado["linhas"]], resultado.get("mais_resultados", False)
+    if isinstance(resultado, dict):
+        return [resultado], False
+    return resultado, False
+
+
+def formatar_resposta(nota):
+    return (
+        f"Nota fiscal de saída encontrada:\n"
+        f"• número da nota: {nota['numero_nota']}\n"
+        f"• cliente: {nota['nome_cliente']}\n"
+        f"• estado: {nota['estado']}\n"
+        f"• EAN: {nota['codigo_ean']}\n"
+        f"• descrição do produto: {nota['descricao_produto']}\n"
+        f"• preço unitário: {nota['valor_unitario']}"
+    )
+
+
+async def resolver_nota(entrada, ferramentas):
+    """
+    Executa resolve_ean -> buscar_notas_por_criterios diretamente nas ferramentas MCP,
+    sem passar pelo LLM. Retorna (nota, detalhes); nota None indica que o caso é
+    ambíguo ou falhou (o motivo fica em detalhes["motivo"]). Falhas das ferramentas (timeout,
+    erro do banco) também preenchem detalhes["erro"]: a nota deve ser tentada de novo.
+    """
+    detalhes = {"ferramentas": []}
+
+    detalhes["ferramentas"].append("resolve_ean")
+    produto = parse_resultado(await ferramentas["resolve_ean"].ainvoke({"description": entrada["description"]}))
+    if not isinstance(produto, dict) or "erro" in produto or not produto.get("ean"):
+        detalhes["motivo"] = "ean_nao_resolvido"
+        if not isinstance(produto, dict):
+            detalhes["erro"] = f"resposta inesperada de resolve_ean: {produto}"
+        elif produto.get("erro", EAN_NAO_ENCONTRADO) != EAN_NAO_ENCONTRADO:
+            detalhes["erro"] = produto["erro"]
+        return None, detalhes
+    detalhes["ean"] = produto["ean"]
+
+    detalhes["ferramentas"].append("buscar_notas_por_criterios")
+    notas = parse_resultado(await ferramentas["buscar_notas_por_criterios"].ainvoke({
+        "cliente": entrada["customer"],
+        "estado": entrada["location"],
+        "preco": entrada["price"],
+        "ean": produto["ean"]
+    }))
+    if isinstance(notas, dict) and "erro" in notas:
+        detalhes["motivo"] = "falha_busca_notas"
+        detalhes["erro"] = notas["erro"]
+        return None, detalhes
+    notas, mais_resultados = linhas_notas(notas)
+    if not isinstance(notas, list) or any(not isinstance(n, dict) or "erro" in n for n in notas):
+        detalhes["motivo"] = "falha_busca_notas"
+        detalhes["erro"] = "resposta inesperada de buscar_notas_por_criterios"
+        return None, detalhes
+
+    numeros = {nota["numero_nota"] for nota in notas}
+    detalhes["notas_candidatas"] = len(numeros)
+    # Página incompleta (NOTAS_LIMITE_PADRAO no servidor): há mais candidatas além das recebidas
+    if len(numeros) != 1 or mais_resultados:
+        detalhes["motivo"] = "sem_nota" if not numeros else "ambiguo"
+        return None, detalhes
+
+    return notas[0], detalhes
+
+
+async def executar_fast_path(entrada, ferramentas):
+    """
+    Versão para o chat: retorna (resposta, detalhes) com a nota já formatada;
+    resposta None indica que o caso deve seguir para o agente.
+    """
+    nota, detalhes = await resolver_nota(entrada, ferramentas)
+    return (formatar_resposta(nota) if nota else None), detalhes
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+import os
+import difflib
+from collections import Counter
+import numpy as np
+from rapidfuzz import fuzz, process
+
+# === CONFIGURAÇÃO ===
+FUZZY_WORKERS = int(os.environ.get("FUZZY_WORKERS", "-1"))   # -1 = todos os núcleos
+
+
+def ordenar_tokens(texto):
+    """Mesmo pré-processamento do fuzz.token_sort_ratio."""
+    return " ".join(sorted(texto.split()))
+
+
+class IndiceFuzzy:
+    """
+    Estruturas pré-calculadas sobre as descrições do catálogo para a correção de input
+    (difflib) e o fallback fuzzy (token_sort_ratio), com o mesmo resultado da varredura completa.
+
+    - Correção: uma matriz de contagem de caracteres por descrição permite calcular o
+      quick_ratio do difflib para todo o catálogo de uma vez. Como quick_ratio é um limite
+      superior de ratio, só as descrições que passam no cutoff são avaliadas pelo difflib.
+    - Fuzzy: as descrições já ficam com os tokens ordenados, e o ratio é calculado em lote
+      pelo rapidfuzz.process.cdist em várias threads.
+    """
+
+    def __init__(self, descricoes, workers=FUZZY_WORKERS):
+        self.descricoes = list(descricoes)
+        self.workers = workers
+        self.tokens_ordenados = [ordenar_tokens(d) for d in self.descricoes]
+
+        self.alfabeto = {c: i for i, c in enumerate(sorted(set("".join(self.descricoes))))}
+        self.contagens = np.zeros((len(self.descricoes), len(self.alfabeto)), dtype=np.uint16)
+        for i, descricao in enumerate(self.descricoes):
+            for c, qtd in Counter(descricao).items():
+                self.contagens[i, self.alfabeto[c]] = min(qtd, np.iinfo(np.uint16).max)
+        self.tamanhos = np.array([len(d) for d in self.descricoes], dtype=np.int64)
+
+    def __len__(self):
+        return len(self.descricoes)
+
+    def _candidatos_correcao(self, texto, cutoff):
+        pares = [(self.alfabeto[c], qtd) for c, qtd in Counter(texto).items() if c in self.alfabeto]
+        if pares:
+            colunas, qtd = zip(*pares)
+            matches = np.minimum(self.contagens[:, list(colunas)], np.array(qtd, dtype=np.int64)).sum(axis=1)
+        else:
+            matches = np.zeros(len(self.descricoes), dtype=np.int64)
+        tamanho = self.tamanhos + len(texto)
+        limite = np.where(tamanho > 0, 2.0 * matches / np.maximum(tamanho, 1), 1.0)
+        return np.nonzero(limite >= cutoff)[0]
+
+    def melhor_correcao(self, texto, cutoff=0.6, excluir=None):
+        """
+        Melhor (ratio, descricao) como em difflib.get_close_matches(n=1), ou None.
+        `excluir` são posições ignoradas (ex.: produtos substituídos por uma versão mais nova).
+        """
+        candidatos = self._candidatos_correcao(texto, cutoff)
+        if excluir is not None and len(excluir):
+            candidatos = np.setdiff1d(candidatos, excluir, assume_unique=True)
+        matcher = difflib.SequenceMatcher()
+        matcher.set_seq2(texto)
+        melhor = None
+        for i in candidatos:
+            matcher.set_seq1(self.descricoes[i])
+            if matcher.real_quick_ratio() >= cutoff and matcher.quick_ratio() >= cutoff:
+                ratio = matcher.ratio()
+                # Empate: get_close_matches escolhe pela maior string (heapq.nlargest sobre (score, x))
+                if ratio >= cutoff and (melhor is None or (ratio, self.descricoes[i]) > melhor):
+                    melhor = (ratio, self.descricoes[i])
+        return melhor
+
+    def corrigir(self, texto, cutoff=0.6):
+        """Equivalente a difflib.get_close_matches(texto, descricoes, n=1, cutoff=cutoff)."""
+        melhor = self.melhor_correcao(texto, cutoff)
+        return melhor[1] if melhor else texto
+
+    def melhores_fuzzy(self, texto, k, excluir=None):
+        """
+        Top-k por fuzz.token_sort_ratio, na mesma ordem de uma ordenação estável
+        decrescente sobre o catálogo inteiro. Retorna [(indice, score)].
+        """
+        n = len(self.descricoes)
+        if n == 0 or k <= 0:
+            return []
+        scores = process.cdist(
+            [ordenar_tokens(texto)], self.tokens_ordenados,
+            scorer=fuzz.ratio, dtype=np.float64, workers=self.workers
+        )[0]
+        validos = n
+        if excluir is not None and len(excluir):
+            scores[excluir] = -1.0   # fora de qualquer corte (scores reais vão de 0 a 100)
+            validos -= len(excluir)
+            if validos <= 0:
+                return []
+        if k < validos:
+            corte = -np.partition(-scores, k - 1)[k - 1]
+            candidatos = np.nonzero(scores >= corte)[0]
+        else:
+            candidatos = np.nonzero(scores >= 0)[0]
+        ordem = candidatos[np.argsort(-scores[candidatos], kind="stable")][:k]
+        return [(int(i), float(scores[i])) for i in ordem]
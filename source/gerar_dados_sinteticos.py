@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+"""
+Gera uma base SQLite sintética para o benchmark offline, a partir dos dados de exemplo
+(inserts_produtos_livros.sql e notas_fiscais_mock.sql) replicados até a escala pedida.
+"""
+import os
+import re
+import random
+import argparse
+import sqlite3
+import time
+import sqlite_backend
+
+DIRETORIO = os.path.dirname(os.path.abspath(__file__))
+LOTE_INSERCAO = 50000
+
+_TO_DATE = re.compile(r"TO_DATE\(('[^']*'),\s*'[^']*'\)", re.IGNORECASE)
+_VARIACOES = ["Edição de Bolso", "Box", "Edição Especial", "Reimpressão", "Capa Comum", "Edição Revista"]
+_ESTADOS = [("São Paulo", "SP"), ("Rio de Janeiro", "RJ"), ("Belo Horizonte", "MG"), ("Curitiba", "PR")]
+
+
+def carregar_exemplos(connection):
+    """Executa os scripts de exemplo do projeto (com TO_DATE convertido para texto ISO)."""
+    for arquivo in ("inserts_produtos_livros.sql", "notas_fiscais_mock.sql"):
+        with open(os.path.join(DIRETORIO, arquivo), encoding="utf-8") as f:
+            script = _TO_DATE.sub(r"\1", f.read())
+        connection.executescript(script)
+    connection.commit()
+
+
+def _em_lotes(linhas):
+    lote = []
+    for linha in linhas:
+        lote.append(linha)
+        if len(lote) >= LOTE_INSERCAO:
+            yield lote
+            lote = []
+    if lote:
+        yield lote
+
+
+def gerar_produtos(connection, total, rng):
+    base = connection.execute("SELECT descricao FROM produtos ORDER BY id").fetchall()
+    existentes = len(base)
+
+    def linhas():
+        for i in range(existentes, total):
+            titulo = base[i % len(base)][0]
+            variacao = rng.choice(_VARIACOES)
+            yield f"SIN{i:08d}", f"{titulo} - {variacao} {i // len(base)}"
+
+    for lote in _em_lotes(linhas()):
+        connection.executemany("INSERT INTO produtos (codigo, descricao) VALUES (?, ?)", lote)
+        connection.commit()
+
+
+def gerar_notas(connection, total_notas, itens_por_nota, rng):
+    produtos = connection.execute("SELECT codigo, descricao FROM produtos").fetchall()
+    existentes = connection.execute("SELECT COUNT(*) FROM nota_fiscal").fetchone()[0]
+    clientes = max(total_notas // 20, 1)
+
+    def notas():
+        for i in range(existentes, total_notas):
+            cidade, estado = rng.choice(_ESTADOS)
+            cliente = rng.randrange(clientes)
+            data = f"2025-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}"
+            yield (f"NFS{i:09d}", f"CL{cliente:07d}", f"Cliente {cliente}", None, data, cidade, estado)
+
+    def itens():
+        for i in range(existentes, total_notas):
+            for n in range(1, itens_por_nota + 1):
+                codigo, descricao = rng.choice(produtos)
+                preco = round(rng.uniform(20, 200), 2)
+                quantidade = rng.randint(1, 3)
+                yield (f"NFS{i:09d}", n, codigo, descricao, preco, quantidade,
+                       round(preco * quantidade, 2), round(preco * quantidade * 0.18, 2))
+
+    for lote in _em_lotes(notas()):
+        connection.executemany("INSERT INTO nota_fiscal VALUES (?, ?, ?, ?, ?, ?, ?)", lote)
+        connection.commit()
+    for lote in _em_lotes(itens()):
+        connection.executemany("INSERT INTO item_nota_fiscal VALUES (?, ?, ?, ?, ?, ?, ?, ?)", lote)
+        connection.commit()
+
+
+def gerar(caminho, produtos, notas, itens_por_nota, semente=42):
+    rng = random.Random(semente)
+    sqlite_backend.criar_schema(caminho)
+    connection = sqlite3.connect(caminho)
+    inicio = time.perf_counter()
+    if connection.execute("SELECT COUNT(*) FROM produtos").fetchone()[0] == 0:
+        carregar_exemplos(connection)
+    gerar_produtos(connection, produtos, rng)
+    gerar_notas(connection, notas, itens_por_nota, rng)
+    contagens = {
+        tabela: connection.execute(f"SELECT COUNT(*) FROM {tabela}").fetchone()[0]
+        for tabela in ("produtos", "nota_fiscal", "item_nota_fiscal")
+    }
+    connection.close()
+    print(f"✅ Base sintética em {caminho}: {contagens} ({time.perf_counter() - inicio:.1f}s)")
+    return contagens
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Gera a base SQLite sintética do benchmark offline.")
+    parser.add_argument("caminho", help="Arquivo SQLite de destino")
+    parser.add_argument("--produtos", type=int, default=100000)
+    parser.add_argument("--notas", type=int, default=250000)
+    parser.add_argument("--itens-por-nota", type=int, default=4)
+    parser.add_argument("--semente", type=int, default=42)
+    args = parser.parse_args()
+    gerar(args.caminho, args.produtos, args.notas, args.itens_por_nota, args.semente)
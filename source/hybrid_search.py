@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+import os
+import json
+
+# === CONFIGURAÇÃO DA FUSÃO ===
+RRF_K = int(os.environ.get("HIBRIDO_RRF_K", "60"))                  # constante k do reciprocal rank fusion
+PESOS = json.loads(os.environ.get("HIBRIDO_PESOS", '{"vetorial": 1.0, "lexico": 1.0, "fuzzy": 0.5}'))
+PROFUNDIDADE = int(os.environ.get("HIBRIDO_PROFUNDIDADE", "20"))    # posições de cada ranking consideradas
+
+
+def fundir_rrf(rankings, pesos=None, k=RRF_K, limite=None, profundidade=PROFUNDIDADE):
+    """
+    Reciprocal rank fusion ponderado: score(ean) = soma de peso / (k + posição) nos rankings
+    em que o EAN aparece (posição a partir de 1). `rankings` é {retriever: [item, ...]} já
+    ordenado do melhor para o pior, com "codigo" (EAN) e "descricao" em cada item.
+    Só a posição entra no score, então distâncias, similaridades e scores fuzzy de escalas
+    diferentes não precisam ser normalizados.
+    """
+    pesos = PESOS if pesos is None else pesos
+    fundidos = {}
+    for retriever, itens in rankings.items():
+        peso = pesos.get(retriever, 1.0)
+        vistos = set()
+        for item in itens:
+            ean = item.get("codigo")
+            # Mesmo EAN repetido no ranking (ex.: produtos com o mesmo código): vale a melhor posição
+            if ean is None or ean in vistos:
+                continue
+            vistos.add(ean)
+            if len(vistos) > profundidade:
+                break
+            entrada = fundidos.setdefault(ean, {"ean": ean, "descricao": item.get("descricao"), "score": 0.0, "fontes": {}})
+            entrada["fontes"][retriever] = len(vistos)
+            entrada["score"] += peso / (k + len(vistos))
+
+    # Empates: melhor posição em qualquer retriever, depois o EAN, para uma ordem determinística
+    ordenados = sorted(
+        fundidos.values(),
+        key=lambda e: (-e["score"], min(e["fontes"].values()), str(e["ean"]))
+    )
+    for entrada in ordenados:
+        entrada["score"] = round(entrada["score"], 6)
+    return ordenados[:limite] if limite else ordenados
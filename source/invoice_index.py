@@ -0,0 +1,232 @@
+# -*- coding: utf-8 -*-
+import os
+import time
+import bisect
+import threading
+from collections import defaultdict
+import db_pool
+
+# === CONFIGURAÇÃO ===
+INTERVALO_INCREMENTAL = float(os.environ.get("INDICE_NOTAS_INTERVALO", "60"))          # segundos; 0 = nunca
+INTERVALO_RECARGA = float(os.environ.get("INDICE_NOTAS_RECARGA", "86400"))             # recarga completa (remoções)
+FETCH_ARRAYSIZE = 5000
+
+_CONSULTA_ITENS = """
+    SELECT nf.numero_nf, nf.nome_cliente, nf.estado, nf.data_saida,
+           inf.numero_item, inf.codigo_ean, inf.descricao_produto, inf.valor_unitario
+    FROM nota_fiscal nf
+             JOIN item_nota_fiscal inf ON nf.numero_nf = inf.numero_nf
+"""
+# Incremental: cada tabela é filtrada sozinha pelo ORA_ROWSCN e só as notas alteradas entram
+# no join, pelas chaves primárias (numero_nf); todos os itens dessas notas são relidos
+_CONSULTA_ALTERADOS = _CONSULTA_ITENS + """
+    WHERE nf.numero_nf IN (
+        SELECT numero_nf FROM nota_fiscal WHERE ORA_ROWSCN > :scn
+        UNION
+        SELECT numero_nf FROM item_nota_fiscal WHERE ORA_ROWSCN > :scn
+    )
+"""
+
+
+def _normalizar(valor):
+    # Mesmo efeito do LOWER(...) do SQL; no parâmetro cliente, None vira "none" como no f"%{cliente}%" original
+    return f"{valor}".lower()
+
+
+class _Particao:
+    """Itens de um EAN ordenados por valor_unitario; imutável, trocada inteira ao atualizar."""
+    __slots__ = ("precos", "linhas")
+
+    def __init__(self, linhas):
+        # Itens sem valor_unitario ficam no fim e nunca caem em uma faixa de preço
+        self.linhas = sorted(linhas, key=lambda linha: linha[7] if linha[7] is not None else float("inf"))
+        self.precos = [linha[7] if linha[7] is not None else float("inf") for linha in self.linhas]
+
+
+class IndiceNotas:
+    """
+    Estrutura em memória para buscar_notas_por_criterios: itens particionados por EAN e
+    ordenados por preço, de modo que preço ± margem vira uma busca binária. Cliente e estado
+    são comparados com chaves já normalizadas. Novos itens entram incrementalmente
+    (ORA_ROWSCN acima do último visto) e uma recarga completa periódica cobre remoções,
+    ambos em uma thread de atualização: as consultas seguem lendo o snapshot atual.
+    """
+
+    def __init__(
+            self,
+            intervalo_incremental=INTERVALO_INCREMENTAL,
+            intervalo_recarga=INTERVALO_RECARGA,
+            carregar_em_background=False
+    ):
+        self.intervalo_incremental = intervalo_incremental
+        self.intervalo_recarga = intervalo_recarga
+        self._particoes = None
+        self._chaves = {}                  # (numero_nf, numero_item) -> ean
+        self._scn = 0
+        self.versao = 0                  # incrementada a cada troca das partições com mudanças
+        self._ultima_incremental = 0.0
+        self._ultima_recarga = 0.0
+        self._lock = threading.Lock()
+        self._lock_carga = threading.Lock()
+        self._lock_atualizacao = threading.Lock()
+        self._pid_atualizacao = None
+        if carregar_em_background:
+            threading.Thread(target=self._garantir_carregado, daemon=True).start()
+        else:
+            self.recarregar()
+
+    @property
+    def carregado(self):
+        return self._particoes is not None
+
+    def _garantir_carregado(self):
+        """Primeira carga; chamadas concorrentes aguardam a mesma carga e uma falha é levantada a quem chamou."""
+        if self._particoes is not None:
+            return
+        with self._lock_carga:
+            if self._particoes is None:
+                self.recarregar()
+
+    @staticmethod
+    def _linha(row):
+        numero_nf, nome_cliente, estado, data_saida, numero_item, codigo_ean, descricao, valor = row
+        # Colunas nulas nunca satisfazem LIKE/= no SQL, então ficam como None
+        return (numero_nf, nome_cliente, estado, data_saida, numero_item, codigo_ean, descricao, valor,
+                _normalizar(nome_cliente) if nome_cliente is not None else None,
+                _normalizar(estado) if estado is not None else None)
+
+    def _ler(self, cursor, scn_minimo=None):
+        cursor.arraysize = FETCH_ARRAYSIZE
+        cursor.prefetchrows = FETCH_ARRAYSIZE + 1
+        # SCN lido antes da consulta: o que for gravado depois entra na próxima leitura incremental
+        cursor.execute("SELECT DBMS_FLASHBACK.GET_SYSTEM_CHANGE_NUMBER FROM dual")
+        scn_atual = cursor.fetchone()[0]
+        if scn_minimo is None:
+            cursor.execute(_CONSULTA_ITENS)
+        else:
+            cursor.execute(_CONSULTA_ALTERADOS, {"scn": scn_minimo})
+        return scn_atual, [self._linha(row) for row in cursor]
+
+    def recarregar(self):
+        """Carga completa de todos os itens de nota fiscal."""
+        with self._lock:
+            with db_pool.conexao() as connection:
+                cursor = connection.cursor()
+                scn, linhas = self._ler(cursor)
+                cursor.close()
+            por_ean = defaultdict(list)
+            chaves = {}
+            for linha in linhas:
+                if linha[5] is not None:
+                    por_ean[linha[5]].append(linha)
+                    chaves[(linha[0], linha[4])] = linha[5]
+            self._particoes = {ean: _Particao(itens) for ean, itens in por_ean.items()}
+            self.versao += 1
+            self._chaves = chaves
+            self._scn = scn
+            self._ultima_incremental = self._ultima_recarga = time.time()
+        return len(linhas)
+
+    def atualizar_incremental(self):
+        """Aplica itens novos ou alterados desde o último SCN visto. Retorna quantos chegaram."""
+        with self._lock:
+            with db_pool.conexao() as connection:
+                cursor = connection.cursor()
+                scn, linhas = self._ler(cursor, self._scn)
+                cursor.close()
+            afetados = defaultdict(dict)
+            for linha in linhas:
+                chave = (linha[0], linha[4])
+                ean_anterior = self._chaves.get(chave)
+                if ean_anterior is not None:
+                    afetados[ean_anterior].setdefault(chave, None)
+                if linha[5] is not None:
+                    afetados[linha[5]][chave] = linha
+                    self._chaves[chave] = linha[5]
+            # Copy-on-write por partição: leitores em andamento continuam com a versão anterior
+            particoes = dict(self._particoes)
+            for ean, mudancas in afetados.items():
+                atuais = particoes[ean].linhas if ean in particoes else []
+                itens = [l for l in atuais if (l[0], l[4]) not in mudancas]
+                itens.extend(l for l in mudancas.values() if l is not None)
+                if itens:
+                    particoes[ean] = _Particao(itens)
+                else:
+                    particoes.pop(ean, None)
+            self._particoes = particoes
+            if linhas:
+                self.versao += 1
+            self._scn = scn
+            self._ultima_incremental = time.time()
+        return len(linhas)
+
+    def _garantir_atualizacao(self):
+        """
+        Inicia a thread de atualização no primeiro uso em cada processo: threads não passam pelo
+        fork dos workers do servidor HTTP, e o processo mestre (que só carrega) não precisa dela.
+        """
+        if self._pid_atualizacao == os.getpid():
+            return
+        with self._lock_atualizacao:
+            if self._pid_atualizacao == os.getpid():
+                return
+            self._pid_atualizacao = os.getpid()
+        intervalos = [i for i in (self.intervalo_incremental, self.intervalo_recarga) if i > 0]
+        if intervalos:
+            threading.Thread(target=self._atualizar_periodicamente, args=(min(intervalos),), daemon=True).start()
+
+    def _atualizar_periodicamente(self, intervalo):
+        while True:
+            time.sleep(intervalo)
+            self.manter_atualizado()
+
+    def manter_atualizado(self):
+        """Aplica o incremental/recarga quando os intervalos vencem (chamado pela thread de atualização)."""
+        agora = time.time()
+        recarga = self.intervalo_recarga > 0 and agora - self._ultima_recarga >= self.intervalo_recarga
+        incremental = self.intervalo_incremental > 0 and agora - self._ultima_incremental >= self.intervalo_incremental
+        try:
+            if recarga:
+                self.recarregar()
+            elif incremental:
+                self.atualizar_incremental()
+        except Exception as e:
+            print(f"[ERRO] Atualização do índice de notas falhou: {e}")
+            # Segue com os dados atuais e tenta de novo no próximo intervalo incremental
+            self._ultima_incremental = agora
+            if recarga:
+                self._ultima_recarga = agora - self.intervalo_recarga + max(self.intervalo_incremental, 1)
+
+    def buscar(self, cliente=None, estado=None, preco=None, ean=None, margem=0.05):
+        """
+        Mesmo filtro de buscar_notas_por_criterios; retorna as linhas no formato
+        (numero_nf, nome_cliente, estado, data_saida, numero_item, codigo_ean, descricao, valor).
+        """
+        self._garantir_atualizacao()
+        particao = self._particoes.get(ean) if ean is not None else None
+        if particao is None:
+            return []
+
+        if preco is not None:
+            inicio = bisect.bisect_left(particao.precos, preco * (1 - margem))
+            fim = bisect.bisect_right(particao.precos, preco * (1 + margem))
+        else:
+            inicio, fim = 0, len(particao.linhas)
+
+        cliente_norm = _normalizar(cliente)
+        estado_norm = _normalizar(estado) if estado is not None else None
+        return [
+            linha[:8]
+            for linha in particao.linhas[inicio:fim]
+            if linha[8] is not None and cliente_norm in linha[8]
+            and estado_norm is not None and linha[9] == estado_norm
+        ]
+
+    def estatisticas(self):
+        particoes = self._particoes or {}
+        return {
+            "carregado": self.carregado,
+            "eans": len(particoes),
+            "itens": len(self._chaves),
+            "scn": self._scn
+        }
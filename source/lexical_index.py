@@ -0,0 +1,287 @@
+# -*- coding: utf-8 -*-
+import os
+import re
+import time
+import threading
+import unicodedata
+from array import array
+from functools import reduce
+from collections import defaultdict
+from itertools import combinations
+import numpy as np
+from rapidfuzz.distance import Levenshtein
+import db_pool
+
+# === CONFIGURAÇÃO ===
+DISTANCIA_MAXIMA = 2                                                  # UTL_MATCH.EDIT_DISTANCE(...) <= 2
+INTERVALO_VERIFICACAO = float(os.environ.get("INDICE_LEXICO_INTERVALO", "300"))  # segundos; 0 = nunca
+
+_PALAVRA = re.compile(r"\w+")
+_EAN = re.compile(r"(?<!\d)\d{8,14}(?!\d)")                            # GTIN-8 a GTIN-14 no texto
+_CODIGOS_SOUNDEX = {
+    c: d
+    for letras, d in (("bfpv", "1"), ("cgjkqsxz", "2"), ("dt", "3"), ("l", "4"), ("mn", "5"), ("r", "6"))
+    for c in letras
+}
+
+
+def soundex(palavra):
+    """SOUNDEX no formato do Oracle (letra + 3 dígitos), considerando só letras a-z sem acento."""
+    sem_acento = unicodedata.normalize("NFD", palavra.lower())
+    letras = [c for c in sem_acento if "a" <= c <= "z"]
+    if not letras:
+        return None
+    codigo = letras[0].upper()
+    anterior = _CODIGOS_SOUNDEX.get(letras[0])
+    for c in letras[1:]:
+        digito = _CODIGOS_SOUNDEX.get(c)
+        if digito is not None and digito != anterior:
+            codigo += digito
+        # h e w não separam letras de mesmo código; vogais separam
+        if c not in "hw":
+            anterior = digito
+    return (codigo + "000")[:4]
+
+
+def delecoes(palavra, distancia=DISTANCIA_MAXIMA):
+    """Todas as variantes da palavra com até `distancia` caracteres removidos."""
+    variantes = {palavra}
+    for n in range(1, min(distancia, len(palavra)) + 1):
+        for posicoes in combinations(range(len(palavra)), n):
+            variantes.add("".join(c for i, c in enumerate(palavra) if i not in posicoes))
+    return variantes
+
+
+def normalizar_titulo(texto):
+    """Chave da busca exata por título: sem acentos, minúsculas, só letras/dígitos separados por um espaço."""
+    sem_acento = "".join(c for c in unicodedata.normalize("NFD", texto or "") if not unicodedata.combining(c))
+    return " ".join(_PALAVRA.findall(sem_acento.lower().replace("_", " ")))
+
+
+def _like(token):
+    """Regex equivalente a LIKE '%token%' (com % e _ como curingas)."""
+    padrao = "".join(".*" if c == "%" else "." if c == "_" else re.escape(c) for c in token)
+    return re.compile(padrao, re.DOTALL)
+
+
+def _postings(listas):
+    """array('i') acumulados em ordem crescente -> np.int32 (4 bytes por posição, sem objetos int)."""
+    return {chave: np.frombuffer(posicoes, dtype=np.int32) for chave, posicoes in listas.items()}
+
+
+class _Estruturas:
+    """
+    Snapshot imutável do catálogo indexado; trocado atomicamente em atualizar().
+    As postings são vetores np.int32 ordenados de posições de produto (ou de palavras do
+    vocabulário, nas deleções), em vez de sets de ints.
+    """
+
+    def __init__(self, produtos):
+        self.produtos = produtos
+        self.descricoes = [(descricao or "").lower() for _, descricao in produtos]
+        ngramas = defaultdict(lambda: array("i"))     # n-grama (1 a 3 chars) -> produtos que o contêm
+        palavras = defaultdict(lambda: array("i"))    # palavra -> produtos
+        # Busca exata (camada 1 da cascata): EAN e título normalizado -> primeiro produto com a chave
+        self.por_codigo = {}
+        self.por_titulo = {}
+        for pos, (codigo, descricao) in enumerate(produtos):
+            if codigo is not None:
+                self.por_codigo.setdefault(str(codigo), pos)
+            titulo = normalizar_titulo(descricao)
+            if titulo:
+                self.por_titulo.setdefault(titulo, pos)
+
+        for pos, descricao in enumerate(self.descricoes):
+            for ngrama in {descricao[i:i + n] for n in (1, 2, 3) for i in range(len(descricao) - n + 1)}:
+                ngramas[ngrama].append(pos)
+            for palavra in set(_PALAVRA.findall(descricao)):
+                palavras[palavra].append(pos)
+        self.ngramas = _postings(ngramas)
+        self.palavras = _postings(palavras)
+
+        self.vocabulario = list(self.palavras)
+        soundex_palavras = defaultdict(list)          # código soundex -> postings das palavras
+        delecoes_vocabulario = defaultdict(lambda: array("i"))   # variante com deleções -> palavras (id no vocabulário)
+        for id_palavra, palavra in enumerate(self.vocabulario):
+            codigo = soundex(palavra)
+            if codigo:
+                soundex_palavras[codigo].append(self.palavras[palavra])
+            # Só até DISTANCIA_MAXIMA deleções: a distância de edição que proximos() aceita
+            for variante in delecoes(palavra):
+                delecoes_vocabulario[variante].append(id_palavra)
+        self.soundex = {
+            codigo: np.unique(np.concatenate(postings)).astype(np.int32)
+            for codigo, postings in soundex_palavras.items()
+        }
+        self.delecoes = _postings(delecoes_vocabulario)
+
+    def contem(self, token):
+        """Produtos cuja descrição satisfaz LIKE '%token%'."""
+        if "%" in token or "_" in token:
+            regex = _like(token)
+            return {pos for pos, d in enumerate(self.descricoes) if regex.search(d)}
+        if len(token) <= 3:
+            postings = self.ngramas.get(token)
+            return set(postings.tolist()) if postings is not None else set()
+        postings = [self.ngramas.get(token[i:i + 3]) for i in range(len(token) - 2)]
+        if any(p is None for p in postings):
+            return set()
+        # Interseção começando pelas postings mais curtas
+        candidatos = reduce(
+            lambda a, b: np.intersect1d(a, b, assume_unique=True), sorted(postings, key=len)
+        )
+        return {pos for pos in candidatos.tolist() if token in self.descricoes[pos]}
+
+    def foneticos(self, token):
+        codigo = soundex(token)
+        postings = self.soundex.get(codigo) if codigo else None
+        return set(postings.tolist()) if postings is not None else set()
+
+    def proximos(self, token):
+        """Produtos com alguma palavra a distância de edição <= DISTANCIA_MAXIMA do token."""
+        ids = set()
+        for variante in delecoes(token):
+            postings = self.delecoes.get(variante)
+            if postings is not None:
+                ids.update(postings.tolist())
+        resultado = set()
+        for id_palavra in ids:
+            palavra = self.vocabulario[id_palavra]
+            if Levenshtein.distance(palavra, token, score_cutoff=DISTANCIA_MAXIMA) <= DISTANCIA_MAXIMA:
+                resultado.update(self.palavras[palavra].tolist())
+        return resultado
+
+
+class IndiceLexico:
+    """
+    Índice invertido em memória com a mesma pontuação do fn_busca_avancada:
+    por termo, 3 pontos se a descrição contém o termo; senão 2 pontos se alguma palavra
+    tem o mesmo SOUNDEX e 1 ponto se alguma palavra está a distância de edição <= 2.
+    Só os produtos candidatos de cada termo são pontuados.
+    """
+
+    def __init__(self, intervalo_verificacao=INTERVALO_VERIFICACAO, carregar_em_background=False):
+        self.intervalo_verificacao = intervalo_verificacao
+        self._lock = threading.Lock()
+        self._lock_carga = threading.Lock()
+        self._lock_verificacao = threading.Lock()
+        self._estruturas = None
+        self._assinatura = None
+        self.versao = 0                  # incrementada a cada troca das estruturas
+        self._ultima_verificacao = 0.0
+        self._pid_verificacao = None
+        if carregar_em_background:
+            threading.Thread(target=self._garantir_carregado, daemon=True).start()
+        else:
+            self.atualizar()
+
+    def _garantir_carregado(self):
+        """Primeira carga sob demanda; chamadas concorrentes aguardam a mesma carga."""
+        if self._estruturas is not None:
+            return
+        with self._lock_carga:
+            if self._estruturas is None:
+                self.atualizar()
+
+    def _ler_assinatura(self, cursor):
+        cursor.execute("SELECT COUNT(*), MAX(id), MAX(ORA_ROWSCN) FROM produtos")
+        return tuple(cursor.fetchone())
+
+    def atualizar(self):
+        """Reconstrói o índice a partir de `produtos` e troca o snapshot atomicamente."""
+        with self._lock:
+            return self._reconstruir()
+
+    def _reconstruir(self):
+        with db_pool.conexao() as connection:
+            cursor = connection.cursor()
+            cursor.arraysize = 5000
+            assinatura = self._ler_assinatura(cursor)
+            cursor.execute("SELECT codigo, descricao FROM produtos ORDER BY id")
+            produtos = [(codigo, descricao) for codigo, descricao in cursor]
+            cursor.close()
+        self._estruturas = _Estruturas(produtos)
+        self.versao += 1
+        self._assinatura = assinatura
+        self._ultima_verificacao = time.time()
+        return len(produtos)
+
+    def atualizar_se_mudou(self):
+        """Recarrega apenas se a assinatura de `produtos` mudou desde a última carga."""
+        # Verificação e reconstrução sob o mesmo lock: chamadas concorrentes não reconstroem duas vezes
+        with self._lock:
+            with db_pool.conexao() as connection:
+                cursor = connection.cursor()
+                assinatura = self._ler_assinatura(cursor)
+                cursor.close()
+            self._ultima_verificacao = time.time()
+            if assinatura != self._assinatura:
+                self._reconstruir()
+                return True
+        return False
+
+    def _garantir_verificacao(self):
+        """
+        Inicia a thread de verificação no primeiro uso em cada processo (threads não passam pelo
+        fork dos workers do servidor HTTP): as consultas nunca pagam a verificação nem a reconstrução.
+        """
+        if self.intervalo_verificacao <= 0 or self._pid_verificacao == os.getpid():
+            return
+        with self._lock_verificacao:
+            if self._pid_verificacao == os.getpid():
+                return
+            self._pid_verificacao = os.getpid()
+        threading.Thread(target=self._verificar_periodicamente, daemon=True).start()
+
+    def _verificar_periodicamente(self):
+        while True:
+            time.sleep(self.intervalo_verificacao)
+            try:
+                self.atualizar_se_mudou()
+            except Exception as e:
+                print(f"[ERRO] Verificação do índice léxico falhou: {e}")
+
+    def buscar_exato(self, texto):
+        """
+        Produto cujo EAN aparece no texto ou cujo título normalizado é igual ao texto;
+        None se não houver. Só consultas a dicionário, sem varrer o catálogo.
+        """
+        self._garantir_carregado()
+        self._garantir_verificacao()
+        estruturas = self._estruturas
+        pos = None
+        for candidato in _EAN.findall(texto or ""):
+            pos = estruturas.por_codigo.get(candidato)
+            if pos is not None:
+                break
+        if pos is None and normalizar_titulo(texto):
+            pos = estruturas.por_titulo.get(normalizar_titulo(texto))
+        if pos is None:
+            return None
+        codigo, descricao = estruturas.produtos[pos]
+        return {"codigo": codigo, "descricao": descricao}
+
+    def buscar(self, termos_busca):
+        """Mesmo formato de executar_busca_ean: [{codigo, descricao, similaridade}] ordenado."""
+        self._garantir_carregado()
+        self._garantir_verificacao()
+        estruturas = self._estruturas
+        scores = defaultdict(int)
+        for token in (t.lower() for t in termos_busca.split()):
+            diretos = estruturas.contem(token)
+            for pos in diretos:
+                scores[pos] += 3
+            for pos in estruturas.foneticos(token) - diretos:
+                scores[pos] += 2
+            for pos in estruturas.proximos(token) - diretos:
+                scores[pos] += 1
+
+        ordem = sorted(scores, key=lambda pos: (-scores[pos], pos))
+        return [
+            {
+                "codigo": estruturas.produtos[pos][0],
+                "descricao": estruturas.produtos[pos][1],
+                "similaridade": scores[pos]
+            }
+            for pos in ordem
+        ]
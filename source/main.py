@@ -9,7 +9,9 @@ from langchain_mcp_adapters.tools import load_mcp_tools
 from langgraph.graph import StateGraph
 from langgraph.prebuilt import create_react_agent
 from langchain_core.runnables import Runnable
-from langchain_core.messages import HumanMessage, AIMessage
+from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
+from langchain_core.tools import StructuredTool, ToolException
+from mcp import types
 
 import phoenix as px
 from opentelemetry import trace
@@ -19,6 +21,10 @@ from opentelemetry.sdk.trace import TracerProvider
 from opentelemetry.sdk.trace.export import BatchSpanProcessor
 # Multiple Servers
 from langchain_mcp_adapters.client import MultiServerMCPClient
+from fast_path import FAST_PATH_ATIVO, detectar_entrada_estruturada, executar_fast_path
+from telemetria import injetar_contexto
+from servidor_http import configuracao_cliente
+from conversation_memory import MemoriaConversa, PROMPT_RESUMO, RESUMO_MAX_TOKENS
 
 # 1. Inicia o Phoenix (ele abre o servidor OTLP na porta 6006)
 px.launch_app()
@@ -36,9 +42,44 @@ provider.add_span_processor(span_processor)
 # 4. Cria o tracer
 tracer = trace.get_tracer(__name__)
 
-class MemoryState:
-    def __init__(self):
-        self.messages = []
+def ferramentas_com_contexto(tools, session, chamadas, memoria=None):
+    """
+    Recria as ferramentas MCP enviando o trace context atual no _meta de cada chamada,
+    para que os spans do servidor fiquem no mesmo trace do agente. Os nomes das
+    ferramentas efetivamente chamadas são acumulados em `chamadas`. Com `memoria`,
+    consultas já feitas na sessão são respondidas por ela, sem ir ao servidor.
+    """
+    async def chamar(nome, argumentos):
+        if memoria is not None:
+            saida = memoria.consultar_ferramenta(nome, argumentos)
+            if saida is not None:
+                chamadas.append(f"{nome} (memória)")
+                return saida
+        chamadas.append(nome)
+        params = types.CallToolRequestParams(
+            name=nome, arguments=argumentos, _meta=types.RequestParams.Meta(**injetar_contexto())
+        )
+        resultado = await session.send_request(
+            types.ClientRequest(types.CallToolRequest(method="tools/call", params=params)),
+            types.CallToolResult
+        )
+        textos = [c.text for c in resultado.content if isinstance(c, types.TextContent)]
+        saida = textos[0] if len(textos) == 1 else textos
+        if resultado.isError:
+            raise ToolException(saida)
+        if memoria is not None:
+            memoria.registrar_ferramenta(nome, argumentos, saida)
+        return saida
+
+    return [
+        StructuredTool(
+            name=t.name,
+            description=t.description,
+            args_schema=t.args_schema,
+            coroutine=lambda nome=t.name, **argumentos: chamar(nome, argumentos)
+        )
+        for t in tools
+    ]
 
 # Define the language model
 llm = ChatOCIGenAI(
@@ -49,6 +90,14 @@ llm = ChatOCIGenAI(
     model_kwargs={"temperature": 0.1, "top_p": 0.75, "max_tokens": 2000}
 )
 
+async def resumir_conversa(transcricao):
+    """Resumo contínuo dos turnos que saem do histórico da memória."""
+    resposta = await llm.ainvoke([
+        SystemMessage(content=PROMPT_RESUMO.format(palavras=RESUMO_MAX_TOKENS * 3 // 4)),
+        HumanMessage(content=transcricao)
+    ])
+    return resposta.content
+
 # Prompt
 prompt = ChatPromptTemplate.from_messages([
     ("system", """Você é um agente responsável por resolver inconsistências em notas fiscais de devolução de clientes.
@@ -60,12 +109,19 @@ prompt = ChatPromptTemplate.from_messages([
     2. Primeiro, utilize a ferramenta de **busca vetorial ou fuzzy** para encontrar o **EAN mais provável**, 
     a partir da descrição fornecida pelo cliente. O atributo codigo vindo do resultado da lista de busca vetorial 
     pode ser entendida como EAN.
-       - Ferramentas: `buscar_produto_vetorizado` ou `resolve_ean`
+       - Ferramenta preferencial: `buscar_produto_hibrido`, que já combina busca vetorial, léxica/fonética e fuzzy
+       em uma única chamada; o primeiro item de `resultados` é o EAN mais provável.
+       - Alternativas: `buscar_produto_vetorizado` ou `resolve_ean`
        - Retorne o EAN mais provável com sua descrição e grau de similaridade.
-       Use resolve_ean para obter o EAN mais provável. Se retornar um dicionário com erro, interrompa a operação.
+       Se a ferramenta retornar um dicionário com erro e sem resultados, interrompa a operação.
     3. Só após encontrar um EAN válido, use a ferramenta `buscar_notas_por_criterios` para procurar a nota fiscal de saída
      original.
        - Use o EAN junto com cliente, preço e local (estado) para fazer a busca.
+       - Passe `limite` (ex.: 10) para receber só as linhas mais próximas do preço e mais recentes; se
+       `mais_resultados` vier verdadeiro, peça a próxima página com `deslocamento` apenas se necessário.
+    4. Em perguntas de continuação, reaproveite os EANs e notas já resolvidos nesta sessão (listados no
+    contexto da conversa). Saídas longas aparecem como referências `ref-N`; use `consultar_memoria`
+    só se precisar do conteúdo completo.
     
     ### Exemplo de entrada:
     ```json
@@ -91,15 +147,7 @@ prompt = ChatPromptTemplate.from_messages([
 
 # Run the client with the MCP server
 async def main():
-    async with MultiServerMCPClient(
-            {
-                "InvoiceItemResolver": {
-                    "command": "python",
-                    "args": ["server_nf_items.py"],
-                    "transport": "stdio",
-                },
-            }
-    ) as client:
+    async with MultiServerMCPClient(configuracao_cliente()) as client:
         tools = client.get_tools()
         if not tools:
             print("❌ No MCP tools were loaded. Please check if the server is running.")
@@ -107,12 +155,24 @@ async def main():
 
         print("🛠️ Loaded tools:", [t.name for t in tools])
 
-        # Creating the LangGraph agent with in-memory state
-        memory_state = MemoryState()
+        # Memória da sessão: histórico com orçamento de tokens, resumo dos turnos antigos e consultas já feitas
+        memoria = MemoriaConversa(resumidor=resumir_conversa)
+
+        chamadas = []
+        tools = ferramentas_com_contexto(tools, client.sessions["InvoiceItemResolver"], chamadas, memoria)
+
+        ferramentas = {t.name: t for t in tools}
+        fast_path_disponivel = FAST_PATH_ATIVO and {"resolve_ean", "buscar_notas_por_criterios"} <= ferramentas.keys()
+
+        consultar_memoria = StructuredTool.from_function(
+            func=memoria.expandir,
+            name="consultar_memoria",
+            description="Retorna o conteúdo completo de uma saída de ferramenta resumida como referência (ex.: \"ref-3\")."
+        )
 
         agent_executor = create_react_agent(
             model=llm,
-            tools=tools,
+            tools=tools + [consultar_memoria],
             prompt=prompt,
         )
 
@@ -124,43 +184,57 @@ async def main():
             if not query.strip():
                 continue
 
-            memory_state.messages.append(HumanMessage(content=query))
-            try:
-                result = await agent_executor.ainvoke({"messages": memory_state.messages})
-                new_messages = result.get("messages", [])
-
-                # Store new messages
-                # memory_state.messages.extend(new_messages)
-                memory_state.messages = []
-
-                print("Assist:", new_messages[-1].content)
-
-                formatted_messages = prompt.format_messages()
-
-                # Convertendo cada mensagem em string
-                formatted_messages_str = "\n".join([str(msg) for msg in formatted_messages])
-                with tracer.start_as_current_span("Server NF Items") as span:
-                    # Anexa o prompt e resposta como atributos no trace
-                    span.set_attribute("llm.prompt", formatted_messages_str)
-                    span.set_attribute("llm.response", new_messages[-1].content)
-                    span.set_attribute("llm.model", "ocigenai")
-
-                    executed_tools = []
-                    if "intermediate_steps" in result:
-                        for step in result["intermediate_steps"]:
-                            tool_call = step.get("tool_input") or step.get("action")
-                            if tool_call:
-                                tool_name = tool_call.get("tool") or step.get("tool")
-                                if tool_name:
-                                    executed_tools.append(tool_name)
-
-                    if not executed_tools:
-                        executed_tools = [t.name for t in tools]  # fallback
-
-                    span.set_attribute("llm.executed_tools", ", ".join(executed_tools))
-
-            except Exception as e:
-                print("Error:", e)
+            # Um trace por consulta; as chamadas às ferramentas propagam o contexto para o servidor MCP
+            chamadas.clear()
+            with tracer.start_as_current_span("Atendimento"):
+                # Fast path: nota de devolução estruturada resolvida direto nas ferramentas, sem o LLM
+                motivo_fallback = None
+                entrada = detectar_entrada_estruturada(query) if fast_path_disponivel else None
+                if entrada:
+                    try:
+                        resposta, detalhes = await executar_fast_path(entrada, ferramentas)
+                    except Exception as e:
+                        resposta, detalhes = None, {"motivo": f"erro: {e}", "ferramentas": []}
+                    if resposta:
+                        print("Assist:", resposta)
+                        await memoria.registrar_resposta(query, resposta)
+                        with tracer.start_as_current_span("Server NF Items") as span:
+                            span.set_attribute("pipeline.caminho", "fast_path")
+                            span.set_attribute("llm.response", resposta)
+                            span.set_attribute("llm.executed_tools", ", ".join(detalhes["ferramentas"]))
+                        continue
+                    motivo_fallback = detalhes.get("motivo")
+                    print(f"↪️ Fast path não concluiu ({motivo_fallback}); usando o agente.")
+
+                try:
+                    entrada = memoria.mensagens(query)
+                    result = await agent_executor.ainvoke({"messages": entrada})
+                    new_messages = result.get("messages", [])
+
+                    # Guarda o turno (saídas grandes viram referências) e resume os antigos se passar do orçamento
+                    await memoria.registrar_turno(entrada, new_messages)
+
+                    print("Assist:", new_messages[-1].content)
+
+                    formatted_messages = prompt.format_messages()
+
+                    # Convertendo cada mensagem em string
+                    formatted_messages_str = "\n".join([str(msg) for msg in formatted_messages])
+                    with tracer.start_as_current_span("Server NF Items") as span:
+                        # Anexa o prompt e resposta como atributos no trace
+                        span.set_attribute("llm.prompt", formatted_messages_str)
+                        span.set_attribute("llm.response", new_messages[-1].content)
+                        span.set_attribute("llm.model", "ocigenai")
+                        span.set_attribute("pipeline.caminho", "agente")
+                        if motivo_fallback:
+                            span.set_attribute("pipeline.motivo_fallback", motivo_fallback)
+
+                        span.set_attribute("llm.executed_tools", ", ".join(chamadas))
+                        span.set_attribute("memoria.tokens_estimados", memoria.tokens())
+                        span.set_attribute("memoria.turnos", len(memoria.turnos))
+
+                except Exception as e:
+                    print("Error:", e)
 
 # Run the agent with asyncio
 if __name__ == "__main__":
@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+import os
+import array
+import numpy as np
+import db_pool
+import vector_snapshot
+from fuzzy_index import IndiceFuzzy
+
+# === CONFIGURAÇÃO DO MOTOR VETORIAL NO ORACLE 23ai ===
+# Onde process_vector_products grava o embedding: blob (vetor) | vector (vetor_nativo) | ambos
+ARMAZENAMENTO_VETOR = os.environ.get("VETOR_ARMAZENAMENTO", "blob")
+ORGANIZACAO_INDICE = os.environ.get("ORACLE_INDICE_VETORIAL", "hnsw")       # hnsw | ivf
+PRECISAO_ALVO = int(os.environ.get("ORACLE_PRECISAO_ALVO", "95"))           # TARGET ACCURACY (%)
+FETCH_ARRAYSIZE = 5000
+
+_ORGANIZACOES = {
+    "hnsw": "ORGANIZATION INMEMORY NEIGHBOR GRAPH",
+    "ivf": "ORGANIZATION NEIGHBOR PARTITIONS",
+}
+
+_CONSULTA_TOP_K = """
+    SELECT id, codigo, descricao, VECTOR_DISTANCE(vetor_nativo, :consulta, EUCLIDEAN) AS distancia
+    FROM embeddings_produtos
+    WHERE vetor_nativo IS NOT NULL
+    ORDER BY VECTOR_DISTANCE(vetor_nativo, :consulta, EUCLIDEAN)
+    FETCH {modo} FIRST :k ROWS ONLY{precisao}
+"""
+CONSULTA_APROXIMADA = _CONSULTA_TOP_K.format(modo="APPROX", precisao=f" WITH TARGET ACCURACY {PRECISAO_ALVO}")
+CONSULTA_EXATA = _CONSULTA_TOP_K.format(modo="EXACT", precisao="")
+
+
+def grava_blob():
+    return ARMAZENAMENTO_VETOR in ("blob", "ambos")
+
+
+def grava_vector():
+    return ARMAZENAMENTO_VETOR in ("vector", "ambos")
+
+
+def como_vector(vetor):
+    """Bind de uma coluna VECTOR(*, FLOAT32): o oracledb aceita array.array('f')."""
+    return array.array("f", np.asarray(vetor, dtype=np.float32).tobytes())
+
+
+def preparar_coluna(cursor):
+    """Coluna VECTOR e índice vetorial em embeddings_produtos (idempotente)."""
+    cursor.execute("""
+                   BEGIN
+                       EXECUTE IMMEDIATE 'ALTER TABLE embeddings_produtos ADD (vetor_nativo VECTOR(*, FLOAT32))';
+                   EXCEPTION
+                       WHEN OTHERS THEN
+                           IF SQLCODE != -1430 THEN
+                               RAISE;
+                           END IF;
+                   END;
+                   """)
+
+
+def criar_indice_vetorial(cursor):
+    """Cria o índice HNSW (INMEMORY NEIGHBOR GRAPH) ou IVF (NEIGHBOR PARTITIONS), se ainda não existir."""
+    cursor.execute(f"""
+                   BEGIN
+                       EXECUTE IMMEDIATE '
+                CREATE VECTOR INDEX idx_embeddings_vetor_nativo ON embeddings_produtos (vetor_nativo)
+                {_ORGANIZACOES[ORGANIZACAO_INDICE]}
+                DISTANCE EUCLIDEAN WITH TARGET ACCURACY {PRECISAO_ALVO}';
+                   EXCEPTION
+                       WHEN OTHERS THEN
+                           IF SQLCODE != -955 THEN
+                               RAISE;
+                           END IF;
+                   END;
+                   """)
+
+
+class CatalogoOracle:
+    """
+    Catálogo com a busca vetorial no banco (VECTOR_DISTANCE + FETCH APPROX sobre o índice
+    vetorial), para que o processo do servidor não precise dos vetores em memória.
+    Só id, código e descrição ficam carregados, para a correção de input e o fallback fuzzy.
+    Mesma interface de CatalogoVetorial, mas o "índice" de cada resultado é o id do produto.
+    """
+    vetores = None
+    indice = None
+    tamanho_delta = 0
+
+    def __init__(self, produtos, indice_fuzzy, watermark):
+        self._ids = [produto["id"] for produto in produtos]
+        self.produtos = {produto["id"]: produto for produto in produtos}
+        self.indice_fuzzy = indice_fuzzy
+        self.watermark = watermark
+
+    def __len__(self):
+        return len(self._ids)
+
+    def _top_k(self, cursor, consulta, k, sql=CONSULTA_APROXIMADA):
+        cursor.execute(sql, {"consulta": como_vector(consulta), "k": int(k)})
+        linhas = []
+        for id_, codigo, descricao, distancia in cursor:
+            # Produto gravado depois da carga das descrições: entra no mapa para montar o resultado
+            self.produtos.setdefault(id_, {"id": id_, "codigo": codigo, "descricao": descricao})
+            linhas.append((distancia, id_))
+        # Desempate pelo id aqui e não no ORDER BY: outra chave de ordenação impede o FETCH APPROX
+        # de usar o índice vetorial (vira ordenação exata da tabela inteira)
+        linhas.sort()
+        return (np.array([id_ for _, id_ in linhas], dtype=np.int64),
+                np.array([distancia for distancia, _ in linhas], dtype=np.float64))
+
+    def buscar(self, consulta, k):
+        with db_pool.conexao() as connection:
+            cursor = connection.cursor()
+            resultado = self._top_k(cursor, consulta, k)
+            cursor.close()
+        return resultado
+
+    def buscar_lote(self, consultas, k):
+        with db_pool.conexao() as connection:
+            cursor = connection.cursor()
+            resultados = [self._top_k(cursor, consulta, k) for consulta in np.asarray(consultas)]
+            cursor.close()
+        return [r[0] for r in resultados], [r[1] for r in resultados]
+
+    def corrigir(self, texto, cutoff=0.6):
+        return self.indice_fuzzy.corrigir(texto, cutoff)
+
+    def melhores_fuzzy(self, texto, k):
+        return [(self._ids[pos], score) for pos, score in self.indice_fuzzy.melhores_fuzzy(texto, k)]
+
+    def medir_recall(self, amostras=100, k=5, seed=42):
+        """Recall@k de FETCH APPROX contra FETCH EXACT, usando vetores do próprio catálogo como consulta."""
+        if not self._ids:
+            return None
+        rng = np.random.default_rng(seed)
+        ids = rng.choice(self._ids, size=min(amostras, len(self._ids)), replace=False).tolist()
+        acertos = total = 0
+        with db_pool.conexao() as connection:
+            cursor = connection.cursor()
+            for id_ in ids:
+                cursor.execute("SELECT vetor_nativo FROM embeddings_produtos WHERE id = :id", {"id": id_})
+                linha = cursor.fetchone()
+                if linha is None or linha[0] is None:
+                    continue
+                consulta = np.frombuffer(bytes(linha[0]), dtype=np.float32) \
+                    if isinstance(linha[0], (bytes, bytearray)) else np.asarray(linha[0], dtype=np.float32)
+                esperado, _ = self._top_k(cursor, consulta, k, CONSULTA_EXATA)
+                obtido, _ = self._top_k(cursor, consulta, k)
+                acertos += len(set(esperado.tolist()) & set(obtido.tolist()))
+                total += len(esperado)
+            cursor.close()
+        return acertos / total if total else None
+
+
+def carregar_catalogo():
+    """Lê só as descrições (sem vetores) e o watermark de embeddings_produtos."""
+    with db_pool.conexao() as connection:
+        cursor = connection.cursor()
+        watermark = vector_snapshot.ler_watermark(cursor)
+        cursor.arraysize = FETCH_ARRAYSIZE
+        cursor.execute("SELECT id, codigo, descricao FROM embeddings_produtos ORDER BY id")
+        produtos = [{"id": id_, "codigo": codigo, "descricao": descricao} for id_, codigo, descricao in cursor]
+        cursor.close()
+    return CatalogoOracle(produtos, IndiceFuzzy([p["descricao"] for p in produtos]), watermark)
@@ -1,82 +1,246 @@
-import oracledb
 import os
-from sentence_transformers import SentenceTransformer
+import argparse
+import hashlib
+import queue
+import threading
+import time
 import numpy as np
+import db_pool
+import oracle_vector
+from vector_snapshot import FORMATO_VETOR, FORMATOS_VETOR
 
-# === CONFIGURAÇÃO ORACLE COM WALLET ===
-WALLET_PATH = "/WALLET_PATH/Wallet_oradb23ai"
-DB_ALIAS = "oradb23ai_high"
-USERNAME = "USER"
-PASSWORD = "Password"
-
-os.environ["TNS_ADMIN"] = WALLET_PATH
-
-# === CONECTANDO USANDO oracledb (modo thin) ===
-connection = oracledb.connect(
-    user=USERNAME,
-    password=PASSWORD,
-    dsn=DB_ALIAS,
-    config_dir=WALLET_PATH,
-    wallet_location=WALLET_PATH,
-    wallet_password=PASSWORD
-)
-
-cursor = connection.cursor()
-
-# === CONSULTA A TABELA DE PRODUTOS ===
-cursor.execute("SELECT id, codigo, descricao FROM produtos")
-rows = cursor.fetchall()
-
-ids = []
-descricoes = []
-
-for row in rows:
-    ids.append((row[0], row[1], row[2]))
-    descricoes.append(row[2])
-
-# === GERAÇÃO DOS EMBEDDINGS ===
-model = SentenceTransformer('all-MiniLM-L6-v2')
-embeddings = model.encode(descricoes, convert_to_numpy=True)
-
-# === CRIAÇÃO DA TABELA DE EMBEDDINGS (caso não exista) ===
-cursor.execute("""
-               BEGIN
-                   EXECUTE IMMEDIATE '
-            CREATE TABLE embeddings_produtos (
-                id NUMBER PRIMARY KEY,
-                codigo VARCHAR2(100),
-                descricao VARCHAR2(4000),
-                vetor BLOB
-            )';
-               EXCEPTION
-                   WHEN OTHERS THEN
-                       IF SQLCODE != -955 THEN
-                           RAISE;
-                       END IF;
-               END;
-               """)
-
-# === INSERÇÃO OU ATUALIZAÇÃO DOS DADOS ===
-for (id_, codigo, descricao), vetor in zip(ids, embeddings):
-    vetor_bytes = vetor.astype(np.float32).tobytes()
+# === CONFIGURAÇÃO DO PIPELINE ===
+FETCH_ARRAYSIZE = 5000      # Linhas por round trip na leitura de produtos
+LOTE_ENCODE = 512           # Descrições por chamada ao SentenceTransformer.encode
+BATCH_SIZE_MODELO = 64      # batch_size interno do modelo
+FILA_MAX = 4                # Lotes em espera entre os estágios (controle de memória)
+EMBEDDINGS_PROVEDOR = os.environ.get("EMBEDDINGS_PROVEDOR", "sentence_transformers")   # ou "fake" (offline)
+
+FIM = object()
+
+
+def hash_descricao(descricao):
+    # Formatos além do float32 e o armazenamento VECTOR entram no hash: trocar VETOR_FORMATO
+    # ou VETOR_ARMAZENAMENTO regrava todos os vetores
+    prefixo = "" if FORMATO_VETOR == "float32" else f"{FORMATO_VETOR}:"
+    if oracle_vector.ARMAZENAMENTO_VETOR != "blob":
+        prefixo += f"{oracle_vector.ARMAZENAMENTO_VETOR}:"
+    return hashlib.sha256(f"{prefixo}{descricao or ''}".encode("utf-8")).hexdigest()
+
+
+def preparar_tabela(cursor):
+    # === CRIAÇÃO DA TABELA DE EMBEDDINGS (caso não exista) ===
+    cursor.execute("""
+                   BEGIN
+                       EXECUTE IMMEDIATE '
+                CREATE TABLE embeddings_produtos (
+                    id NUMBER PRIMARY KEY,
+                    codigo VARCHAR2(100),
+                    descricao VARCHAR2(4000),
+                    vetor BLOB,
+                    hash_descricao VARCHAR2(64)
+                )';
+                   EXCEPTION
+                       WHEN OTHERS THEN
+                           IF SQLCODE != -955 THEN
+                               RAISE;
+                           END IF;
+                   END;
+                   """)
+    # Tabelas criadas por versões anteriores não têm a coluna de hash
     cursor.execute("""
+                   BEGIN
+                       EXECUTE IMMEDIATE 'ALTER TABLE embeddings_produtos ADD (hash_descricao VARCHAR2(64))';
+                   EXCEPTION
+                       WHEN OTHERS THEN
+                           IF SQLCODE != -1430 THEN
+                               RAISE;
+                           END IF;
+                   END;
+                   """)
+    # Coluna VECTOR nativa (Oracle 23ai) para o motor vetorial "oracle"
+    if oracle_vector.grava_vector():
+        oracle_vector.preparar_coluna(cursor)
+
+
+def _sql_merge():
+    # Só as colunas do armazenamento configurado: com "vector", o BLOB fica de fora
+    colunas = ["codigo", "descricao"]
+    if oracle_vector.grava_blob():
+        colunas.append("vetor")
+    if oracle_vector.grava_vector():
+        colunas.append("vetor_nativo")
+    colunas.append("hash_descricao")
+    return f"""
         MERGE INTO embeddings_produtos tgt
         USING (SELECT :id AS id FROM dual) src
         ON (tgt.id = src.id)
         WHEN MATCHED THEN
-            UPDATE SET codigo = :codigo, descricao = :descricao, vetor = :vetor
+            UPDATE SET {", ".join(f"{c} = :{c}" for c in colunas)}
         WHEN NOT MATCHED THEN
-            INSERT (id, codigo, descricao, vetor)
-            VALUES (:id, :codigo, :descricao, :vetor)
-    """, {
-        "id": id_,
-        "codigo": codigo,
-        "descricao": descricao,
-        "vetor": vetor_bytes
-    })
-
-connection.commit()
-cursor.close()
-connection.close()
-
-print("✅ Vetores gravados com sucesso no banco Oracle.")
\ No newline at end of file
+            INSERT (id, {", ".join(colunas)})
+            VALUES (:id, {", ".join(f":{c}" for c in colunas)})
+    """
+
+
+def _linha_merge(id_, codigo, descricao, hash_novo, vetor):
+    linha = {"id": id_, "codigo": codigo, "descricao": descricao, "hash_descricao": hash_novo}
+    if oracle_vector.grava_blob():
+        linha["vetor"] = vetor.astype(FORMATOS_VETOR[FORMATO_VETOR]).tobytes()
+    if oracle_vector.grava_vector():
+        linha["vetor_nativo"] = oracle_vector.como_vector(vetor)
+    return linha
+
+
+def _colocar(fila, item, parar):
+    """put() na fila limitada que desiste quando `parar` é sinalizado (consumidor encerrado)."""
+    while not parar.is_set():
+        try:
+            fila.put(item, timeout=0.5)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+
+def ler_produtos(fila, estatisticas, completo, erros, parar):
+    """Estágio 1: leitura em streaming, descartando produtos cujo embedding já está atualizado."""
+    try:
+        with db_pool.conexao() as connection:
+            cursor = connection.cursor()
+            cursor.arraysize = FETCH_ARRAYSIZE
+            cursor.prefetchrows = FETCH_ARRAYSIZE + 1
+            cursor.execute("""
+                SELECT p.id, p.codigo, p.descricao, e.codigo, e.hash_descricao
+                FROM produtos p
+                LEFT JOIN embeddings_produtos e ON e.id = p.id
+            """)
+            lote = []
+            for id_, codigo, descricao, codigo_atual, hash_atual in cursor:
+                estatisticas["lidos"] += 1
+                hash_novo = hash_descricao(descricao)
+                if not completo and hash_atual == hash_novo and codigo_atual == codigo:
+                    continue
+                lote.append((id_, codigo, descricao, hash_novo))
+                if len(lote) >= LOTE_ENCODE:
+                    if not _colocar(fila, lote, parar):
+                        break
+                    lote = []
+            if lote:
+                _colocar(fila, lote, parar)
+            cursor.close()
+    except Exception as e:
+        erros.append(e)
+    finally:
+        _colocar(fila, FIM, parar)
+
+
+def gravar_embeddings(fila, estatisticas, erros):
+    """Estágio 3: MERGE em lote (executemany), um commit por lote."""
+    try:
+        with db_pool.conexao() as connection:
+            cursor = connection.cursor()
+            sql_merge = _sql_merge()
+            while True:
+                item = fila.get()
+                if item is FIM:
+                    break
+                lote, embeddings = item
+                cursor.executemany(sql_merge, [
+                    _linha_merge(id_, codigo, descricao, hash_novo, vetor)
+                    for (id_, codigo, descricao, hash_novo), vetor in zip(lote, embeddings)
+                ])
+                connection.commit()
+                estatisticas["gravados"] += len(lote)
+            cursor.close()
+    except Exception as e:
+        erros.append(e)
+        # Esvazia a fila para não travar o estágio de encode
+        while fila.get() is not FIM:
+            pass
+
+
+def criar_modelo():
+    if EMBEDDINGS_PROVEDOR == "fake":
+        from fake_embeddings import EmbeddingsFake
+        return EmbeddingsFake()
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer('all-MiniLM-L6-v2')
+
+
+def main(completo=False):
+    with db_pool.conexao() as connection:
+        cursor = connection.cursor()
+        preparar_tabela(cursor)
+        cursor.close()
+
+    model = criar_modelo()
+
+    estatisticas = {"lidos": 0, "codificados": 0, "gravados": 0}
+    erros = []
+    fila_leitura = queue.Queue(maxsize=FILA_MAX)
+    fila_gravacao = queue.Queue(maxsize=FILA_MAX)
+
+    inicio = time.perf_counter()
+    parar = threading.Event()
+    leitor = threading.Thread(target=ler_produtos, args=(fila_leitura, estatisticas, completo, erros, parar), daemon=True)
+    gravador = threading.Thread(target=gravar_embeddings, args=(fila_gravacao, estatisticas, erros), daemon=True)
+    leitor.start()
+    gravador.start()
+
+    # === ESTÁGIO 2: GERAÇÃO DOS EMBEDDINGS (enquanto leitura e gravação seguem em paralelo) ===
+    tempo_encode = 0.0
+    try:
+        while True:
+            lote = fila_leitura.get()
+            if lote is FIM:
+                break
+            if erros:
+                continue
+            t0 = time.perf_counter()
+            embeddings = model.encode(
+                [descricao for _, _, descricao, _ in lote],
+                batch_size=BATCH_SIZE_MODELO,
+                convert_to_numpy=True
+            )
+            tempo_encode += time.perf_counter() - t0
+            estatisticas["codificados"] += len(lote)
+            fila_gravacao.put((lote, embeddings))
+    finally:
+        # Se o encode falhou, ninguém mais consome fila_leitura: o leitor pode estar bloqueado no put
+        parar.set()
+        while leitor.is_alive():
+            try:
+                fila_leitura.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        leitor.join()
+        fila_gravacao.put(FIM)
+        gravador.join()
+
+    if not erros and oracle_vector.grava_vector():
+        # Índice criado depois da carga: construir o grafo/partições uma vez é mais barato que manter a cada MERGE
+        with db_pool.conexao() as connection:
+            cursor = connection.cursor()
+            oracle_vector.criar_indice_vetorial(cursor)
+            cursor.close()
+
+    total = time.perf_counter() - inicio
+    if erros:
+        raise erros[0]
+
+    print(f"📊 Lidos: {estatisticas['lidos']} | Re-embedados: {estatisticas['codificados']} "
+          f"| Gravados: {estatisticas['gravados']} | Tempo: {total:.1f}s")
+    if total > 0:
+        print(f"↳ Leitura: {estatisticas['lidos'] / total:.0f} linhas/s "
+              f"| Gravação: {estatisticas['gravados'] / total:.0f} linhas/s"
+              + (f" | Encode: {estatisticas['codificados'] / tempo_encode:.0f} linhas/s" if tempo_encode else ""))
+    print("✅ Vetores gravados com sucesso no banco Oracle.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Gera e grava embeddings dos produtos no Oracle.")
+    parser.add_argument("--completo", action="store_true",
+                        help="Re-gera os embeddings de todos os produtos, ignorando o hash da descrição")
+    args = parser.parse_args()
+    main(completo=args.completo)
@@ -1,9 +1,25 @@
 import os
-import oracledb
+import time
+import asyncio
+import threading
 import numpy as np
-import difflib
-from rapidfuzz import fuzz
-from langchain_community.embeddings import OCIGenAIEmbeddings
+import db_pool
+import telemetria
+import vector_index
+import vector_snapshot
+import oracle_vector
+from embedding_cache import CacheEmbeddings
+from fuzzy_index import IndiceFuzzy
+from vector_catalog import CatalogoVetorial
+
+# === CONFIGURAÇÃO ===
+# "oci" (OCI Generative AI) ou "fake" (embedder determinístico local, usado no benchmark offline)
+EMBEDDINGS_PROVEDOR = os.environ.get("EMBEDDINGS_PROVEDOR", "oci")
+# Atualização incremental dos vetores (embeddings_produtos) sem reiniciar o servidor
+INTERVALO_ATUALIZACAO = float(os.environ.get("INDICE_VETORIAL_INTERVALO", "300"))   # segundos; 0 = só pela ferramenta
+MAX_DELTA = int(os.environ.get("INDICE_VETORIAL_MAX_DELTA", "10000"))              # acima disso, recarga completa
+# "memoria" (snapshot + índice no processo) ou "oracle" (VECTOR_DISTANCE no Oracle 23ai, ver oracle_vector.py)
+MOTOR_VETORIAL = os.environ.get("MOTOR_VETORIAL", "memoria")
 
 
 class BuscaProdutoSimilar:
@@ -15,57 +31,180 @@ class BuscaProdutoSimilar:
             service_endpoint="https://inference.generativeai.us-chicago-1.oci.oraclecloud.com",
             compartment_id="ocid1.compartment.oc1..aaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaa",
             auth_profile="DEFAULT",
-            wallet_path="/WALLET_PATH/Wallet_oradb23ai",
-            db_alias="oradb23ai_high",
-            username="USER",
-            password="Password"
+            wallet_path=db_pool.WALLET_PATH,
+            db_alias=db_pool.DB_ALIAS,
+            username=db_pool.USERNAME,
+            password=db_pool.PASSWORD,
+            modo_indice=vector_index.MODO_INDICE,
+            cache_embeddings=None,
+            carregar_em_background=False,
+            embedding=None,
+            intervalo_atualizacao=INTERVALO_ATUALIZACAO,
+            motor_vetorial=MOTOR_VETORIAL
     ):
-        os.environ["TNS_ADMIN"] = wallet_path
-        self.conn = oracledb.connect(
-            user=username,
-            password=password,
-            dsn=db_alias,
-            config_dir=wallet_path,
-            wallet_location=wallet_path,
-            wallet_password=password
-        )
+        # Usa o mesmo pool de conexões das ferramentas MCP
+        self.pool = db_pool.obter_pool(wallet_path, db_alias, username, password)
         self.top_k = top_k
+        self.modo_indice = modo_indice
+        self.motor_vetorial = motor_vetorial
         self.distancia_minima = distancia_minima
-        self.embedding = OCIGenAIEmbeddings(
-            model_id=model_id,
-            service_endpoint=service_endpoint,
-            compartment_id=compartment_id,
-            auth_profile=auth_profile
-        )
+        if embedding is not None:
+            self.embedding = embedding
+        elif EMBEDDINGS_PROVEDOR == "fake":
+            from fake_embeddings import EmbeddingsFake
+            self.embedding = EmbeddingsFake()
+        else:
+            from langchain_community.embeddings import OCIGenAIEmbeddings
+            self.embedding = OCIGenAIEmbeddings(
+                model_id=model_id,
+                service_endpoint=service_endpoint,
+                compartment_id=compartment_id,
+                auth_profile=auth_profile
+            )
+        # O cache persistido só vale para o mesmo provedor/modelo (a dimensão é conferida pelo cache)
+        self.cache_embeddings = cache_embeddings or CacheEmbeddings(modelo=self._identificar_modelo(embedding))
 
-        print("📦 Carregando vetores do Oracle...")
-        self._carregar_embeddings()
-
-    def _carregar_embeddings(self):
-        cursor = self.conn.cursor()
-        cursor.execute("SELECT id, codigo, descricao, vetor FROM embeddings_produtos")
-        self.vetores = []
-        self.produtos = []
-        for row in cursor.fetchall():
-            id_, codigo, descricao, blob = row
-            vetor = np.frombuffer(blob.read(), dtype=np.float32)
-            self.vetores.append(vetor)
-            self.produtos.append({
-                "id": id_,
-                "codigo": codigo,
-                "descricao": descricao
-            })
-        self.vetores = np.array(self.vetores)
+        self.intervalo_atualizacao = intervalo_atualizacao
+        self.catalogo = None
+        self.versao = 0                  # incrementada a cada troca do catálogo (invalida o cache de resultados)
+        self._lock_carga = threading.Lock()
+        self._lock_atualizacao = threading.Lock()
+        self._carregado = False
+        if carregar_em_background:
+            # Não bloqueia quem cria o buscador (ex.: handshake do servidor MCP)
+            threading.Thread(target=self._garantir_carregado, daemon=True).start()
+        else:
+            self._garantir_carregado()
 
-    def _corrigir_input(self, input_usuario):
-        descricoes = [p["descricao"] for p in self.produtos]
-        sugestoes = difflib.get_close_matches(input_usuario, descricoes, n=1, cutoff=0.6)
-        return sugestoes[0] if sugestoes else input_usuario
+    def _identificar_modelo(self, embedding):
+        if embedding is not None:
+            return f"{type(embedding).__name__}:{getattr(embedding, 'model_id', '')}"
+        if EMBEDDINGS_PROVEDOR == "fake":
+            return f"fake:{self.embedding.dimensao}"
+        return f"{EMBEDDINGS_PROVEDOR}:{self.embedding.model_id}"
 
-    def buscar_produtos_similares(self, descricao_input):
-        descricao_input = descricao_input.strip()
-        descricao_corrigida = self._corrigir_input(descricao_input)
+    def _garantir_carregado(self):
+        """Carrega os vetores na primeira necessidade; chamadas concorrentes aguardam a mesma carga."""
+        if self._carregado:
+            return
+        with self._lock_carga:
+            if not self._carregado:
+                print("📦 Carregando vetores do Oracle...")
+                self.catalogo = self._carregar_embeddings()
+                self.versao += 1
+                self._carregado = True
+                self.iniciar_atualizacao_periodica()
+
+    def iniciar_atualizacao_periodica(self, intervalo=None):
+        """Thread de atualização do índice; o servidor HTTP chama de novo em cada worker, já que threads não passam pelo fork."""
+        if intervalo is not None:
+            self.intervalo_atualizacao = intervalo
+        if self.intervalo_atualizacao > 0:
+            threading.Thread(target=self._atualizar_periodicamente, daemon=True).start()
+
+    def _carregar_embeddings(self, forcar=False):
+        if self.motor_vetorial == "oracle":
+            return oracle_vector.carregar_catalogo()
+        vetores, produtos, watermark, regravado = vector_snapshot.carregar_snapshot(forcar=forcar)
+        indice = vector_index.criar_indice(vetores, self.modo_indice, reconstruir=regravado)
+        indice_fuzzy = IndiceFuzzy([p["descricao"] for p in produtos])
+        return CatalogoVetorial(vetores, produtos, indice, indice_fuzzy, watermark)
+
+    # Atalhos para o catálogo atual (a base do snapshot; o delta fica em self.catalogo)
+    @property
+    def vetores(self):
+        return self.catalogo.vetores
+
+    @property
+    def produtos(self):
+        return self.catalogo.produtos
+
+    @property
+    def indice(self):
+        return self.catalogo.indice
+
+    def atualizar_indice(self, completo=False):
+        """
+        Aplica as mudanças de embeddings_produtos desde o último watermark: produtos novos
+        ou alterados entram no delta do catálogo; remoções, delta acima de MAX_DELTA ou
+        `completo` disparam a recarga do snapshot. O catálogo novo é montado à parte e
+        trocado de uma vez, sem bloquear as consultas.
+        """
+        self._garantir_carregado()
+        with self._lock_atualizacao:
+            atual = self.catalogo
+            if self.motor_vetorial == "oracle":
+                # Os vetores já são consultados no banco: só as descrições do fuzzy precisam acompanhar
+                with db_pool.conexao() as connection:
+                    cursor = connection.cursor()
+                    watermark = vector_snapshot.ler_watermark(cursor)
+                    cursor.close()
+                if watermark == atual.watermark and not completo:
+                    return {"atualizado": False, "produtos": len(atual), "delta": 0}
+                completo = True
+            elif not completo:
+                with db_pool.conexao() as connection:
+                    cursor = connection.cursor()
+                    watermark, linhas = vector_snapshot.ler_delta(cursor, atual.watermark)
+                    cursor.close()
+                if watermark == atual.watermark:
+                    return {"atualizado": False, "produtos": len(atual), "delta": atual.tamanho_delta}
+                novo = atual.com_delta(linhas, watermark)
+                # COUNT(*) diferente dos produtos visíveis indica remoções, que o delta não representa
+                completo = novo.tamanho_delta > MAX_DELTA or watermark[0] != len(novo)
+            if completo:
+                novo = self._carregar_embeddings(forcar=True)
+            self.catalogo = novo
+            self.versao += 1
+            return {
+                "atualizado": True,
+                "recarga_completa": completo,
+                "produtos": len(novo),
+                "delta": novo.tamanho_delta
+            }
+
+    def _atualizar_periodicamente(self):
+        while True:
+            time.sleep(self.intervalo_atualizacao)
+            try:
+                self.atualizar_indice()
+            except Exception as e:
+                print(f"[ERRO] Atualização do índice vetorial falhou: {e}")
 
+    def _corrigir_input(self, catalogo, input_usuario):
+        with telemetria.etapa("fuzzy.correcao") as span:
+            corrigido = catalogo.corrigir(input_usuario, cutoff=0.6)
+            span.set_attribute("fuzzy.corrigido", corrigido != input_usuario)
+        return corrigido
+
+    def _vetorial(self, catalogo, consulta_emb):
+        with telemetria.etapa("vetorial.busca", modo=self.modo_indice, k=self.top_k):
+            return catalogo.buscar(consulta_emb, self.top_k)
+
+    def _embedar(self, texto):
+        """Embedding da consulta via cache; o provedor só é chamado em caso de miss."""
+        with telemetria.etapa("embedding") as span:
+            misses = []
+
+            def calcular(t):
+                misses.append(t)
+                return self.embedding.embed_query(t)
+            vetor = self.cache_embeddings.obter(texto, calcular)
+            telemetria.registrar_cache(span, "embedding", not misses)
+        return vetor
+
+    async def _embedar_async(self, texto):
+        with telemetria.etapa("embedding") as span:
+            misses = []
+
+            async def calcular(t):
+                misses.append(t)
+                return await self.embedding.aembed_query(t)
+            vetor = await self.cache_embeddings.obter_async(texto, calcular)
+            telemetria.registrar_cache(span, "embedding", not misses)
+        return vetor
+
+    def _montar_resultado(self, catalogo, descricao_input, descricao_corrigida, top_indices, top_dists, fallback_fuzzy=True):
         resultados = {
             "consulta_original": descricao_input,
             "consulta_utilizada": descricao_corrigida,
@@ -73,39 +212,175 @@ class BuscaProdutoSimilar:
             "fallback_fuzzy": []
         }
 
-        consulta_emb = self.embedding.embed_query(descricao_corrigida)
-        consulta_emb = np.array(consulta_emb)
-
-        # Cálculo de distância euclidiana
-        dists = np.linalg.norm(self.vetores - consulta_emb, axis=1)
-        top_indices = np.argsort(dists)[:self.top_k]
-
-        for idx in top_indices:
-            dist = dists[idx]
-            if dist < self.distancia_minima:
-                match = self.produtos[idx]
-                similaridade = 1 / (1 + dist)
-                resultados["semanticos"].append({
-                    "id": match["id"],
-                    "codigo": match["codigo"],
-                    "descricao": match["descricao"],
-                    "similaridade": round(similaridade * 100, 2),
-                    "distancia": round(dist, 4)
-                })
-
-        if not resultados["semanticos"]:
-            melhores_fuzz = []
-            for produto in self.produtos:
-                score = fuzz.token_sort_ratio(descricao_corrigida, produto["descricao"])
-                melhores_fuzz.append((produto, score))
-            melhores_fuzz.sort(key=lambda x: x[1], reverse=True)
-
-            for produto, score in melhores_fuzz[:self.top_k]:
-                resultados["fallback_fuzzy"].append({
-                    "id": produto["id"],
-                    "codigo": produto["codigo"],
-                    "descricao": produto["descricao"],
-                    "score_fuzzy": round(score, 2)
-                })
-
-        return resultados
\ No newline at end of file
+        with telemetria.etapa("serializacao") as span:
+            for idx, dist in zip(top_indices, top_dists):
+                if dist < self.distancia_minima:
+                    match = catalogo.produtos[idx]
+                    similaridade = 1 / (1 + dist)
+                    resultados["semanticos"].append({
+                        "id": match["id"],
+                        "codigo": match["codigo"],
+                        "descricao": match["descricao"],
+                        "similaridade": round(similaridade * 100, 2),
+                        "distancia": round(dist, 4)
+                    })
+            span.set_attribute("semanticos", len(resultados["semanticos"]))
+
+        if fallback_fuzzy and not resultados["semanticos"]:
+            with telemetria.etapa("fuzzy.fallback", k=self.top_k):
+                resultados["fallback_fuzzy"] = self._fuzzy(catalogo, descricao_corrigida, self.top_k)
+
+        return resultados
+
+    def _fuzzy(self, catalogo, texto, k):
+        resultado = []
+        for idx, score in catalogo.melhores_fuzzy(texto, k):
+            produto = catalogo.produtos[idx]
+            resultado.append({
+                "id": produto["id"],
+                "codigo": produto["codigo"],
+                "descricao": produto["descricao"],
+                "score_fuzzy": round(score, 2)
+            })
+        return resultado
+
+    def buscar_fuzzy(self, descricao_input, k=None):
+        """Só o ranking fuzzy sobre as descrições do catálogo (retriever da busca híbrida)."""
+        self._garantir_carregado()
+        with telemetria.etapa("fuzzy.busca", k=k or self.top_k):
+            return self._fuzzy(self.catalogo, descricao_input.strip(), k or self.top_k)
+
+    def buscar_produtos_similares(self, descricao_input):
+        self._garantir_carregado()
+        catalogo = self.catalogo
+        descricao_input = descricao_input.strip()
+        descricao_corrigida = self._corrigir_input(catalogo, descricao_input)
+
+        consulta_emb = self._embedar(descricao_corrigida)
+
+        # Cálculo de distância euclidiana (top-k via índice vetorial)
+        top_indices, top_dists = self._vetorial(catalogo, consulta_emb)
+
+        return self._montar_resultado(catalogo, descricao_input, descricao_corrigida, top_indices, top_dists)
+
+    def buscar_produtos_similares_lote(self, descricoes_input):
+        """
+        Versão em lote: um único embed_documents para as consultas fora do cache
+        e uma única operação matricial contra todos os vetores.
+        """
+        self._garantir_carregado()
+        catalogo = self.catalogo
+        descricoes_input = [d.strip() for d in descricoes_input]
+        if not descricoes_input:
+            return []
+        corrigidas = [self._corrigir_input(catalogo, d) for d in descricoes_input]
+
+        with telemetria.etapa("embedding", consultas=len(corrigidas)) as span:
+            misses = []
+
+            def calcular(textos):
+                misses.extend(textos)
+                return self.embedding.embed_documents(textos)
+            consultas_emb = self.cache_embeddings.obter_lote(corrigidas, calcular)
+            span.set_attribute("embedding.cache_misses", len(misses))
+        with telemetria.etapa("vetorial.busca", modo=self.modo_indice, k=self.top_k, consultas=len(corrigidas)):
+            top_indices, top_dists = catalogo.buscar_lote(np.vstack(consultas_emb), self.top_k)
+
+        return [
+            self._montar_resultado(catalogo, original, corrigida, indices, dists)
+            for original, corrigida, indices, dists in zip(descricoes_input, corrigidas, top_indices, top_dists)
+        ]
+
+    async def buscar_produtos_similares_async(self, descricao_input, executor=None, fallback_fuzzy=True):
+        """
+        Versão assíncrona: embedding via aembed_query e o trabalho de CPU
+        (correção, busca vetorial, fuzzy) no executor informado.
+        Sem fallback_fuzzy, retorna só os resultados semânticos (retriever vetorial da busca híbrida).
+        """
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(executor, self._garantir_carregado)
+        catalogo = self.catalogo
+        descricao_input = descricao_input.strip()
+        descricao_corrigida = await loop.run_in_executor(
+            executor, telemetria.no_contexto(self._corrigir_input, catalogo, descricao_input)
+        )
+
+        consulta_emb = await self._embedar_async(descricao_corrigida)
+
+        top_indices, top_dists = await loop.run_in_executor(
+            executor, telemetria.no_contexto(self._vetorial, catalogo, consulta_emb)
+        )
+        return await loop.run_in_executor(
+            executor,
+            telemetria.no_contexto(
+                self._montar_resultado, catalogo, descricao_input, descricao_corrigida, top_indices, top_dists, fallback_fuzzy
+            )
+        )
+
+    async def buscar_produtos_similares_lote_async(self, descricoes_input, executor=None):
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(executor, self._garantir_carregado)
+        catalogo = self.catalogo
+        descricoes_input = [d.strip() for d in descricoes_input]
+        if not descricoes_input:
+            return []
+        corrigidas = await loop.run_in_executor(
+            executor, telemetria.no_contexto(lambda: [self._corrigir_input(catalogo, d) for d in descricoes_input])
+        )
+
+        with telemetria.etapa("embedding", consultas=len(corrigidas)) as span:
+            misses = []
+
+            async def calcular(textos):
+                misses.extend(textos)
+                return await self.embedding.aembed_documents(textos)
+            consultas_emb = await self.cache_embeddings.obter_lote_async(corrigidas, calcular)
+            span.set_attribute("embedding.cache_misses", len(misses))
+
+        def pontuar():
+            with telemetria.etapa("vetorial.busca", modo=self.modo_indice, k=self.top_k, consultas=len(corrigidas)):
+                top_indices, top_dists = catalogo.buscar_lote(np.vstack(consultas_emb), self.top_k)
+            return [
+                self._montar_resultado(catalogo, original, corrigida, indices, dists)
+                for original, corrigida, indices, dists in zip(descricoes_input, corrigidas, top_indices, top_dists)
+            ]
+
+        return await loop.run_in_executor(executor, telemetria.no_contexto(pontuar))
+
+    def estatisticas_indice(self, amostras=100):
+        """Modo do índice, memória residente dos vetores e recall@k contra a busca exata."""
+        self._garantir_carregado()
+        catalogo = self.catalogo
+        if catalogo.vetores is None:
+            return {
+                "modo": f"oracle:{oracle_vector.ORGANIZACAO_INDICE}",
+                "produtos": len(catalogo),
+                "delta": 0,
+                "watermark": catalogo.watermark,
+                "precisao_alvo": oracle_vector.PRECISAO_ALVO,
+                "recall_at_k": catalogo.medir_recall(amostras, self.top_k),
+                "k": self.top_k
+            }
+        memoria = getattr(catalogo.indice, "memoria", None)
+        return {
+            "modo": self.modo_indice,
+            "produtos": len(catalogo),
+            "delta": catalogo.tamanho_delta,
+            "watermark": catalogo.watermark,
+            "dimensao": int(catalogo.vetores.shape[1]) if len(catalogo.vetores) else 0,
+            "memoria_indice_bytes": memoria() if memoria else None,
+            "memoria_float32_bytes": int(catalogo.vetores.shape[0] * catalogo.vetores.shape[1] * 4),
+            "recall_at_k": self.avaliar_recall(amostras) if len(catalogo.vetores) else None,
+            "k": self.top_k
+        }
+
+    def avaliar_recall(self, amostras=100, k=None, seed=42):
+        """Recall@k do índice configurado contra a busca exata, usando vetores do catálogo como consulta."""
+        self._garantir_carregado()
+        k = k or self.top_k
+        if self.catalogo.vetores is None:
+            return self.catalogo.medir_recall(amostras, k, seed)
+        rng = np.random.default_rng(seed)
+        n = min(amostras, len(self.vetores))
+        consultas = self.vetores[rng.choice(len(self.vetores), size=n, replace=False)]
+        return vector_index.medir_recall(self.indice, self.vetores, consultas, k)
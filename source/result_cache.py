@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+import os
+import time
+import asyncio
+import threading
+from collections import OrderedDict
+import db_pool
+import telemetria
+
+# === CONFIGURAÇÃO DO CACHE ===
+CACHE_RESULTADOS_ATIVO = os.environ.get("CACHE_RESULTADOS", "1") != "0"
+CACHE_RESULTADOS_MAX = int(os.environ.get("CACHE_RESULTADOS_MAX", "2048"))
+CACHE_RESULTADOS_TTL = float(os.environ.get("CACHE_RESULTADOS_TTL", "600"))                  # segundos; 0 = sem expiração
+CACHE_RESULTADOS_VERIFICACAO = float(os.environ.get("CACHE_RESULTADOS_VERIFICACAO", "10"))   # segundos entre leituras do MarcadorBanco
+
+
+class CacheResultados:
+    """
+    Cache LRU/TTL de resultados de uma ferramenta MCP, indexado pelos argumentos já
+    normalizados. Chamadas idênticas simultâneas compartilham uma única execução
+    (single-flight). `ler_watermark` devolve a assinatura dos dados de origem (ex.: versões
+    dos índices em memória) e é chamada em toda consulta, então não pode fazer I/O;
+    quando ela muda, o cache inteiro é invalidado.
+    """
+
+    def __init__(
+            self,
+            nome,
+            ler_watermark=None,
+            max_itens=CACHE_RESULTADOS_MAX,
+            ttl=CACHE_RESULTADOS_TTL
+    ):
+        self.nome = nome
+        self.ler_watermark = ler_watermark
+        self.max_itens = max_itens
+        self.ttl = ttl
+        self._itens = OrderedDict()    # chave -> (timestamp, resultado)
+        self._em_andamento = {}        # chave -> Task da execução compartilhada
+        self._geracao = 0              # muda a cada invalidação: execuções antigas não gravam
+        self._watermark = None
+        self.hits = 0
+        self.misses = 0
+        self.coalescidas = 0
+        self.evictions = 0
+        self.expirados = 0
+        self.invalidacoes = 0
+
+    def _expirado(self, timestamp, agora):
+        return self.ttl > 0 and agora - timestamp > self.ttl
+
+    def _verificar_watermark(self):
+        if self.ler_watermark is None:
+            return
+        watermark = self.ler_watermark()
+        if self._watermark is not None and watermark != self._watermark:
+            self.invalidar()
+        self._watermark = watermark
+
+    async def obter(self, chave, calcular):
+        """
+        Resultado para `chave`, executando `calcular()` (coroutine function) apenas em caso de
+        miss. Resultados {"erro": ...} não são guardados.
+        """
+        self._verificar_watermark()
+        with telemetria.etapa(f"cache.{self.nome}") as span:
+            agora = time.time()
+            item = self._itens.get(chave)
+            if item is not None and self._expirado(item[0], agora):
+                del self._itens[chave]
+                self.expirados += 1
+                item = None
+            telemetria.registrar_cache(span, self.nome, item is not None)
+            if item is not None:
+                self._itens.move_to_end(chave)
+                self.hits += 1
+                return item[1]
+
+            tarefa = self._em_andamento.get(chave)
+            span.set_attribute(f"{self.nome}.coalescida", tarefa is not None)
+            if tarefa is not None:
+                self.coalescidas += 1
+            else:
+                self.misses += 1
+                tarefa = asyncio.ensure_future(calcular())
+                self._em_andamento[chave] = tarefa
+                tarefa.add_done_callback(lambda t, geracao=self._geracao: self._concluir(chave, t, geracao))
+        # shield: o timeout/cancelamento de quem espera não cancela a execução compartilhada
+        return await asyncio.shield(tarefa)
+
+    def _concluir(self, chave, tarefa, geracao):
+        if self._em_andamento.get(chave) is tarefa:
+            del self._em_andamento[chave]
+        if tarefa.cancelled() or tarefa.exception() is not None or geracao != self._geracao:
+            return
+        resultado = tarefa.result()
+        if isinstance(resultado, dict) and "erro" in resultado:
+            return
+        self.inserir(chave, resultado)
+
+    def inserir(self, chave, resultado, timestamp=None):
+        self._itens[chave] = (timestamp or time.time(), resultado)
+        self._itens.move_to_end(chave)
+        while len(self._itens) > self.max_itens:
+            self._itens.popitem(last=False)
+            self.evictions += 1
+
+    def invalidar(self):
+        self._itens.clear()
+        self._em_andamento.clear()
+        self._geracao += 1
+        self.invalidacoes += 1
+
+    def estatisticas(self):
+        consultas = self.hits + self.misses + self.coalescidas
+        return {
+            "itens": len(self._itens),
+            "max_itens": self.max_itens,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / consultas, 4) if consultas else 0.0,
+            # Esperaram uma execução idêntica já em andamento, sem nova consulta ao banco
+            "coalescidas": self.coalescidas,
+            "em_andamento": len(self._em_andamento),
+            "evictions": self.evictions,
+            "expirados": self.expirados,
+            "invalidacoes": self.invalidacoes,
+            "watermark": list(self._watermark) if self._watermark is not None else None
+        }
+
+
+class MarcadorBanco:
+    """
+    Assinatura de tabelas lida do banco por uma thread a cada `intervalo` segundos, para
+    os modos sem índice em memória (a consulta não entra no caminho das requisições).
+    Chamar o marcador devolve a última leitura (None até a primeira).
+    """
+
+    def __init__(self, consulta, intervalo=CACHE_RESULTADOS_VERIFICACAO):
+        self.consulta = consulta
+        self.intervalo = intervalo
+        self.valor = None
+        self.falhas = 0
+        self._lock = threading.Lock()
+        self._pid = None
+
+    def __call__(self):
+        self._garantir_thread()
+        return self.valor
+
+    def _garantir_thread(self):
+        # Uma thread por processo: threads não passam pelo fork dos workers do servidor HTTP
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+        threading.Thread(target=self._ler_periodicamente, daemon=True).start()
+
+    def _ler_periodicamente(self):
+        while True:
+            try:
+                with db_pool.conexao() as connection:
+                    cursor = connection.cursor()
+                    cursor.execute(self.consulta)
+                    self.valor = tuple(cursor.fetchone())
+                    cursor.close()
+            except Exception as e:
+                print(f"[ERRO] Leitura do marcador do cache de resultados falhou: {e}")
+                self.falhas += 1
+            time.sleep(self.intervalo)
@@ -1,79 +1,180 @@
 # -*- coding: utf-8 -*-
 import os
+import json
+import time
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
 import oracledb
+import db_pool
+import telemetria
+import hybrid_search
+import ean_cascade
+import result_cache
+from embedding_cache import normalizar_texto
 from mcp.server.fastmcp import FastMCP
 from product_search import BuscaProdutoSimilar
+from lexical_index import IndiceLexico
+from invoice_index import IndiceNotas
 
-buscador = BuscaProdutoSimilar()
+# "indice": índice léxico em memória | "plsql": fn_busca_avancada no banco
+# "cascata": exato -> índice de tokens -> embeddings -> fuzzy, parando no primeiro resultado confiável
+RESOLVE_EAN_MODO = os.environ.get("RESOLVE_EAN_MODO", "indice")
+# "indice": notas em memória particionadas por EAN (SQL enquanto carrega) | "sql": sempre no banco
+BUSCA_NOTAS_MODO = os.environ.get("BUSCA_NOTAS_MODO", "indice")
+
+# Limites de execução das ferramentas
+MCP_CONCORRENCIA = int(os.environ.get("MCP_CONCORRENCIA", "16"))          # chamadas simultâneas
+MCP_WORKERS_CPU = int(os.environ.get("MCP_WORKERS_CPU", str(os.cpu_count() or 4)))
+MCP_TIMEOUT = float(os.environ.get("MCP_TIMEOUT", "30"))                  # segundos, padrão por ferramenta
+MCP_TIMEOUTS = json.loads(os.environ.get("MCP_TIMEOUTS", "{}"))           # ex.: {"buscar_notas_por_criterios": 10}
+
+# Paginação de buscar_notas_por_criterios é opcional: sem `limite`, a lista completa de dicionários
+# (formato original). NOTAS_LIMITE_PADRAO > 0 pagina também as chamadas sem `limite`
+NOTAS_LIMITE_PADRAO = int(os.environ.get("NOTAS_LIMITE_PADRAO", "0"))
+NOTAS_LIMITE_MAXIMO = int(os.environ.get("NOTAS_LIMITE_MAXIMO", "200"))
+FETCH_ARRAYSIZE = 1000                     # linhas por round trip nas consultas sem limite
+
+# Assinaturas do banco para o cache de resultados nos modos sem índice em memória
+# (RESOLVE_EAN_MODO=plsql, BUSCA_NOTAS_MODO=sql); lidas em background por result_cache.MarcadorBanco
+MARCADOR_PRODUTOS = "SELECT COUNT(*), MAX(id), MAX(ORA_ROWSCN) FROM produtos"
+MARCADOR_NOTAS = """
+    SELECT (SELECT COUNT(*) FROM nota_fiscal), (SELECT MAX(ORA_ROWSCN) FROM nota_fiscal),
+           (SELECT COUNT(*) FROM item_nota_fiscal), (SELECT MAX(ORA_ROWSCN) FROM item_nota_fiscal)
+    FROM dual
+"""
+
+# Spans/métricas por ferramenta e etapa, exportados via OTLP (mesmo coletor do main.py)
+telemetria.configurar()
+
+# Carga em background: o handshake MCP não espera pelos vetores nem pelo índice léxico
+buscador = BuscaProdutoSimilar(carregar_em_background=True)
+indice_lexico = IndiceLexico(carregar_em_background=True) if RESOLVE_EAN_MODO in ("indice", "cascata") else None
+indice_notas = IndiceNotas(carregar_em_background=True) if BUSCA_NOTAS_MODO == "indice" else None
 
 mcp = FastMCP("InvoiceItemResolver")
-# Configurações Oracle Wallet
-WALLET_PATH = "/WALLET_PATH/Wallet_oradb23ai"  # Altere conforme seu ambiente
-DB_ALIAS = "oradb23ai_high"                 # Alias definido no tnsnames.ora
-USERNAME = "USER"                        # Usuário do banco
-PASSWORD = "Password"                    # Senha do usuário
-os.environ["TNS_ADMIN"] = WALLET_PATH
 
+executor_cpu = ThreadPoolExecutor(max_workers=MCP_WORKERS_CPU, thread_name_prefix="mcp-cpu")
+_semaforo = asyncio.Semaphore(MCP_CONCORRENCIA)
+
+COLUNAS_NOTA = ["numero_nota", "nome_cliente", "estado", "data_saida", "numero_item", "codigo_ean", "descricao_produto", "valor_unitario"]
 
-def executar_busca(query: str, params: dict = {}):
+
+def _contexto_requisicao():
+    """Trace context enviado pelo cliente no _meta da chamada (traceparent/tracestate), se houver."""
     try:
-        connection = oracledb.connect(
-            user=USERNAME,
-            password=PASSWORD,
-            dsn=DB_ALIAS,
-            config_dir=WALLET_PATH,
-            wallet_location=WALLET_PATH,
-            wallet_password=PASSWORD
-        )
-        cursor = connection.cursor()
-        cursor.execute(query, params)
-        results = cursor.fetchall()
-        cursor.close()
-        connection.close()
+        meta = mcp.get_context().request_context.meta
+    except (LookupError, ValueError):
+        return None   # chamada fora de uma requisição MCP (ex.: benchmark)
+    return meta.model_dump(exclude_none=True) if meta is not None else None
+
+
+def limitado(fn):
+    """
+    Aplica o limite global de concorrência e o timeout configurado para a ferramenta,
+    dentro de um span que continua o trace do cliente.
+    """
+    timeout = MCP_TIMEOUTS.get(fn.__name__, MCP_TIMEOUT)
+
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        with telemetria.ferramenta(fn.__name__, _contexto_requisicao()) as span:
+            inicio = time.perf_counter()
+            async with _semaforo:
+                span.set_attribute("mcp.espera_concorrencia_ms", (time.perf_counter() - inicio) * 1000)
+                try:
+                    resultado = await asyncio.wait_for(fn(*args, **kwargs), timeout)
+                except asyncio.TimeoutError:
+                    resultado = {"erro": f"Tempo limite de {timeout}s excedido em {fn.__name__}."}
+            telemetria.registrar_resultado(span, resultado)
+            return resultado
+    return wrapper
+
+
+async def em_executor(fn, *args):
+    return await asyncio.get_running_loop().run_in_executor(executor_cpu, telemetria.no_contexto(fn, *args))
+
+
+async def executar_busca(query: str, params: dict = {}, tipos: dict = None, linhas_esperadas: int = None, propagar_erro: bool = False):
+    try:
+        async with db_pool.conexao_async() as connection:
+            cursor = connection.cursor()
+            # Com o tamanho da página conhecido, a página inteira vem no round trip do execute
+            cursor.arraysize = linhas_esperadas or FETCH_ARRAYSIZE
+            cursor.prefetchrows = (linhas_esperadas or FETCH_ARRAYSIZE) + 1
+            if tipos:
+                cursor.setinputsizes(**tipos)
+            with telemetria.etapa("db.execute"):
+                await cursor.execute(query, params)
+            with telemetria.etapa("db.fetch") as span:
+                results = await cursor.fetchall()
+                telemetria.registrar_linhas(span, len(results), "sql")
+            cursor.close()
         return results
     except Exception as e:
         print(f"[ERRO] Consulta falhou: {e}")
+        if propagar_erro:
+            raise
         return []
 
-def executar_busca_ean(termos_busca):
+async def executar_busca_ean(termos_busca):
     results = []
 
     try:
-        connection = oracledb.connect(user=USERNAME, password=PASSWORD, dsn=DB_ALIAS, config_dir=WALLET_PATH, wallet_location=WALLET_PATH, wallet_password=PASSWORD)
-        cursor = connection.cursor()
-
-        query = """
-                SELECT * FROM TABLE(fn_busca_avancada(:1))
-                ORDER BY similaridade DESC \
-                """
-        cursor.execute(query, [termos_busca])
-
-        for row in cursor:
-            results.append({
-                "codigo": row[0],
-                "descricao": row[1],
-                "similaridade": row[2]
-            })
-
-        cursor.close()
-        connection.close()
+        async with db_pool.conexao_async() as connection:
+            cursor = connection.cursor()
+
+            query = """
+                    SELECT * FROM TABLE(fn_busca_avancada(:1))
+                    ORDER BY similaridade DESC \
+                    """
+            with telemetria.etapa("db.execute", consulta="fn_busca_avancada"):
+                await cursor.execute(query, [termos_busca])
+
+            with telemetria.etapa("db.fetch") as span:
+                async for row in cursor:
+                    results.append({
+                        "codigo": row[0],
+                        "descricao": row[1],
+                        "similaridade": row[2]
+                    })
+                telemetria.registrar_linhas(span, len(results), "fn_busca_avancada")
+
+            cursor.close()
     except Exception as e:
         return {"erro": str(e)}, 500
 
     return results
+
+# Versões dos índices em memória, que já acompanham o banco nas próprias atualizações:
+# ler o watermark do cache não custa nenhuma consulta
+marcador_produtos = result_cache.MarcadorBanco(MARCADOR_PRODUTOS) if indice_lexico is None else None
+marcador_notas = result_cache.MarcadorBanco(MARCADOR_NOTAS) if indice_notas is None else None
+
+def _watermark_catalogo():
+    return (buscador.versao, indice_lexico.versao if indice_lexico is not None else marcador_produtos())
+
+def _watermark_notas():
+    return (indice_notas.versao,) if indice_notas is not None else marcador_notas()
+
+cache_ean = result_cache.CacheResultados("resolve_ean", _watermark_catalogo) if result_cache.CACHE_RESULTADOS_ATIVO else None
+cache_notas = result_cache.CacheResultados("notas", _watermark_notas) if result_cache.CACHE_RESULTADOS_ATIVO else None
 # --------------------- FERRAMENTAS MCP ---------------------
 @mcp.tool()
-def buscar_produto_vetorizado(descricao: str) -> dict:
+@limitado
+async def buscar_produto_vetorizado(descricao: str) -> dict:
     """Busca produto por descrição usando embeddings"""
-    return buscador.buscar_produtos_similares(descricao)
+    return await buscador.buscar_produtos_similares_async(descricao, executor_cpu)
 
-@mcp.tool()
-def resolve_ean(description: str) -> dict:
-    """
-    Resolve o código EAN do produto a partir da descrição
-    """
-
-    result = executar_busca_ean(description)
+async def _resolver_ean(description):
+    if cascata is not None:
+        return await cascata.resolver(description)
+    if indice_lexico is not None:
+        with telemetria.etapa("indice_lexico.buscar") as span:
+            result = await em_executor(indice_lexico.buscar, description)
+            telemetria.registrar_linhas(span, len(result), "indice_lexico")
+    else:
+        result = await executar_busca_ean(description)
 
     if isinstance(result, list) and result:
         return {
@@ -85,17 +186,175 @@ def resolve_ean(description: str) -> dict:
         return {"erro": "EAN não encontrado com os critérios fornecidos."}
 
 @mcp.tool()
-def buscar_notas_por_criterios(cliente: str = None, estado: str = None, preco: float = None, ean: str = None, margem: float = 0.05) -> list:
+@limitado
+async def resolve_ean(description: str) -> dict:
+    """
+    Resolve o código EAN do produto a partir da descrição
+    """
+    if cache_ean is None:
+        return await _resolver_ean(description)
+    return await cache_ean.obter(normalizar_texto(description), lambda: _resolver_ean(description))
+
+async def _ranking_lexico(description):
+    if indice_lexico is not None:
+        with telemetria.etapa("indice_lexico.buscar") as span:
+            result = await em_executor(indice_lexico.buscar, description)
+            telemetria.registrar_linhas(span, len(result), "indice_lexico")
+        return result
+    result = await executar_busca_ean(description)
+    if not isinstance(result, list):
+        raise RuntimeError(result[0]["erro"])
+    return result
+
+cascata = ean_cascade.criar_resolvedor(
+    indice_lexico, buscador, _ranking_lexico, em_executor, executor_cpu
+) if RESOLVE_EAN_MODO == "cascata" else None
+
+async def _executar_retriever(nome, coro):
+    """Roda um retriever da busca híbrida medindo a latência; uma falha vira ranking vazio."""
+    inicio = time.perf_counter()
+    with telemetria.etapa(f"hibrido.{nome}") as span:
+        try:
+            itens, erro = await coro, None
+            telemetria.registrar_linhas(span, len(itens), nome)
+        except Exception as e:
+            itens, erro = [], str(e)
+            span.set_attribute("erro", erro)
+    return nome, itens, erro, round((time.perf_counter() - inicio) * 1000, 1)
+
+async def _buscar_hibrido(descricao, top_k):
+    async def vetorial():
+        resultado = await buscador.buscar_produtos_similares_async(descricao, executor_cpu, fallback_fuzzy=False)
+        return resultado["semanticos"]
+
+    # Os três retrievers rodam ao mesmo tempo: a latência total é a do mais lento
+    execucoes = await asyncio.gather(
+        _executar_retriever("vetorial", vetorial()),
+        _executar_retriever("lexico", _ranking_lexico(descricao)),
+        _executar_retriever("fuzzy", em_executor(buscador.buscar_fuzzy, descricao, hybrid_search.PROFUNDIDADE))
+    )
+    with telemetria.etapa("hibrido.fusao"):
+        resultados = hybrid_search.fundir_rrf({nome: itens for nome, itens, _, _ in execucoes}, limite=top_k)
+
+    resposta = {
+        "consulta": descricao,
+        "resultados": resultados,
+        "latencias_ms": {nome: latencia for nome, _, _, latencia in execucoes}
+    }
+    falhas = {nome: erro for nome, _, erro, _ in execucoes if erro}
+    if falhas:
+        resposta["falhas"] = falhas
+    if not resultados:
+        resposta["erro"] = "EAN não encontrado com os critérios fornecidos."
+    return resposta
+
+@mcp.tool()
+@limitado
+async def buscar_produto_hibrido(descricao: str, top_k: int = 5) -> dict:
+    """
+    Busca híbrida do EAN: roda em paralelo os retrievers vetorial (embeddings), léxico/fonético
+    (o mesmo do resolve_ean) e fuzzy e funde os rankings por reciprocal rank fusion.
+    Retorna uma única lista de EANs ordenada (resultados[0] é o mais provável), com a posição
+    em cada retriever; substitui chamar buscar_produto_vetorizado e resolve_ean em sequência.
+    """
+    return await _buscar_hibrido(descricao, top_k)
+
+@mcp.tool()
+@limitado
+async def buscar_produtos_vetorizados_lote(descricoes: list[str]) -> list:
+    """
+    Versão em lote de buscar_produto_vetorizado: recebe a lista de descrições dos itens
+    e retorna um resultado por item, na mesma ordem.
+    """
+    return await buscador.buscar_produtos_similares_lote_async(descricoes, executor_cpu)
+
+@mcp.tool()
+@limitado
+async def resolve_ean_lote(descricoes: list[str]) -> list:
+    """
+    Versão em lote de resolve_ean: retorna o EAN mais provável de cada descrição, na mesma ordem.
+    """
+    return list(await asyncio.gather(*(_resolver_ean(descricao) for descricao in descricoes)))
+
+def _ordenar_notas(rows, preco):
+    """Mesma ordem do ORDER BY paginado: preço mais próximo, data_saida mais recente, nota e item."""
+    rows = sorted(rows, key=lambda row: (row[0], row[4]))
+    rows.sort(key=lambda row: (row[3] is not None, row[3] if row[3] is not None else 0), reverse=True)
+    if preco is not None:
+        rows.sort(key=lambda row: abs(row[7] - preco) if row[7] is not None else float("inf"))
+    return rows
+
+def _pagina_notas(rows, total, limite, deslocamento):
+    """Codificação compacta: nomes das colunas uma vez e cada linha como lista de valores."""
+    return {
+        "colunas": COLUNAS_NOTA,
+        "linhas": [
+            [valor.isoformat() if hasattr(valor, "isoformat") else valor for valor in row]
+            for row in rows
+        ],
+        "total": total,
+        "deslocamento": deslocamento,
+        "limite": limite,
+        "mais_resultados": total is not None and deslocamento + len(rows) < total
+    }
+
+@mcp.tool()
+@limitado
+async def buscar_notas_por_criterios(cliente: str = None, estado: str = None, preco: float = None, ean: str = None, margem: float = 0.05, limite: int = None, deslocamento: int = 0) -> list | dict:
     """
     Busca notas fiscais de saída com base em cliente, estado, EAN e preço aproximado.
     Permite que um ou mais campos sejam omitidos.
     Enquanto não houver um EAN estabelecido, nao adianta usar este servico.
+    Sem `limite`, retorna a lista de notas (dicionários). Com `limite`, retorna uma página
+    ordenada pelo preço mais próximo e pela data_saida mais recente:
+    {"colunas", "linhas", "total", "deslocamento", "limite", "mais_resultados"}; use
+    `deslocamento` para as páginas seguintes. Em falha do banco, {"erro": ...} (com
+    `limite`, a página vazia com a chave "erro").
     """
-    print("buscar_notas_por_criterios")
+    limite = NOTAS_LIMITE_PADRAO if limite is None else limite
+    # Cliente e estado são comparados com LOWER no SQL e no índice de notas
+    chave = (
+        cliente.lower() if isinstance(cliente, str) else cliente,
+        estado.lower() if isinstance(estado, str) else estado,
+        preco, ean, margem, limite, deslocamento or 0
+    )
+    try:
+        if cache_notas is None:
+            return await _buscar_notas(cliente, estado, preco, ean, margem, limite, deslocamento, propagar_erro=True)
+        return await cache_notas.obter(
+            chave, lambda: _buscar_notas(cliente, estado, preco, ean, margem, limite, deslocamento, propagar_erro=True)
+        )
+    except Exception as e:
+        # Falha do banco não entra no cache e não pode parecer "nenhuma nota encontrada"
+        erro = f"Falha na busca de notas: {e}"
+        if limite > 0:
+            return {**_pagina_notas([], None, min(limite, NOTAS_LIMITE_MAXIMO), max(deslocamento or 0, 0)), "erro": erro}
+        return {"erro": erro}
 
-    query = """
+async def _buscar_notas(cliente, estado, preco, ean, margem, limite, deslocamento, propagar_erro=False):
+    limite = NOTAS_LIMITE_PADRAO if limite is None else limite
+    paginado = limite > 0
+    limite = min(limite, NOTAS_LIMITE_MAXIMO)
+    deslocamento = max(deslocamento or 0, 0)
+
+    if _usar_indice_notas(cliente):
+        with telemetria.etapa("indice_notas.buscar") as span:
+            result = await em_executor(indice_notas.buscar, cliente, estado, preco, ean, margem)
+            telemetria.registrar_linhas(span, len(result), "indice_notas")
+        with telemetria.etapa("serializacao"):
+            if paginado:
+                pagina = _ordenar_notas(result, preco)[deslocamento:deslocamento + limite]
+                return _pagina_notas(pagina, len(result), limite, deslocamento)
+            return [
+                dict(zip(COLUNAS_NOTA, row))
+                for row in result
+            ]
+
+    # Na paginação, o total de linhas vem junto da página (COUNT(*) OVER () antes do OFFSET/FETCH)
+    total_sql = ", COUNT(*) OVER () AS total" if paginado else ""
+    query = f"""
             SELECT nf.numero_nf, nf.nome_cliente, nf.estado, nf.data_saida,
-                   inf.numero_item, inf.codigo_ean, inf.descricao_produto, inf.valor_unitario
+                   inf.numero_item, inf.codigo_ean, inf.descricao_produto, inf.valor_unitario{total_sql}
             FROM nota_fiscal nf
                      JOIN item_nota_fiscal inf ON nf.numero_nf = inf.numero_nf
             WHERE 1=1 
@@ -117,17 +376,238 @@ def buscar_notas_por_criterios(cliente: str = None, estado: str = None, preco: f
         params["preco_min"] = preco * (1 - margem)
         params["preco_max"] = preco * (1 + margem)
 
+    if paginado:
+        # Ordenação, total e corte da página no banco: só a página trafega e vira resposta
+        ordem = "nf.data_saida DESC NULLS LAST, nf.numero_nf, inf.numero_item"
+        if preco is not None:
+            ordem = "ABS(inf.valor_unitario - :preco), " + ordem
+            params["preco"] = preco
+        query += f" ORDER BY {ordem} OFFSET :deslocamento ROWS FETCH NEXT :limite ROWS ONLY"
+        params["deslocamento"] = deslocamento
+        params["limite"] = limite
+        result = await executar_busca(query, params, linhas_esperadas=limite, propagar_erro=propagar_erro)
+        with telemetria.etapa("serializacao"):
+            # Sem linhas (ou página além do fim) o COUNT(*) OVER () não chega: total desconhecido
+            total = result[0][-1] if result else (0 if deslocamento == 0 else None)
+            return _pagina_notas([row[:-1] for row in result], total, limite, deslocamento)
+
     # Executa a consulta com os parâmetros nomeados
-    result = executar_busca(query, params)
+    result = await executar_busca(query, params, propagar_erro=propagar_erro)
+
+    with telemetria.etapa("serializacao"):
+        return [
+            dict(zip(COLUNAS_NOTA, row))
+            for row in result
+        ]
+
+def _usar_indice_notas(cliente):
+    # Curingas do LIKE (% e _) dentro do nome do cliente só são tratados pelo SQL
+    return (
+        indice_notas is not None and indice_notas.carregado
+        and not any(c in f"{cliente}" for c in "%_")
+    )
+
+async def _buscar_notas_lote(itens, margem):
+    notas = [[] for _ in itens]
+
+    linhas_indice = {
+        linha for linha, item in enumerate(itens)
+        if item.get("cliente") is not None and _usar_indice_notas(item.get("cliente"))
+    }
+    if linhas_indice:
+        def buscar_no_indice():
+            with telemetria.etapa("indice_notas.buscar", consultas=len(linhas_indice)) as span:
+                total = 0
+                for linha in sorted(linhas_indice):
+                    item = itens[linha]
+                    for row in indice_notas.buscar(item.get("cliente"), item.get("estado"), item.get("preco"), item.get("ean"), margem):
+                        notas[linha].append(dict(zip(COLUNAS_NOTA, row)))
+                        total += 1
+                telemetria.registrar_linhas(span, total, "indice_notas")
+        await em_executor(buscar_no_indice)
+
+    criterios = []
+    for linha, item in enumerate(itens):
+        if linha in linhas_indice:
+            continue
+        preco = item.get("preco")
+        criterios.append({
+            "linha": linha,
+            "cliente": item.get("cliente"),
+            "estado": item.get("estado"),
+            "ean": item.get("ean"),
+            "preco_min": preco * (1 - margem) if preco is not None else None,
+            "preco_max": preco * (1 + margem) if preco is not None else None
+        })
+
+    query = """
+            SELECT c.linha, nf.numero_nf, nf.nome_cliente, nf.estado, nf.data_saida,
+                   inf.numero_item, inf.codigo_ean, inf.descricao_produto, inf.valor_unitario
+            FROM JSON_TABLE(:criterios, '$[*]' COLUMNS (
+                     linha     NUMBER        PATH '$.linha',
+                     cliente   VARCHAR2(100) PATH '$.cliente',
+                     estado    VARCHAR2(2)   PATH '$.estado',
+                     ean       VARCHAR2(20)  PATH '$.ean',
+                     preco_min NUMBER        PATH '$.preco_min',
+                     preco_max NUMBER        PATH '$.preco_max'
+                 )) c
+                     JOIN item_nota_fiscal inf ON inf.codigo_ean = c.ean
+                     JOIN nota_fiscal nf ON nf.numero_nf = inf.numero_nf
+            WHERE c.cliente IS NOT NULL
+              AND LOWER(nf.nome_cliente) LIKE '%' || LOWER(c.cliente) || '%'
+              AND LOWER(nf.estado) = LOWER(c.estado)
+              AND (c.preco_min IS NULL OR inf.valor_unitario BETWEEN c.preco_min AND c.preco_max)
+            ORDER BY c.linha
+            """
+
+    if criterios:
+        result = await executar_busca(query, {"criterios": json.dumps(criterios)}, {"criterios": oracledb.DB_TYPE_CLOB})
+        for row in result:
+            notas[int(row[0])].append(dict(zip(COLUNAS_NOTA, row[1:])))
 
     return [
-        dict(zip(
-            ["numero_nota", "nome_cliente", "estado", "data_saida", "numero_item", "codigo_ean", "descricao_produto", "valor_unitario"],
-            row
-        ))
-        for row in result
+        {"linha": linha, "ean": item.get("ean"), "notas": notas[linha]}
+        for linha, item in enumerate(itens)
     ]
 
+@mcp.tool()
+@limitado
+async def buscar_notas_por_criterios_lote(itens: list[dict], margem: float = 0.05) -> list:
+    """
+    Versão em lote de buscar_notas_por_criterios. Cada item tem cliente, estado, ean e preco.
+    Todas as linhas são resolvidas em uma única consulta; o retorno traz, para cada linha
+    (na mesma ordem), as notas fiscais candidatas.
+    """
+    return await _buscar_notas_lote(itens, margem)
+
+@mcp.tool()
+@limitado
+async def resolver_devolucao_lote(itens: list[dict], margem: float = 0.05) -> list:
+    """
+    Resolve uma nota de devolução inteira em uma chamada. Cada item segue o formato
+    {"customer", "description", "price", "location"}. Para cada linha, resolve o EAN
+    (resolve_ean; busca vetorial em lote para as linhas sem resultado) e retorna as
+    notas fiscais de saída candidatas.
+    """
+    eans = list(await asyncio.gather(*(_resolver_ean(item.get("description", "")) for item in itens)))
+
+    pendentes = [i for i, ean in enumerate(eans) if "erro" in ean]
+    if pendentes:
+        vetoriais = await buscador.buscar_produtos_similares_lote_async(
+            [itens[i].get("description", "") for i in pendentes], executor_cpu
+        )
+        for i, resultado in zip(pendentes, vetoriais):
+            melhores = resultado["semanticos"] or resultado["fallback_fuzzy"]
+            if melhores:
+                eans[i] = {
+                    "ean": melhores[0]["codigo"],
+                    "descricao": melhores[0]["descricao"],
+                    "similaridade": melhores[0].get("similaridade", melhores[0].get("score_fuzzy"))
+                }
+
+    notas = await _buscar_notas_lote([
+        {
+            "cliente": item.get("customer"),
+            "estado": item.get("location"),
+            "ean": ean.get("ean"),
+            "preco": item.get("price")
+        }
+        for item, ean in zip(itens, eans)
+    ], margem)
+
+    return [
+        {"linha": linha, "item": item, "produto": ean, "notas": resultado["notas"]}
+        for linha, (item, ean, resultado) in enumerate(zip(itens, eans, notas))
+    ]
+
+
+@mcp.tool()
+@limitado
+async def atualizar_indice_lexico(forcar: bool = False) -> dict:
+    """
+    Recarrega o índice léxico usado pelo resolve_ean após mudanças no catálogo de produtos.
+    Sem forcar, só recarrega se a tabela produtos mudou.
+    """
+    if indice_lexico is None:
+        return {"erro": "resolve_ean está configurado para usar fn_busca_avancada (RESOLVE_EAN_MODO=plsql)."}
+    if forcar:
+        return {"atualizado": True, "produtos": await em_executor(indice_lexico.atualizar)}
+    return {"atualizado": await em_executor(indice_lexico.atualizar_se_mudou)}
+
+@mcp.tool()
+async def status_indice_notas() -> dict:
+    """
+    Retorna o estado do índice de notas fiscais em memória (EANs, itens e último SCN aplicado).
+    """
+    if indice_notas is None:
+        return {"erro": "buscar_notas_por_criterios está configurado para usar somente SQL (BUSCA_NOTAS_MODO=sql)."}
+    return indice_notas.estatisticas()
+
+@mcp.tool()
+async def status_pool() -> dict:
+    """
+    Retorna métricas do pool de conexões Oracle (sessões abertas/ocupadas, checkouts e tempo de espera)
+    e o resultado de um health check.
+    """
+    metricas = db_pool.metricas_pool()
+    metricas["saudavel"] = await db_pool.verificar_saude_async()
+    return metricas
+
+@mcp.tool()
+@limitado
+async def atualizar_indice_vetorial(completo: bool = False) -> dict:
+    """
+    Aplica ao índice vetorial os produtos novos ou alterados em embeddings_produtos
+    (ex.: após rodar process_vector_products.py), sem reiniciar o servidor.
+    Com completo, recarrega o snapshot inteiro.
+    """
+    return await em_executor(buscador.atualizar_indice, completo)
+
+@mcp.tool()
+@limitado
+async def status_indice_vetorial(amostras: int = 100) -> dict:
+    """
+    Retorna o modo do índice vetorial (exato, hnsw, ivf, float16, int8, pq), a memória usada
+    pelos vetores comparada ao float32 completo e o recall@k medido contra a busca exata.
+    """
+    return await em_executor(buscador.estatisticas_indice, amostras)
+
+@mcp.tool()
+async def status_cascata_ean() -> dict:
+    """
+    Retorna, por camada da cascata do resolve_ean (exato, lexico, vetorial, fuzzy), tentativas,
+    taxa de resolução e latência, para calibrar os limiares CASCATA_LIMIAR_*.
+    """
+    if cascata is None:
+        return {"erro": "resolve_ean não está configurado em cascata (RESOLVE_EAN_MODO=cascata)."}
+    return cascata.estatisticas.resumo()
+
+@mcp.tool()
+async def status_cache_resultados(limpar: bool = False) -> dict:
+    """
+    Retorna os contadores do cache de resultados de resolve_ean e buscar_notas_por_criterios
+    (hits, misses, chamadas coalescidas, evictions, invalidações por watermark; falhas na
+    leitura da assinatura do banco nos modos sem índice em memória).
+    Com limpar=True, invalida os dois caches.
+    """
+    if cache_ean is None:
+        return {"erro": "Cache de resultados desativado (CACHE_RESULTADOS=0)."}
+    if limpar:
+        cache_ean.invalidar()
+        cache_notas.invalidar()
+    estatisticas = {"resolve_ean": cache_ean.estatisticas(), "buscar_notas_por_criterios": cache_notas.estatisticas()}
+    for nome, marcador in (("resolve_ean", marcador_produtos), ("buscar_notas_por_criterios", marcador_notas)):
+        if marcador is not None:
+            estatisticas[nome]["falhas_watermark"] = marcador.falhas
+    return estatisticas
+
+@mcp.tool()
+def status_cache_embeddings() -> dict:
+    """
+    Retorna os contadores do cache de embeddings de consulta (hits, misses, evictions).
+    """
+    return buscador.cache_embeddings.estatisticas()
+
 
 # --------------------- EXECUÇÃO MCP ---------------------
 
@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+"""
+Servidor InvoiceItemResolver compartilhado via HTTP (streamable-http ou SSE), em modelo
+pre-fork: o processo mestre importa server_nf_items e carrega vetores, índice léxico e
+índice de notas uma única vez, e só então cria os workers com fork. Os vetores do snapshot
+são um mmap do arquivo (page cache do SO, uma cópia para todos os workers) e as demais
+estruturas ficam em páginas copy-on-write; cada worker já nasce aquecido e abre as próprias
+conexões com o banco. Os agentes conectam por URL em vez de subir um servidor stdio cada:
+
+    python servidor_http.py --workers 4 --porta 8000
+    MCP_SERVIDOR_URL=http://localhost:8000/mcp python main.py
+
+Além do endpoint MCP (/mcp ou /sse), cada worker responde /health (processo vivo) e
+/ready (índices carregados; com ?banco=1 também faz ping no pool).
+"""
+import os
+import gc
+import time
+import signal
+import socket
+import asyncio
+import argparse
+
+# === CONFIGURAÇÃO ===
+HOST = os.environ.get("MCP_HTTP_HOST", "0.0.0.0")
+PORTA = int(os.environ.get("MCP_HTTP_PORTA", "8000"))
+WORKERS = int(os.environ.get("MCP_HTTP_WORKERS", str(os.cpu_count() or 4)))
+TRANSPORTE = os.environ.get("MCP_HTTP_TRANSPORTE", "streamable-http")   # ou "sse"
+BACKLOG = 2048
+# URL de um servidor compartilhado para main.py e conciliar_lote.py; vazio = sobe o servidor via stdio
+MCP_SERVIDOR_URL = os.environ.get("MCP_SERVIDOR_URL", "")
+
+
+def configuracao_cliente():
+    """Configuração do InvoiceItemResolver para o MultiServerMCPClient: URL compartilhada ou stdio."""
+    if MCP_SERVIDOR_URL:
+        transporte = "sse" if MCP_SERVIDOR_URL.rstrip("/").endswith("/sse") else "streamable_http"
+        return {"InvoiceItemResolver": {"url": MCP_SERVIDOR_URL, "transport": transporte}}
+    return {
+        "InvoiceItemResolver": {
+            "command": "python",
+            "args": ["server_nf_items.py"],
+            "transport": "stdio",
+        },
+    }
+
+
+def aquecer(servidor):
+    """Carga síncrona no mestre, antes do fork: os workers herdam tudo pronto."""
+    inicio = time.perf_counter()
+    servidor.buscador._garantir_carregado()
+    if servidor.indice_lexico is not None:
+        servidor.indice_lexico._garantir_carregado()
+    if servidor.indice_notas is not None:
+        # Aguarda a carga em background já iniciada ou refaz a carga aqui, levantando o erro se falhar
+        servidor.indice_notas._garantir_carregado()
+    return time.perf_counter() - inicio
+
+
+def prontidao(servidor):
+    estado = {
+        "pid": os.getpid(),
+        "vetores": servidor.buscador._carregado,
+        "indice_lexico": servidor.indice_lexico is None or servidor.indice_lexico._estruturas is not None,
+        "indice_notas": servidor.indice_notas is None or servidor.indice_notas.carregado,
+    }
+    estado["pronto"] = estado["vetores"] and estado["indice_lexico"] and estado["indice_notas"]
+    return estado
+
+
+def registrar_endpoints(servidor):
+    from starlette.responses import JSONResponse
+    import db_pool
+
+    @servidor.mcp.custom_route("/health", methods=["GET"])
+    async def health(request):
+        return JSONResponse({"status": "ok", "pid": os.getpid()})
+
+    @servidor.mcp.custom_route("/ready", methods=["GET"])
+    async def ready(request):
+        estado = prontidao(servidor)
+        if request.query_params.get("banco") == "1":
+            estado["banco"] = await db_pool.verificar_saude_async()
+            estado["pronto"] = estado["pronto"] and estado["banco"]
+        return JSONResponse(estado, status_code=200 if estado["pronto"] else 503)
+
+
+def executar_worker(servidor, sock, transporte, intervalo_atualizacao):
+    import uvicorn
+    # Threads não sobrevivem ao fork: a atualização periódica do índice vetorial começa em cada worker
+    servidor.buscador.iniciar_atualizacao_periodica(intervalo_atualizacao)
+    app = servidor.mcp.streamable_http_app() if transporte == "streamable-http" else servidor.mcp.sse_app()
+    config = uvicorn.Config(app, log_level=servidor.mcp.settings.log_level.lower(), lifespan="on")
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+def main(args):
+    # O mestre não atualiza o índice vetorial: só carrega e cria os workers
+    intervalo_atualizacao = float(os.environ.get("INDICE_VETORIAL_INTERVALO", "300"))
+    os.environ["INDICE_VETORIAL_INTERVALO"] = "0"
+
+    import db_pool
+    import server_nf_items as servidor
+    # Sem estado por sessão: qualquer worker atende qualquer requisição do mesmo cliente
+    servidor.mcp.settings.stateless_http = True
+    servidor.mcp.settings.json_response = True
+    registrar_endpoints(servidor)
+
+    print("📦 Aquecendo índices no processo mestre...")
+    print(f"✅ Índices carregados em {aquecer(servidor):.1f}s")
+    # Conexões abertas na carga não podem ser compartilhadas entre processos (pools sync e async)
+    db_pool.fechar_pool()
+    try:
+        asyncio.run(db_pool.fechar_pool_async())
+    except Exception as e:
+        print(f"[ERRO] Falha ao fechar o pool async antes do fork: {e}")
+
+    sock = socket.socket(socket.AF_INET6 if ":" in args.host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((args.host, args.porta))
+    sock.listen(BACKLOG)
+    sock.set_inheritable(True)
+
+    # Objetos da carga saem do alcance do GC, que senão tocaria (e copiaria) as páginas em cada worker
+    gc.collect()
+    gc.freeze()
+
+    workers = {}
+    encerrando = False
+
+    def iniciar_worker():
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            codigo = 0
+            try:
+                executar_worker(servidor, sock, args.transporte, intervalo_atualizacao)
+            except BaseException as e:
+                print(f"[ERRO] Worker {os.getpid()} falhou: {e}")
+                codigo = 1
+            finally:
+                os._exit(codigo)
+        workers[pid] = time.time()
+
+    def encerrar(signum, frame):
+        nonlocal encerrando
+        encerrando = True
+        for pid in list(workers):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    for _ in range(args.workers):
+        iniciar_worker()
+    signal.signal(signal.SIGTERM, encerrar)
+    signal.signal(signal.SIGINT, encerrar)
+    print(f"🚀 {args.workers} workers ({args.transporte}) em http://{args.host}:{args.porta}")
+
+    while workers:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        iniciado = workers.pop(pid, None)
+        if not encerrando and iniciado is not None:
+            print(f"⚠️ Worker {pid} terminou (status {status}); iniciando outro")
+            # Evita um loop de fork quando o worker morre logo na subida
+            if time.time() - iniciado < 1:
+                time.sleep(1)
+            iniciar_worker()
+    sock.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Servidor InvoiceItemResolver compartilhado via HTTP.")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--porta", type=int, default=PORTA)
+    parser.add_argument("--workers", type=int, default=WORKERS)
+    parser.add_argument("--transporte", choices=["streamable-http", "sse"], default=TRANSPORTE)
+    args = parser.parse_args()
+    # No SSE a sessão vive no worker que abriu o stream; mensagens em outro worker se perderiam
+    if args.transporte == "sse" and args.workers > 1:
+        parser.error("o transporte sse mantém estado por sessão; use --workers 1 ou streamable-http")
+    main(args)
@@ -0,0 +1,293 @@
+# -*- coding: utf-8 -*-
+"""
+Stand-in SQLite para o Oracle, usado pelo benchmark offline (DB_BACKEND=sqlite:/caminho.db).
+
+Expõe pools com a mesma interface usada por db_pool (acquire/release e métricas) e cursores
+que aceitam os atributos do oracledb (arraysize, prefetchrows, outputtypehandler, setinputsizes).
+As poucas construções específicas do Oracle usadas pelo projeto são traduzidas para SQLite
+(inclusive VECTOR_DISTANCE e FETCH APPROX do motor vetorial "oracle", emulados por força bruta);
+fn_busca_avancada (PL/SQL) não tem equivalente, então o benchmark usa RESOLVE_EAN_MODO=indice.
+"""
+import re
+import array
+import sqlite3
+import threading
+import numpy as np
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS produtos (
+    id INTEGER PRIMARY KEY,
+    codigo TEXT,
+    descricao TEXT
+);
+CREATE TABLE IF NOT EXISTS embeddings_produtos (
+    id INTEGER PRIMARY KEY,
+    codigo TEXT,
+    descricao TEXT,
+    vetor BLOB,
+    hash_descricao TEXT,
+    vetor_nativo BLOB
+);
+CREATE TABLE IF NOT EXISTS nota_fiscal (
+    numero_nf TEXT PRIMARY KEY,
+    codigo_cliente TEXT NOT NULL,
+    nome_cliente TEXT,
+    valor_total REAL,
+    data_saida TEXT,
+    cidade TEXT,
+    estado TEXT
+);
+CREATE TABLE IF NOT EXISTS item_nota_fiscal (
+    numero_nf TEXT NOT NULL,
+    numero_item INTEGER NOT NULL,
+    codigo_ean TEXT,
+    descricao_produto TEXT,
+    valor_unitario REAL,
+    quantidade REAL,
+    valor_total REAL,
+    valor_impostos REAL,
+    PRIMARY KEY (numero_nf, numero_item)
+);
+CREATE INDEX IF NOT EXISTS idx_item_ean ON item_nota_fiscal (codigo_ean);
+"""
+
+_INSERT_MERGE = re.compile(r"INSERT\s*\(([^)]*)\)\s*VALUES\s*\(([^)]*)\)", re.IGNORECASE)
+_VECTOR_DISTANCE = re.compile(r"VECTOR_DISTANCE\(\s*(\w+)\s*,\s*(:\w+)\s*,\s*EUCLIDEAN\s*\)", re.IGNORECASE)
+_OFFSET_FETCH = re.compile(r"OFFSET\s+(:?\w+)\s+ROWS\s+FETCH\s+NEXT\s+(:?\w+)\s+ROWS\s+ONLY", re.IGNORECASE)
+_FETCH_FIRST = re.compile(
+    r"FETCH\s+(?:APPROX\s+|EXACT\s+)?FIRST\s+(:?\w+)\s+ROWS\s+ONLY(?:\s+WITH\s+TARGET\s+ACCURACY\s+\d+)?",
+    re.IGNORECASE
+)
+
+_JSON_TABLE = re.compile(
+    r"JSON_TABLE\((:\w+),\s*'\$\[\*\]'\s*COLUMNS\s*\((.*?)\)\s*\)\s*(\w+)", re.DOTALL | re.IGNORECASE
+)
+_COLUNA_JSON = re.compile(r"(\w+)\s+[\w()]+\s+PATH\s+'([^']+)'", re.IGNORECASE)
+
+
+def _traduzir_json_table(match):
+    bind, colunas, alias = match.groups()
+    selecao = ", ".join(
+        f"json_extract(value, '{caminho}') AS {nome}" for nome, caminho in _COLUNA_JSON.findall(colunas)
+    )
+    return f"(SELECT {selecao} FROM json_each({bind})) {alias}"
+
+
+def _upsert_embeddings(texto):
+    """MERGE INTO embeddings_produtos -> INSERT ... ON CONFLICT, com as colunas do INSERT do MERGE."""
+    colunas, valores = _INSERT_MERGE.search(texto).groups()
+    atualizacoes = ", ".join(
+        f"{c.strip()} = excluded.{c.strip()}" for c in colunas.split(",") if c.strip() != "id"
+    )
+    return (f"INSERT INTO embeddings_produtos ({colunas}) VALUES ({valores}) "
+            f"ON CONFLICT(id) DO UPDATE SET {atualizacoes}")
+
+
+def _distancia_euclidiana(a, b):
+    if a is None or b is None:
+        return None
+    return float(np.linalg.norm(
+        np.frombuffer(a, dtype=np.float32).astype(np.float64) - np.frombuffer(b, dtype=np.float32).astype(np.float64)
+    ))
+
+
+def _parametros(params):
+    # VECTOR é ligado como array.array('f') no oracledb; no SQLite vira BLOB float32
+    if isinstance(params, dict):
+        return {k: v.tobytes() if isinstance(v, array.array) else v for k, v in params.items()}
+    return params or {}
+
+
+def traduzir(sql):
+    """Converte as construções Oracle usadas no projeto para SQLite. Retorna None para no-op."""
+    texto = sql.strip()
+    if re.match(r"BEGIN\b", texto, re.IGNORECASE):
+        return None   # DDL em blocos PL/SQL: o schema SQLite já é criado por criar_schema()
+    if re.match(r"MERGE\s+INTO\s+embeddings_produtos\b", texto, re.IGNORECASE):
+        return _upsert_embeddings(texto)
+    texto = re.sub(r"DBMS_FLASHBACK\.GET_SYSTEM_CHANGE_NUMBER\s+FROM\s+dual",
+                   "COALESCE(MAX(rowid), 0) FROM item_nota_fiscal", texto, flags=re.IGNORECASE)
+    # Aproximação: rowid cresce a cada inserção, como o SCN das linhas novas
+    texto = re.sub(r"\bORA_ROWSCN\b", "rowid", texto, flags=re.IGNORECASE)
+    texto = _JSON_TABLE.sub(_traduzir_json_table, texto)
+    # Busca vetorial no banco: sem índice vetorial no SQLite, APPROX e EXACT são a mesma varredura
+    texto = _VECTOR_DISTANCE.sub(r"vector_distance(\1, \2)", texto)
+    texto = _FETCH_FIRST.sub(r"LIMIT \1", texto)
+    texto = _OFFSET_FETCH.sub(r"LIMIT \2 OFFSET \1", texto)
+    texto = re.sub(r"\s+FROM\s+dual\b", "", texto, flags=re.IGNORECASE)
+    return texto
+
+
+def criar_schema(caminho):
+    connection = sqlite3.connect(caminho)
+    connection.executescript(SCHEMA)
+    try:
+        # Bases geradas antes da coluna VECTOR
+        connection.execute("ALTER TABLE embeddings_produtos ADD COLUMN vetor_nativo BLOB")
+    except sqlite3.OperationalError:
+        pass
+    connection.commit()
+    connection.close()
+
+
+class CursorSQLite:
+    """Cursor sqlite3 com a superfície do oracledb.Cursor usada no projeto."""
+
+    def __init__(self, connection):
+        self._cursor = connection.cursor()
+        self.arraysize = 100
+        self.prefetchrows = 2
+        self.outputtypehandler = None
+        self._vazio = False
+
+    def setinputsizes(self, *args, **kwargs):
+        pass
+
+    def execute(self, sql, params=None):
+        traduzido = traduzir(sql)
+        self._vazio = traduzido is None
+        if not self._vazio:
+            self._cursor.execute(traduzido, _parametros(params))
+        return self
+
+    def executemany(self, sql, lista):
+        traduzido = traduzir(sql)
+        if traduzido is not None:
+            self._cursor.executemany(traduzido, [_parametros(params) for params in lista])
+
+    def fetchone(self):
+        return None if self._vazio else self._cursor.fetchone()
+
+    def fetchmany(self, tamanho=None):
+        return [] if self._vazio else self._cursor.fetchmany(tamanho or self.arraysize)
+
+    def fetchall(self):
+        return [] if self._vazio else self._cursor.fetchall()
+
+    def __iter__(self):
+        while True:
+            rows = self.fetchmany()
+            if not rows:
+                return
+            yield from rows
+
+    def close(self):
+        self._cursor.close()
+
+
+class ConexaoSQLite:
+    def __init__(self, caminho):
+        self._connection = sqlite3.connect(caminho, check_same_thread=False)
+        self._connection.create_function("vector_distance", 2, _distancia_euclidiana, deterministic=True)
+
+    def cursor(self):
+        return CursorSQLite(self._connection)
+
+    def commit(self):
+        self._connection.commit()
+
+    def ping(self):
+        self._connection.execute("SELECT 1")
+
+    def close(self):
+        self._connection.close()
+
+
+class PoolSQLite:
+    """Pool com a interface mínima do oracledb.ConnectionPool (acquire/release e contadores)."""
+
+    def __init__(self, caminho, max=8):
+        criar_schema(caminho)
+        self.caminho = caminho
+        self.min = 0
+        self.max = max
+        self.stmtcachesize = 0
+        self.opened = 0
+        self.busy = 0
+        self._livres = []
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            self.busy += 1
+            if self._livres:
+                return self._livres.pop()
+            self.opened += 1
+        return ConexaoSQLite(self.caminho)
+
+    def release(self, connection):
+        with self._lock:
+            self.busy -= 1
+            self._livres.append(connection)
+
+    def close(self, force=False):
+        with self._lock:
+            for connection in self._livres:
+                connection.close()
+            self._livres = []
+
+
+class CursorSQLiteAsync:
+    """Versão async do cursor; o SQLite é local, então as chamadas rodam direto no loop."""
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def __getattr__(self, nome):
+        return getattr(self._cursor, nome)
+
+    def __setattr__(self, nome, valor):
+        if nome == "_cursor":
+            object.__setattr__(self, nome, valor)
+        else:
+            setattr(self._cursor, nome, valor)
+
+    async def execute(self, sql, params=None):
+        self._cursor.execute(sql, params)
+
+    async def fetchall(self):
+        return self._cursor.fetchall()
+
+    async def fetchmany(self, tamanho=None):
+        return self._cursor.fetchmany(tamanho)
+
+    async def fetchone(self):
+        return self._cursor.fetchone()
+
+    def __aiter__(self):
+        return self._iterar()
+
+    async def _iterar(self):
+        for row in self._cursor:
+            yield row
+
+
+class ConexaoSQLiteAsync:
+    def __init__(self, connection):
+        self._connection = connection
+
+    def cursor(self):
+        return CursorSQLiteAsync(self._connection.cursor())
+
+    async def commit(self):
+        self._connection.commit()
+
+    async def ping(self):
+        self._connection.ping()
+
+
+class PoolSQLiteAsync:
+    def __init__(self, caminho, max=8):
+        self._pool = PoolSQLite(caminho, max)
+
+    def __getattr__(self, nome):
+        return getattr(self._pool, nome)
+
+    async def acquire(self):
+        return ConexaoSQLiteAsync(self._pool.acquire())
+
+    async def release(self, connection):
+        self._pool.release(connection._connection)
+
+    async def close(self, force=False):
+        self._pool.close(force)
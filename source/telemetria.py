@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+import os
+import time
+import functools
+import contextvars
+from contextlib import contextmanager
+from opentelemetry import trace, metrics, propagate
+from opentelemetry.trace import SpanKind, Status, StatusCode
+
+# === CONFIGURAÇÃO ===
+TELEMETRIA_ATIVA = os.environ.get("TELEMETRIA", "1") != "0"
+SERVICO = os.environ.get("TELEMETRIA_SERVICO", "invoice_item_resolver")
+OTLP_TRACES = os.environ.get("OTLP_TRACES_ENDPOINT", "http://localhost:6006/v1/traces")   # Phoenix, como no main.py
+OTLP_METRICAS = os.environ.get("OTLP_METRICAS_ENDPOINT", "")                              # vazio = sem export
+
+# Tracer/meter "proxy": passam a exportar assim que configurar() instala os providers
+tracer = trace.get_tracer(SERVICO)
+meter = metrics.get_meter(SERVICO)
+
+_duracao_ferramenta = meter.create_histogram(
+    "mcp.ferramenta.duracao", unit="ms", description="Latência de cada chamada de ferramenta MCP"
+)
+_duracao_etapa = meter.create_histogram(
+    "mcp.etapa.duracao", unit="ms", description="Latência por etapa (checkout, SQL, embedding, busca, fuzzy...)"
+)
+_linhas = meter.create_counter("mcp.linhas", description="Linhas lidas do banco ou dos índices em memória")
+_cache = meter.create_counter("mcp.cache", description="Consultas ao cache, por resultado (hit/miss)")
+
+_configurado = False
+
+
+def configurar():
+    """
+    Instala TracerProvider (e MeterProvider, se houver endpoint) com export OTLP.
+    Chamado pelo servidor MCP, que roda em processo próprio; o main.py configura o dele.
+    """
+    global _configurado
+    if _configurado or not TELEMETRIA_ATIVA:
+        return
+    from opentelemetry.sdk.resources import Resource
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import BatchSpanProcessor
+    from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+
+    resource = Resource(attributes={"service.name": SERVICO})
+    provider = TracerProvider(resource=resource)
+    provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter(endpoint=OTLP_TRACES)))
+    trace.set_tracer_provider(provider)
+
+    if OTLP_METRICAS:
+        from opentelemetry.sdk.metrics import MeterProvider
+        from opentelemetry.sdk.metrics.export import PeriodicExportingMetricReader
+        from opentelemetry.exporter.otlp.proto.http.metric_exporter import OTLPMetricExporter
+        leitor = PeriodicExportingMetricReader(OTLPMetricExporter(endpoint=OTLP_METRICAS))
+        metrics.set_meter_provider(MeterProvider(resource=resource, metric_readers=[leitor]))
+    _configurado = True
+
+
+def injetar_contexto():
+    """Trace context atual (traceparent/tracestate) em um dicionário, para enviar no _meta do MCP."""
+    portador = {}
+    propagate.inject(portador)
+    return portador
+
+
+@contextmanager
+def ferramenta(nome, portador=None):
+    """Span raiz de uma chamada de ferramenta, filho do span do cliente quando o contexto vem em `portador`."""
+    contexto = propagate.extract(portador) if portador else None
+    inicio = time.perf_counter()
+    with tracer.start_as_current_span(
+            f"mcp.{nome}", context=contexto, kind=SpanKind.SERVER, attributes={"mcp.ferramenta": nome}
+    ) as span:
+        try:
+            yield span
+        finally:
+            _duracao_ferramenta.record((time.perf_counter() - inicio) * 1000, {"ferramenta": nome})
+
+
+@contextmanager
+def etapa(nome, **atributos):
+    """Span filho para uma etapa da ferramenta, com a duração também no histograma mcp.etapa.duracao."""
+    inicio = time.perf_counter()
+    with tracer.start_as_current_span(nome, attributes=atributos) as span:
+        try:
+            yield span
+        finally:
+            _duracao_etapa.record((time.perf_counter() - inicio) * 1000, {"etapa": nome})
+
+
+def registrar_resultado(span, resultado):
+    """Marca no span o tamanho do resultado e, para respostas {"erro": ...}, o status de erro."""
+    if isinstance(resultado, list):
+        span.set_attribute("mcp.resultado.itens", len(resultado))
+    elif isinstance(resultado, dict) and "erro" in resultado:
+        span.set_attribute("mcp.erro", str(resultado["erro"]))
+        span.set_status(Status(StatusCode.ERROR, str(resultado["erro"])))
+
+
+def registrar_linhas(span, linhas, origem):
+    span.set_attribute("linhas", linhas)
+    _linhas.add(linhas, {"origem": origem})
+
+
+def registrar_cache(span, nome, hit):
+    span.set_attribute(f"{nome}.cache_hit", hit)
+    _cache.add(1, {"cache": nome, "resultado": "hit" if hit else "miss"})
+
+
+def no_contexto(fn, *args):
+    """
+    Amarra fn ao contexto atual para rodar em run_in_executor (que não copia contextvars),
+    assim os spans abertos na thread do executor continuam no mesmo trace.
+    """
+    return functools.partial(contextvars.copy_context().run, fn, *args)
@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+import difflib
+import sqlite3
+import pytest
+from rapidfuzz import fuzz
+import gerar_dados_sinteticos
+from fuzzy_index import IndiceFuzzy
+
+
+@pytest.fixture(scope="module")
+def descricoes(tmp_path_factory):
+    caminho = str(tmp_path_factory.mktemp("fuzzy") / "base.db")
+    gerar_dados_sinteticos.gerar(caminho, produtos=1500, notas=0, itens_por_nota=1)
+    connection = sqlite3.connect(caminho)
+    try:
+        return [descricao for descricao, in connection.execute("SELECT descricao FROM produtos ORDER BY id")]
+    finally:
+        connection.close()
+
+
+def _consultas(descricoes):
+    # Títulos exatos (duplicados no catálogo), com erros de digitação, parciais e sem correspondência
+    return [
+        descricoes[0], descricoes[1].lower(), "harry poter e a pedra filosofal", "o velho e o mar",
+        "senhor dos aneis tolkien", "1984 orwell", "Agatha Christie", "zzzz qqqq", "", "Stephen King It"
+    ]
+
+
+def test_corrigir_igual_ao_difflib(descricoes):
+    indice = IndiceFuzzy(descricoes)
+    for texto in _consultas(descricoes):
+        sugestoes = difflib.get_close_matches(texto, descricoes, n=1, cutoff=0.6)
+        assert indice.corrigir(texto, cutoff=0.6) == (sugestoes[0] if sugestoes else texto)
+
+
+def test_melhores_fuzzy_igual_ao_token_sort_ratio(descricoes):
+    indice = IndiceFuzzy(descricoes)
+    for texto in _consultas(descricoes):
+        # Varredura original: token_sort_ratio em todo o catálogo + sort estável decrescente
+        scores = [(i, fuzz.token_sort_ratio(texto, descricao)) for i, descricao in enumerate(descricoes)]
+        scores.sort(key=lambda par: par[1], reverse=True)
+        for k in (1, 5, 20):
+            resultado = indice.melhores_fuzzy(texto, k)
+            assert [i for i, _ in resultado] == [i for i, _ in scores[:k]]
+            assert [s for _, s in resultado] == pytest.approx([s for _, s in scores[:k]])
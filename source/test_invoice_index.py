@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+import sqlite3
+import pytest
+import db_pool
+import gerar_dados_sinteticos
+from invoice_index import IndiceNotas
+
+# Mesmo filtro de server_nf_items._buscar_notas (sem paginação)
+CONSULTA = """
+    SELECT nf.numero_nf, nf.nome_cliente, nf.estado, nf.data_saida,
+           inf.numero_item, inf.codigo_ean, inf.descricao_produto, inf.valor_unitario
+    FROM nota_fiscal nf
+             JOIN item_nota_fiscal inf ON nf.numero_nf = inf.numero_nf
+    WHERE LOWER(nf.nome_cliente) LIKE LOWER(:cliente)
+      AND LOWER(nf.estado) = LOWER(:estado)
+      AND inf.codigo_ean = :ean
+"""
+FAIXA = " AND inf.valor_unitario BETWEEN :preco_min AND :preco_max"
+
+
+@pytest.fixture(scope="module")
+def banco(tmp_path_factory):
+    caminho = str(tmp_path_factory.mktemp("notas") / "base.db")
+    gerar_dados_sinteticos.gerar(caminho, produtos=600, notas=3000, itens_por_nota=3)
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(db_pool, "DB_BACKEND", f"sqlite:{caminho}")
+        mp.setattr(db_pool, "_pool", None)
+        yield caminho
+        db_pool.fechar_pool()
+
+
+def _sql(cliente, estado, preco, ean, margem=0.05):
+    params = {"cliente": f"%{cliente}%", "estado": estado, "ean": ean}
+    consulta = CONSULTA
+    if preco is not None:
+        consulta += FAIXA
+        params.update(preco_min=preco * (1 - margem), preco_max=preco * (1 + margem))
+    with db_pool.conexao() as connection:
+        cursor = connection.cursor()
+        cursor.execute(consulta, params)
+        rows = [tuple(row) for row in cursor.fetchall()]
+        cursor.close()
+    return sorted(rows)
+
+
+def _criterios(caminho):
+    connection = sqlite3.connect(caminho)
+    itens = connection.execute("""
+        SELECT nf.nome_cliente, nf.estado, inf.valor_unitario, inf.codigo_ean
+        FROM nota_fiscal nf JOIN item_nota_fiscal inf ON nf.numero_nf = inf.numero_nf
+        ORDER BY nf.numero_nf DESC, inf.numero_item LIMIT 20
+    """).fetchall()
+    connection.close()
+    criterios = []
+    for cliente, estado, preco, ean in itens:
+        # Cliente parcial e em caixa diferente, estado minúsculo, com e sem faixa de preço
+        criterios += [(cliente, estado, preco, ean), (cliente[:-1].upper(), estado.lower(), preco, ean),
+                      ("cliente", estado, None, ean), (cliente, "XX", preco, ean)]
+    return criterios + [(None, "SP", None, itens[0][3]), ("Cliente", "SP", 50.0, None)]
+
+
+def test_buscar_igual_ao_sql(banco):
+    indice = IndiceNotas(intervalo_incremental=0, intervalo_recarga=0)
+    criterios = _criterios(banco)
+    assert any(_sql(*c) for c in criterios)
+    for cliente, estado, preco, ean in criterios:
+        assert sorted(indice.buscar(cliente, estado, preco, ean)) == _sql(cliente, estado, preco, ean)
+
+
+def test_buscar_apos_incremental(banco):
+    indice = IndiceNotas(intervalo_incremental=0, intervalo_recarga=0)
+    connection = sqlite3.connect(banco)
+    ean = connection.execute("SELECT codigo_ean FROM item_nota_fiscal LIMIT 1").fetchone()[0]
+    connection.execute(
+        "INSERT INTO nota_fiscal VALUES ('NOVA0001', 'CLNOVO', 'Cliente Novo', 10.0, '2025-12-31', 'Curitiba', 'PR')"
+    )
+    connection.executemany("INSERT INTO item_nota_fiscal VALUES ('NOVA0001', ?, ?, 'Novo', ?, 1, ?, 0)",
+                           [(1, ean, 99.9, 99.9), (2, ean, 101.0, 101.0), (3, "0000000000000", 100.0, 100.0)])
+    connection.commit()
+    connection.close()
+    assert indice.atualizar_incremental() == 3
+    for cliente, estado, preco, ean_busca in [("novo", "pr", 100.0, ean), ("Cliente", "PR", None, ean),
+                                               ("novo", "PR", 100.0, "0000000000000")]:
+        resultado = sorted(indice.buscar(cliente, estado, preco, ean_busca))
+        assert resultado and resultado == _sql(cliente, estado, preco, ean_busca)
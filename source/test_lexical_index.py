@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+import re
+import sqlite3
+import pytest
+import db_pool
+import gerar_dados_sinteticos
+from lexical_index import IndiceLexico, soundex
+
+
+@pytest.fixture(scope="module")
+def banco(tmp_path_factory):
+    caminho = str(tmp_path_factory.mktemp("lexico") / "base.db")
+    gerar_dados_sinteticos.gerar(caminho, produtos=800, notas=0, itens_por_nota=1)
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(db_pool, "DB_BACKEND", f"sqlite:{caminho}")
+        mp.setattr(db_pool, "_pool", None)
+        yield caminho
+        db_pool.fechar_pool()
+
+
+def _distancia(a, b):
+    anterior = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        atual = [i]
+        for j, cb in enumerate(b, 1):
+            atual.append(min(anterior[j] + 1, atual[j - 1] + 1, anterior[j - 1] + (ca != cb)))
+        anterior = atual
+    return anterior[-1]
+
+
+def _fn_busca_avancada(caminho, termos):
+    """Transcrição direta do PL/SQL: varre todos os produtos e pontua termo a termo."""
+    connection = sqlite3.connect(caminho)
+    produtos = connection.execute("SELECT codigo, descricao FROM produtos ORDER BY id").fetchall()
+    connection.close()
+    tokens = [t.lower() for t in re.findall(r"\S+", termos)]
+    resultado = []
+    for codigo, descricao in produtos:
+        descricao_lower = descricao.lower()
+        palavras = re.findall(r"\w+", descricao_lower)
+        score = 0
+        for token in tokens:
+            if token in descricao_lower:
+                score += 3
+                continue
+            if soundex(token) is not None and soundex(token) in {soundex(p) for p in palavras}:
+                score += 2
+            if any(_distancia(p, token) <= 2 for p in palavras):
+                score += 1
+        if score > 0:
+            resultado.append({"codigo": codigo, "descricao": descricao, "similaridade": score})
+    # Mesma ordem do índice: similaridade decrescente, empate pela ordem do catálogo
+    return sorted(resultado, key=lambda r: -r["similaridade"])
+
+
+CONSULTAS = ["harry poter pedra", "velho mar", "senhor dos aneis", "tolkein", "agata cristie expresso", "xyzw"]
+
+
+def test_buscar_igual_ao_fn_busca_avancada(banco):
+    indice = IndiceLexico(intervalo_verificacao=0)
+    for termos in CONSULTAS:
+        assert indice.buscar(termos) == _fn_busca_avancada(banco, termos)
+
+
+def test_buscar_apos_atualizacao(banco):
+    indice = IndiceLexico(intervalo_verificacao=0)
+    connection = sqlite3.connect(banco)
+    connection.execute("INSERT INTO produtos (codigo, descricao) VALUES ('NOVO0001', 'Harry Potter e o Prisioneiro')")
+    connection.commit()
+    connection.close()
+    assert indice.atualizar_se_mudou()
+    assert indice.buscar("harry prisioneiro") == _fn_busca_avancada(banco, "harry prisioneiro")
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+import tracemalloc
+import numpy as np
+from vector_index import IndiceExato, IndiceInt8
+
+
+def _dados(n=20000, dim=128, consultas=4):
+    rng = np.random.default_rng(0)
+    vetores = rng.standard_normal((n, dim)).astype(np.float32)
+    return vetores, rng.standard_normal((consultas, dim))
+
+
+def _pico(fn, *args):
+    tracemalloc.start()
+    try:
+        fn(*args)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def test_buscar_nao_copia_a_matriz():
+    vetores, consultas = _dados()
+    indice = IndiceExato(vetores)
+    # Consulta float64: sem o cast para float32 a matriz inteira seria promovida (2x vetores.nbytes)
+    assert _pico(indice.buscar, consultas[0], 5) < vetores.nbytes / 4
+    assert _pico(indice.buscar_lote, consultas, 5) < vetores.nbytes / 4
+
+
+def test_buscar_mesmo_ranking_da_forca_bruta():
+    vetores, consultas = _dados(n=2000)
+    indice = IndiceExato(vetores)
+    esperado = np.linalg.norm(vetores.astype(np.float64) - consultas[0], axis=1)
+    indices, dists = indice.buscar(consultas[0], 10)
+    assert dists.dtype == np.float64
+    np.testing.assert_allclose(dists, np.sort(esperado)[:10], rtol=1e-4)
+    lote, dists_lote = indice.buscar_lote(consultas, 10)
+    np.testing.assert_array_equal(lote[0], indices)
+    np.testing.assert_allclose(dists_lote[0], dists, rtol=1e-6)
+
+
+def test_indice_persistido_reconstruido_quando_os_vetores_mudam(tmp_path):
+    vetores, consultas = _dados(n=2000)
+    caminho = str(tmp_path / "indice_int8.npz")
+    IndiceInt8(vetores, caminho=caminho)
+    # Mesma quantidade de linhas, conteúdo novo (ex.: descrições reembeddadas)
+    novos = vetores[::-1].copy()
+    indice = IndiceInt8(novos, caminho=caminho)
+    esperado = np.argsort(np.linalg.norm(novos.astype(np.float64) - consultas[0], axis=1))[:5]
+    np.testing.assert_array_equal(indice.buscar(consultas[0], 5)[0], esperado)
+    # Mesmos vetores: reaproveita os códigos salvos
+    assert IndiceInt8(novos, caminho=caminho)._carregar()
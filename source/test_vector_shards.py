@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+import sqlite3
+import numpy as np
+import pytest
+import gerar_dados_sinteticos
+from fake_embeddings import EmbeddingsFake
+from vector_index import IndiceExato
+from vector_shards import IndiceFragmentado
+
+
+@pytest.fixture(scope="module")
+def catalogo(tmp_path_factory):
+    diretorio = tmp_path_factory.mktemp("fragmentos")
+    caminho = str(diretorio / "base.db")
+    gerar_dados_sinteticos.gerar(caminho, produtos=1200, notas=0, itens_por_nota=1)
+    connection = sqlite3.connect(caminho)
+    descricoes = [descricao for descricao, in connection.execute("SELECT descricao FROM produtos ORDER BY id")]
+    connection.close()
+    # Títulos repetidos no catálogo sintético geram vetores idênticos: exercita o desempate por posição
+    embeddings = EmbeddingsFake(dimensao=64)
+    vetores = np.memmap(str(diretorio / "vetores.f32"), dtype=np.float32, mode="w+", shape=(len(descricoes), 64))
+    vetores[:] = [embeddings.embed_query(descricao) for descricao in descricoes]
+    vetores.flush()
+    consultas = np.array([embeddings.embed_query(texto) for texto in (
+        descricoes[0], descricoes[7], "harry poter", "o velho e o mar", "tolkien aneis", "zzzz"
+    )])
+    return vetores, consultas
+
+
+@pytest.mark.parametrize("fragmentos", [1, 3, 7])
+def test_fragmentado_igual_ao_indice_unico(catalogo, fragmentos):
+    vetores, consultas = catalogo
+    exato = IndiceExato(np.asarray(vetores))
+    indice = IndiceFragmentado(vetores, fragmentos=fragmentos)
+    try:
+        for k in (1, 5, 50):
+            for consulta in consultas:
+                indices, dists = indice.buscar(consulta, k)
+                esperado, dists_esperadas = exato.buscar(consulta, k)
+                np.testing.assert_array_equal(indices, esperado)
+                np.testing.assert_allclose(dists, dists_esperadas, rtol=1e-6)
+            lote, dists_lote = indice.buscar_lote(consultas, k)
+            esperado, dists_esperadas = exato.buscar_lote(consultas, k)
+            np.testing.assert_array_equal(lote, esperado)
+            np.testing.assert_allclose(dists_lote, dists_esperadas, rtol=1e-6)
+    finally:
+        indice.fechar()
@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+from vector_index import IndiceExato
+from fuzzy_index import IndiceFuzzy
+
+# === CONFIGURAÇÃO ===
+SOBRA_OCULTOS = 16     # vizinhos extras pedidos à base para compensar versões ocultas (dobra se faltar)
+
+
+class _Produtos:
+    """Visão somente leitura de base + delta como uma única lista de produtos."""
+    __slots__ = ("base", "delta")
+
+    def __init__(self, base, delta):
+        self.base = base
+        self.delta = delta
+
+    def __len__(self):
+        return len(self.base) + len(self.delta)
+
+    def __getitem__(self, pos):
+        return self.base[pos] if pos < len(self.base) else self.delta[pos - len(self.base)]
+
+
+class CatalogoVetorial:
+    """
+    Estado imutável consultado pelo BuscaProdutoSimilar: o snapshot base (vetores do mmap,
+    índice vetorial e índice fuzzy) mais um delta pequeno com os produtos novos ou
+    alterados desde o watermark da base. com_delta() devolve um catálogo novo que
+    compartilha a base (copy-on-write); a troca é uma única atribuição, então uma consulta
+    em andamento sempre termina sobre o catálogo que leu no início.
+
+    Posições 0..N-1 são da base e N.. do delta; versões antigas de produtos substituídos
+    ficam ocultas nas buscas.
+    """
+
+    def __init__(self, vetores, produtos, indice, indice_fuzzy, watermark, delta=None, ocultos=None):
+        self.vetores = vetores
+        self.produtos_base = produtos
+        self.indice = indice
+        self.indice_fuzzy = indice_fuzzy
+        self.watermark = watermark
+        self._delta = delta or {}                                 # id -> (produto, vetor)
+        self._ocultos = np.asarray(sorted(ocultos or ()), dtype=np.int64)
+        self._posicoes_base = None
+
+        itens = list(self._delta.values())
+        self.produtos_delta = [produto for produto, _ in itens]
+        self.produtos = _Produtos(self.produtos_base, self.produtos_delta)
+        if itens:
+            self.indice_delta = IndiceExato(np.vstack([vetor for _, vetor in itens]).astype(np.float32))
+            self.fuzzy_delta = IndiceFuzzy([produto["descricao"] for produto in self.produtos_delta])
+        else:
+            self.indice_delta = self.fuzzy_delta = None
+
+    def __len__(self):
+        """Produtos distintos visíveis (base sem os substituídos + delta)."""
+        return len(self.produtos_base) - len(self._ocultos) + len(self.produtos_delta)
+
+    @property
+    def tamanho_delta(self):
+        return len(self.produtos_delta)
+
+    def posicoes_base(self):
+        # id -> posição na base; calculado uma vez e herdado pelos catálogos derivados
+        if self._posicoes_base is None:
+            self._posicoes_base = {produto["id"]: pos for pos, produto in enumerate(self.produtos_base)}
+        return self._posicoes_base
+
+    def com_delta(self, linhas, watermark):
+        """Novo catálogo com as linhas (id, codigo, descricao, vetor) aplicadas sobre este."""
+        delta = dict(self._delta)
+        ocultos = set(self._ocultos.tolist())
+        posicoes = self.posicoes_base()
+        for id_, codigo, descricao, vetor in linhas:
+            delta[id_] = ({"id": id_, "codigo": codigo, "descricao": descricao}, vetor)
+            if id_ in posicoes:
+                ocultos.add(posicoes[id_])
+        novo = CatalogoVetorial(
+            self.vetores, self.produtos_base, self.indice, self.indice_fuzzy, watermark, delta, ocultos
+        )
+        novo._posicoes_base = posicoes
+        return novo
+
+    # === BUSCA VETORIAL ===
+
+    def _buscar_base(self, consulta, k):
+        """
+        Top-k visível da base. Pede k + SOBRA_OCULTOS vizinhos e só repete a busca, dobrando
+        a sobra, se ocultos demais caíram no resultado; k + len(ocultos) sempre basta.
+        """
+        if not len(self._ocultos):
+            return self.indice.buscar(consulta, k)
+        maximo = min(k + len(self._ocultos), len(self.produtos_base))
+        pedidos = min(k + SOBRA_OCULTOS, maximo)
+        while True:
+            indices, dists = self.indice.buscar(consulta, pedidos)
+            visiveis = ~np.isin(indices, self._ocultos)
+            # Índices aproximados podem devolver menos que o pedido: não adianta pedir mais
+            if np.count_nonzero(visiveis) >= k or pedidos >= maximo or len(indices) < pedidos:
+                return indices[visiveis][:k], dists[visiveis][:k]
+            pedidos = min(k + 2 * (pedidos - k), maximo)
+
+    def buscar(self, consulta, k):
+        if self.indice_delta is None and not len(self._ocultos):
+            return self.indice.buscar(consulta, k)
+        indices, dists = self._buscar_base(consulta, k)
+        if self.indice_delta is not None:
+            indices_delta, dists_delta = self.indice_delta.buscar(consulta, k)
+            indices = np.concatenate([indices, indices_delta + len(self.produtos_base)])
+            dists = np.concatenate([dists, dists_delta])
+            ordem = np.argsort(dists, kind="stable")[:k]
+            indices, dists = indices[ordem], dists[ordem]
+        return indices, dists
+
+    def buscar_lote(self, consultas, k):
+        if self.indice_delta is None and not len(self._ocultos):
+            return self.indice.buscar_lote(consultas, k)
+        resultados = [self.buscar(consulta, k) for consulta in np.asarray(consultas)]
+        return [r[0] for r in resultados], [r[1] for r in resultados]
+
+    # === CORREÇÃO E FALLBACK FUZZY ===
+
+    def corrigir(self, texto, cutoff=0.6):
+        """Mesmo resultado de difflib.get_close_matches(n=1) sobre as descrições visíveis."""
+        opcoes = [self.indice_fuzzy.melhor_correcao(texto, cutoff, self._ocultos)]
+        if self.fuzzy_delta is not None:
+            opcoes.append(self.fuzzy_delta.melhor_correcao(texto, cutoff))
+        melhor = max((o for o in opcoes if o is not None), default=None)
+        return melhor[1] if melhor else texto
+
+    def melhores_fuzzy(self, texto, k):
+        resultado = self.indice_fuzzy.melhores_fuzzy(texto, k, self._ocultos)
+        if self.fuzzy_delta is not None:
+            base = len(self.produtos_base)
+            resultado += [(base + i, score) for i, score in self.fuzzy_delta.melhores_fuzzy(texto, k)]
+            resultado.sort(key=lambda par: (-par[1], par[0]))
+        return resultado[:k]
@@ -0,0 +1,453 @@
+# -*- coding: utf-8 -*-
+import os
+import hashlib
+import numpy as np
+
+# === CONFIGURAÇÃO DOS ÍNDICES ===
+MODO_INDICE = os.environ.get("INDICE_VETORIAL", "exato")          # exato | hnsw | ivf | float16 | int8 | pq | fragmentado
+DIRETORIO_INDICE = os.environ.get("INDICE_DIR", os.path.dirname(os.path.abspath(__file__)))
+HNSW_M = int(os.environ.get("INDICE_HNSW_M", "32"))
+HNSW_EF_CONSTRUCTION = int(os.environ.get("INDICE_HNSW_EF_CONSTRUCTION", "200"))
+HNSW_EF_SEARCH = int(os.environ.get("INDICE_HNSW_EF_SEARCH", "64"))
+IVF_NLIST = int(os.environ.get("INDICE_IVF_NLIST", "0"))           # 0 = sqrt(N)
+IVF_NPROBE = int(os.environ.get("INDICE_IVF_NPROBE", "8"))
+# Índices quantizados: candidatos = k * REORDENAR_FATOR, reordenados pela distância exata
+REORDENAR_FATOR = int(os.environ.get("INDICE_REORDENAR_FATOR", "10"))
+PQ_M = int(os.environ.get("INDICE_PQ_M", "48"))                     # subespaços (bytes por vetor)
+PQ_AMOSTRA = int(os.environ.get("INDICE_PQ_AMOSTRA", "10000"))      # vetores usados no treino do k-means
+PQ_ITERACOES = int(os.environ.get("INDICE_PQ_ITERACOES", "15"))
+BLOCO_QUANTIZADO = 65536                                            # linhas por bloco na varredura
+
+
+def assinatura_vetores(vetores):
+    """
+    Hash do conteúdo dos vetores (lidos em blocos do mmap), guardado junto dos índices
+    persistidos: vetores regravados com a mesma quantidade de linhas invalidam o índice.
+    """
+    h = hashlib.blake2b(digest_size=16)
+    h.update(np.asarray(vetores.shape, dtype=np.int64).tobytes())
+    for inicio in range(0, len(vetores), BLOCO_QUANTIZADO):
+        h.update(np.ascontiguousarray(vetores[inicio:inicio + BLOCO_QUANTIZADO], dtype=np.float32).data)
+    return h.hexdigest()
+
+
+def _menores(dists, k):
+    """
+    Posições das k menores distâncias em ordem crescente. Empates ficam com a menor posição,
+    então o resultado não depende de como os vetores foram particionados (ver vector_shards).
+    """
+    n = len(dists)
+    if k < n:
+        limite = np.partition(dists, k - 1)[k - 1]
+        candidatos = np.flatnonzero(dists <= limite)
+    else:
+        candidatos = np.arange(n)
+    return candidatos[np.argsort(dists[candidatos], kind="stable")[:k]]
+
+
+class IndiceExato:
+    """
+    Busca exata por distância euclidiana sem materializar (vetores - consulta).
+    Usa ||v - q||² = ||v||² - 2 v·q + ||q||² com as normas pré-calculadas
+    e argpartition para selecionar apenas os k melhores.
+    """
+    modo = "exato"
+
+    def __init__(self, vetores):
+        self.vetores = vetores
+        self.normas = np.einsum("ij,ij->i", vetores, vetores, dtype=np.float64)
+
+    def __len__(self):
+        return len(self.vetores)
+
+    def memoria(self):
+        return self.vetores.nbytes + self.normas.nbytes
+
+    def buscar(self, consulta, k):
+        n = len(self.vetores)
+        if n == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        # Consulta no dtype dos vetores: float32 @ float64 promoveria a matriz N x D inteira
+        consulta = np.asarray(consulta, dtype=np.float64)
+        reduzida = consulta.astype(self.vetores.dtype)
+        dists = self.normas - 2 * (self.vetores @ reduzida) + np.einsum("i,i->", reduzida, reduzida, dtype=np.float64)
+        return self._exatas(consulta, _menores(dists, k))
+
+    def _exatas(self, consulta, ordem):
+        """
+        Recalcula em float64, como ||v - q||, as distâncias das k linhas escolhidas: na expansão
+        das normas em float32 vetores iguais dariam ~1e-4 em vez de 0. Reordena por (distância,
+        posição), o mesmo desempate de _menores.
+        """
+        diferencas = np.asarray(self.vetores[ordem], dtype=np.float64) - consulta
+        exatas = np.sqrt(np.einsum("ij,ij->i", diferencas, diferencas))
+        reordem = np.lexsort((ordem, exatas))
+        return ordem[reordem], exatas[reordem]
+
+    def buscar_lote(self, consultas, k):
+        """Top-k para várias consultas com um único produto matricial."""
+        consultas = np.asarray(consultas, dtype=np.float64)
+        n = len(self.vetores)
+        if n == 0:
+            vazio = np.empty((len(consultas), 0))
+            return vazio.astype(np.int64), vazio
+        reduzidas = consultas.astype(self.vetores.dtype)
+        dists = self.normas[None, :] - 2 * (reduzidas @ self.vetores.T) \
+            + np.einsum("ij,ij->i", reduzidas, reduzidas, dtype=np.float64)[:, None]
+        resultados = [self._exatas(consulta, _menores(linha, k)) for consulta, linha in zip(consultas, dists)]
+        largura = min(k, n)
+        return (
+            np.array([r[0] for r in resultados], dtype=np.int64).reshape(len(consultas), largura),
+            np.array([r[1] for r in resultados], dtype=np.float64).reshape(len(consultas), largura)
+        )
+
+
+class _IndiceFaiss:
+    """Base para índices aproximados do FAISS persistidos em disco."""
+    modo = None
+
+    def __init__(self, vetores, caminho=None, reconstruir=False):
+        import faiss
+        self._faiss = faiss
+        self.dim = vetores.shape[1]
+        self.caminho = caminho or os.path.join(DIRETORIO_INDICE, f"indice_{self.modo}.bin")
+        dados = np.ascontiguousarray(vetores, dtype=np.float32)
+
+        assinatura = assinatura_vetores(dados)
+        self.index = None
+        if not reconstruir and os.path.exists(self.caminho) and self._ler_assinatura() == assinatura:
+            index = faiss.read_index(self.caminho)
+            if index.ntotal == len(dados) and index.d == self.dim:
+                self.index = index
+        if self.index is None:
+            print(f"🔧 Construindo índice {self.modo} para {len(dados)} vetores...")
+            self.index = self._construir(dados)
+            temporario = f"{self.caminho}.{os.getpid()}.tmp"
+            faiss.write_index(self.index, temporario)
+            os.replace(temporario, self.caminho)
+            # Assinatura gravada depois do índice: uma falha no meio deixa o par inválido, não um índice velho válido
+            with open(temporario, "w") as f:
+                f.write(assinatura)
+            os.replace(temporario, f"{self.caminho}.assinatura")
+        self._configurar_busca()
+
+    def _ler_assinatura(self):
+        try:
+            with open(f"{self.caminho}.assinatura") as f:
+                return f.read().strip()
+        except OSError:
+            return None
+
+    def __len__(self):
+        return self.index.ntotal
+
+    def _construir(self, dados):
+        raise NotImplementedError
+
+    def _configurar_busca(self):
+        pass
+
+    def buscar(self, consulta, k):
+        consulta = np.asarray(consulta, dtype=np.float32).reshape(1, -1)
+        dists, indices = self.index.search(consulta, k)
+        validos = indices[0] >= 0
+        # FAISS devolve a distância L2 ao quadrado
+        return indices[0][validos], np.sqrt(np.maximum(dists[0][validos], 0).astype(np.float64))
+
+    def buscar_lote(self, consultas, k):
+        consultas = np.ascontiguousarray(consultas, dtype=np.float32)
+        dists, indices = self.index.search(consultas, k)
+        # Posições sem vizinho (-1) ficam com distância infinita e são descartadas pelo limiar
+        dists = np.where(indices >= 0, np.sqrt(np.maximum(dists, 0).astype(np.float64)), np.inf)
+        return indices, dists
+
+
+class IndiceHNSW(_IndiceFaiss):
+    modo = "hnsw"
+
+    def _construir(self, dados):
+        index = self._faiss.IndexHNSWFlat(self.dim, HNSW_M)
+        index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+        index.add(dados)
+        return index
+
+    def _configurar_busca(self):
+        self.index.hnsw.efSearch = HNSW_EF_SEARCH
+
+
+class IndiceIVF(_IndiceFaiss):
+    modo = "ivf"
+
+    def _construir(self, dados):
+        nlist = IVF_NLIST or max(1, int(np.sqrt(len(dados))))
+        quantizador = self._faiss.IndexFlatL2(self.dim)
+        index = self._faiss.IndexIVFFlat(quantizador, self.dim, nlist)
+        index.train(dados)
+        index.add(dados)
+        return index
+
+    def _configurar_busca(self):
+        self.index.nprobe = IVF_NPROBE
+
+
+class _IndiceQuantizado:
+    """
+    Base para índices com os vetores comprimidos em memória. A varredura aproximada
+    seleciona k * REORDENAR_FATOR candidatos e a ordem final usa a distância exata,
+    lendo dos vetores originais só as linhas candidatas (o snapshot é um mmap, então
+    a matriz float32 completa não precisa ficar residente). Códigos e parâmetros do
+    quantizador são persistidos em disco, como nos índices FAISS.
+    """
+    modo = None
+    parametros = ()    # arrays do quantizador persistidos junto com os códigos
+
+    def __init__(self, vetores, caminho=None, reconstruir=False, fator=REORDENAR_FATOR):
+        self.vetores = vetores
+        self.n, self.dim = vetores.shape
+        self.fator = max(1, fator)
+        self.caminho = caminho or os.path.join(DIRETORIO_INDICE, f"indice_{self.modo}.npz")
+        if reconstruir or not self._carregar():
+            print(f"🔧 Quantizando {self.n} vetores ({self.modo})...")
+            self._treinar()
+            self.codigos = np.concatenate(
+                [self._codificar(bloco) for bloco in self._blocos()]
+            ) if self.n else self._codificar(np.empty((0, self.dim), dtype=np.float32))
+            self._preparar()
+            self._salvar()
+
+    def __len__(self):
+        return self.n
+
+    def _blocos(self):
+        for inicio in range(0, self.n, BLOCO_QUANTIZADO):
+            yield np.asarray(self.vetores[inicio:inicio + BLOCO_QUANTIZADO], dtype=np.float32)
+
+    def _parametros(self):
+        return {nome: getattr(self, nome) for nome in self.parametros}
+
+    def _carregar(self):
+        if not os.path.exists(self.caminho):
+            return False
+        dados = np.load(self.caminho)
+        # Só reaproveita os códigos salvos se foram gerados a partir destes mesmos vetores
+        if "assinatura" not in dados.files or str(dados["assinatura"]) != assinatura_vetores(self.vetores):
+            return False
+        if dados["codigos"].shape[0] != self.n or int(dados["dim"]) != self.dim:
+            return False
+        self.codigos = dados["codigos"]
+        for nome in self.parametros:
+            setattr(self, nome, dados[nome])
+        return True
+
+    def _salvar(self):
+        temporario = f"{self.caminho}.{os.getpid()}.tmp.npz"
+        np.savez(
+            temporario, codigos=self.codigos, dim=self.dim, assinatura=assinatura_vetores(self.vetores),
+            **self._parametros()
+        )
+        os.replace(temporario, self.caminho)
+
+    def _treinar(self):
+        pass
+
+    def _codificar(self, bloco):
+        raise NotImplementedError
+
+    def _preparar(self):
+        """Pré-cálculos sobre os códigos (ex.: normas), persistidos via _parametros()."""
+        pass
+
+    def _distancias_aproximadas(self, consulta, inicio, fim):
+        """Distâncias L2² aproximadas da consulta às linhas [inicio, fim)."""
+        raise NotImplementedError
+
+    def memoria(self):
+        """Bytes residentes do índice (códigos + parâmetros), para comparar com n * dim * 4."""
+        return self.codigos.nbytes + sum(np.asarray(v).nbytes for v in self._parametros().values())
+
+    def buscar(self, consulta, k):
+        if self.n == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        consulta = np.asarray(consulta, dtype=np.float32)
+        k = min(k, self.n)
+        m = min(k * self.fator, self.n)
+
+        aproximadas = np.empty(self.n, dtype=np.float32)
+        for inicio in range(0, self.n, BLOCO_QUANTIZADO):
+            fim = min(inicio + BLOCO_QUANTIZADO, self.n)
+            aproximadas[inicio:fim] = self._distancias_aproximadas(consulta, inicio, fim)
+        candidatos = np.argpartition(aproximadas, m - 1)[:m] if m < self.n else np.arange(self.n)
+
+        # Reordenação exata: leitura ordenada das linhas candidatas no mmap
+        candidatos = np.sort(candidatos)
+        originais = np.asarray(self.vetores[candidatos], dtype=np.float64)
+        exatas = np.einsum("ij,ij->i", originais - consulta, originais - consulta)
+        ordem = np.argsort(exatas)[:k]
+        return candidatos[ordem], np.sqrt(exatas[ordem])
+
+    def buscar_lote(self, consultas, k):
+        resultados = [self.buscar(consulta, k) for consulta in np.asarray(consultas)]
+        if not resultados:
+            vazio = np.empty((0, 0))
+            return vazio.astype(np.int64), vazio
+        return np.vstack([r[0] for r in resultados]), np.vstack([r[1] for r in resultados])
+
+
+class IndiceFloat16(_IndiceQuantizado):
+    """Metade da memória do float32, com perda de recall desprezível na prática."""
+    modo = "float16"
+
+    parametros = ("normas",)
+
+    def _codificar(self, bloco):
+        return bloco.astype(np.float16)
+
+    def _preparar(self):
+        self.normas = np.einsum("ij,ij->i", self.codigos, self.codigos, dtype=np.float32)
+
+    def _distancias_aproximadas(self, consulta, inicio, fim):
+        bloco = self.codigos[inicio:fim].astype(np.float32)
+        return self.normas[inicio:fim] - 2 * (bloco @ consulta) + consulta @ consulta
+
+
+class IndiceInt8(_IndiceQuantizado):
+    """
+    Quantização escalar por dimensão em 8 bits: v ≈ minimo + codigo * escala.
+    Um quarto da memória do float32.
+    """
+    modo = "int8"
+
+    parametros = ("minimo", "escala", "normas")
+
+    def _treinar(self):
+        minimo = np.full(self.dim, np.inf, dtype=np.float32)
+        maximo = np.full(self.dim, -np.inf, dtype=np.float32)
+        for bloco in self._blocos():
+            minimo = np.minimum(minimo, bloco.min(axis=0))
+            maximo = np.maximum(maximo, bloco.max(axis=0))
+        if self.n == 0:
+            minimo, maximo = np.zeros(self.dim, np.float32), np.ones(self.dim, np.float32)
+        self.minimo = minimo
+        self.escala = np.where(maximo > minimo, (maximo - minimo) / 255, 1).astype(np.float32)
+
+    def _codificar(self, bloco):
+        return np.clip(np.rint((bloco - self.minimo) / self.escala), 0, 255).astype(np.uint8)
+
+    def _preparar(self):
+        # ||v̂||² dos vetores reconstruídos
+        self.normas = np.concatenate([
+            np.einsum("ij,ij->i", r, r)
+            for r in (self.minimo + self.codigos[i:i + BLOCO_QUANTIZADO] * self.escala
+                      for i in range(0, self.n, BLOCO_QUANTIZADO))
+        ]).astype(np.float32) if self.n else np.empty(0, np.float32)
+
+    def _distancias_aproximadas(self, consulta, inicio, fim):
+        # v̂·q = minimo·q + codigo·(escala * q)
+        produto = self.codigos[inicio:fim] @ (self.escala * consulta) + self.minimo @ consulta
+        return self.normas[inicio:fim] - 2 * produto + consulta @ consulta
+
+
+class IndicePQ(_IndiceQuantizado):
+    """
+    Product quantization: o vetor é dividido em M subespaços e cada pedaço vira o índice
+    (1 byte) do centróide mais próximo entre 256. Distâncias por tabela (ADC).
+    M bytes por vetor; mais subespaços = mais memória e mais recall.
+    """
+    modo = "pq"
+    ksub = 256
+
+    def __init__(self, vetores, caminho=None, reconstruir=False, fator=REORDENAR_FATOR, m=PQ_M):
+        dim = vetores.shape[1]
+        # Maior número de subespaços <= m que divide a dimensão
+        self.m = next(d for d in range(min(m, dim), 0, -1) if dim % d == 0)
+        super().__init__(vetores, caminho, reconstruir, fator)
+
+    parametros = ("centroides",)
+
+    def _carregar(self):
+        if not super()._carregar():
+            return False
+        return self.centroides.shape[0] == self.m
+
+    def _treinar(self):
+        rng = np.random.default_rng(42)
+        amostra_idx = np.sort(rng.choice(self.n, size=min(PQ_AMOSTRA, self.n), replace=False))
+        amostra = np.asarray(self.vetores[amostra_idx], dtype=np.float32)
+        dsub = self.dim // self.m
+        ksub = min(self.ksub, len(amostra)) or 1
+        self.centroides = np.zeros((self.m, ksub, dsub), dtype=np.float32)
+        for j in range(self.m):
+            dados = amostra[:, j * dsub:(j + 1) * dsub]
+            if len(dados) == 0:
+                continue
+            centroides = dados[rng.choice(len(dados), size=ksub, replace=False)].copy()
+            for _ in range(PQ_ITERACOES):
+                rotulos = self._mais_proximos(dados, centroides)
+                somas = np.stack(
+                    [np.bincount(rotulos, weights=dados[:, d], minlength=ksub) for d in range(dsub)], axis=1
+                )
+                contagens = np.bincount(rotulos, minlength=ksub)[:, None]
+                # Centróides sem pontos ficam onde estão
+                centroides = np.where(contagens > 0, somas / np.maximum(contagens, 1), centroides)
+            self.centroides[j] = centroides
+
+    @staticmethod
+    def _mais_proximos(dados, centroides):
+        dists = (np.einsum("ij,ij->i", centroides, centroides)[None, :] - 2 * dados @ centroides.T)
+        return np.argmin(dists, axis=1)
+
+    def _codificar(self, bloco):
+        dsub = self.dim // self.m
+        codigos = np.empty((len(bloco), self.m), dtype=np.uint8)
+        for j in range(self.m):
+            codigos[:, j] = self._mais_proximos(bloco[:, j * dsub:(j + 1) * dsub], self.centroides[j])
+        return codigos
+
+    def _distancias_aproximadas(self, consulta, inicio, fim):
+        dsub = self.dim // self.m
+        partes = consulta.reshape(self.m, dsub)
+        # tabela[j, c] = ||q_j - centroide_jc||²
+        tabela = np.einsum("jcd,jcd->jc", self.centroides - partes[:, None, :], self.centroides - partes[:, None, :])
+        return tabela[np.arange(self.m)[None, :], self.codigos[inicio:fim]].sum(axis=1)
+
+
+INDICES = {
+    "exato": IndiceExato,
+    "hnsw": IndiceHNSW,
+    "ivf": IndiceIVF,
+    "float16": IndiceFloat16,
+    "int8": IndiceInt8,
+    "pq": IndicePQ,
+    "fragmentado": None,   # vector_shards.IndiceFragmentado, importado sob demanda
+}
+
+
+def criar_indice(vetores, modo=MODO_INDICE, caminho=None, reconstruir=False):
+    """
+    Cria o índice do modo pedido. Índices persistidos são reaproveitados quando batem em
+    número de vetores e dimensão; `reconstruir` ignora o arquivo (ex.: snapshot regravado).
+    """
+    if modo not in INDICES:
+        raise ValueError(f"Modo de índice desconhecido: {modo} (use {', '.join(INDICES)})")
+    if modo == "exato":
+        return IndiceExato(vetores)
+    if modo == "fragmentado":
+        from vector_shards import IndiceFragmentado
+        return IndiceFragmentado(vetores)
+    return INDICES[modo](vetores, caminho, reconstruir)
+
+
+def medir_recall(indice, vetores, consultas, k=5):
+    """
+    Recall@k do índice contra a busca exata para um conjunto de consultas.
+    Útil para calibrar efSearch (HNSW), nprobe (IVF) e o fator de reordenação / M (quantizados).
+    """
+    exato = IndiceExato(vetores)
+    acertos = 0
+    total = 0
+    for consulta in consultas:
+        esperado, _ = exato.buscar(consulta, k)
+        obtido, _ = indice.buscar(consulta, k)
+        acertos += len(set(esperado.tolist()) & set(obtido.tolist()))
+        total += len(esperado)
+    return acertos / total if total else 1.0
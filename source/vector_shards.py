@@ -0,0 +1,226 @@
+# -*- coding: utf-8 -*-
+"""
+Busca vetorial exata fragmentada em vários processos (INDICE_VETORIAL=fragmentado).
+
+Os vetores são divididos em faixas contíguas de linhas; cada fragmento é um processo
+próprio que mapeia só a sua faixa do arquivo do snapshot (np.memmap com offset) e mantém
+um IndiceExato sobre ela. Cada consulta é enviada a todos os fragmentos ao mesmo tempo e
+o coordenador junta os top-k parciais. Como IndiceExato desempata pela menor posição e as
+faixas estão em ordem, o resultado é idêntico ao da busca exata em um único processo.
+
+Os fragmentos rodam este arquivo como script (e não via multiprocessing), para não
+reimportar o módulo principal do servidor em cada processo. Cada consulta leva um id e
+tem a própria fila de respostas; uma thread leitora por fragmento entrega cada resposta
+à fila do id. Só o envio em cada pipe é serializado, então consultas concorrentes ficam
+em andamento ao mesmo tempo nos fragmentos.
+"""
+import os
+import sys
+import queue
+import pickle
+import weakref
+import itertools
+import tempfile
+import threading
+import subprocess
+import numpy as np
+
+# === CONFIGURAÇÃO ===
+FRAGMENTOS = int(os.environ.get("INDICE_FRAGMENTOS", str(min(os.cpu_count() or 4, 8))))
+
+
+def _arquivo_vetores(vetores):
+    """(caminho, offset, temporário) de um arquivo com os vetores float32 contíguos."""
+    if isinstance(vetores, np.memmap) and vetores.filename and vetores.dtype == np.float32 \
+            and vetores.flags["C_CONTIGUOUS"]:
+        return vetores.filename, vetores.offset, None
+    # Vetores só em memória (ex.: índice criado direto de um array): grava uma cópia mapeável
+    descritor, caminho = tempfile.mkstemp(prefix="vetores_", suffix=".f32")
+    with os.fdopen(descritor, "wb") as f:
+        f.write(np.ascontiguousarray(vetores, dtype=np.float32).tobytes())
+    return caminho, 0, caminho
+
+
+def _encerrar(fragmentos, temporario):
+    for fragmento in fragmentos:
+        try:
+            fragmento.processo.stdin.close()
+        except OSError:
+            pass
+    for fragmento in fragmentos:
+        try:
+            fragmento.processo.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            fragmento.processo.kill()
+    if temporario and os.path.exists(temporario):
+        os.remove(temporario)
+
+
+class _Fragmento:
+    """Processo de um fragmento: envio serializado no stdin e thread que distribui as respostas do stdout."""
+
+    def __init__(self, processo, pendentes):
+        self.processo = processo
+        self._pendentes = pendentes       # id da consulta -> fila de respostas (compartilhado entre fragmentos)
+        self._lock_envio = threading.Lock()
+
+    def iniciar_leitura(self, posicao):
+        threading.Thread(target=self._ler_respostas, args=(posicao,), daemon=True).start()
+
+    def enviar(self, mensagem):
+        with self._lock_envio:
+            pickle.dump(mensagem, self.processo.stdin, protocol=pickle.HIGHEST_PROTOCOL)
+            self.processo.stdin.flush()
+
+    def _ler_respostas(self, posicao):
+        while True:
+            try:
+                id_consulta, resultado = pickle.load(self.processo.stdout)
+            except (EOFError, OSError, pickle.UnpicklingError):
+                # Fragmento encerrado: quem ainda espera recebe o erro em vez de travar
+                erro = RuntimeError(f"fragmento {posicao} encerrado")
+                for fila in list(self._pendentes.values()):
+                    fila.put((posicao, erro))
+                return
+            fila = self._pendentes.get(id_consulta)
+            if fila is not None:
+                fila.put((posicao, resultado))
+
+
+class IndiceFragmentado:
+    """Mesma interface de IndiceExato, com a busca distribuída entre processos de fragmento."""
+    modo = "fragmentado"
+
+    def __init__(self, vetores, fragmentos=FRAGMENTOS):
+        self.n, self.dim = vetores.shape
+        self.caminho, self.offset, self._temporario = _arquivo_vetores(vetores)
+        fragmentos = max(1, min(fragmentos, self.n))
+        limites = np.linspace(0, self.n, fragmentos + 1).astype(np.int64)
+        self.faixas = [(int(inicio), int(fim)) for inicio, fim in zip(limites[:-1], limites[1:])]
+        self._lock = threading.Lock()     # só para (re)iniciar os processos
+        self._ids = itertools.count()
+        self._pendentes = {}
+        self._fragmentos = None
+        self._pid = None
+        self._finalizador = None
+        self._iniciar()
+
+    def _iniciar(self):
+        self._pendentes = {}
+        fragmentos = []
+        for inicio, fim in self.faixas:
+            processo = subprocess.Popen(
+                [sys.executable, os.path.abspath(__file__)],
+                stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                cwd=os.path.dirname(os.path.abspath(__file__))
+            )
+            pickle.dump((self.caminho, self.offset, self.n, self.dim, inicio, fim), processo.stdin)
+            processo.stdin.flush()
+            fragmentos.append(_Fragmento(processo, self._pendentes))
+        # Aguarda a carga de todos os fragmentos (normas calculadas) antes de aceitar consultas
+        for posicao, fragmento in enumerate(fragmentos):
+            pickle.load(fragmento.processo.stdout)
+            fragmento.iniciar_leitura(posicao)
+        self._fragmentos = fragmentos
+        self._pid = os.getpid()
+        self._finalizador = weakref.finalize(self, _encerrar, fragmentos, self._temporario)
+
+    def _garantir_processos(self):
+        # Após um fork (workers do servidor HTTP) os pipes herdados são do processo pai
+        if self._pid == os.getpid():
+            return self._fragmentos
+        with self._lock:
+            if self._pid != os.getpid():
+                self._finalizador.detach()
+                self._iniciar()
+        return self._fragmentos
+
+    def __len__(self):
+        return self.n
+
+    def memoria(self):
+        return self.n * self.dim * 4 + self.n * 8
+
+    def fechar(self):
+        self._finalizador()
+
+    def _consultar(self, operacao, consultas, k):
+        fragmentos = self._garantir_processos()
+        id_consulta = next(self._ids)
+        respostas = queue.Queue()
+        self._pendentes[id_consulta] = respostas
+        try:
+            # Scatter: todos os fragmentos recebem a consulta antes de qualquer leitura
+            for fragmento in fragmentos:
+                fragmento.enviar((id_consulta, operacao, consultas, k))
+            parciais = [None] * len(fragmentos)
+            for _ in fragmentos:
+                posicao, resultado = respostas.get()
+                if isinstance(resultado, Exception):
+                    raise resultado
+                parciais[posicao] = resultado
+        finally:
+            self._pendentes.pop(id_consulta, None)
+        # Na ordem das faixas, para o desempate pela menor posição em _juntar
+        return parciais
+
+    @staticmethod
+    def _juntar(indices, dists, k):
+        # Faixas em ordem crescente + sort estável: empates ficam com a menor posição global
+        indices, dists = np.concatenate(indices), np.concatenate(dists)
+        ordem = np.argsort(dists, kind="stable")[:k]
+        return indices[ordem], dists[ordem]
+
+    def buscar(self, consulta, k):
+        if self.n == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        parciais = self._consultar("buscar", np.asarray(consulta, dtype=np.float64), k)
+        return self._juntar([p[0] for p in parciais], [p[1] for p in parciais], k)
+
+    def buscar_lote(self, consultas, k):
+        consultas = np.asarray(consultas, dtype=np.float64)
+        if self.n == 0:
+            vazio = np.empty((len(consultas), 0))
+            return vazio.astype(np.int64), vazio
+        parciais = self._consultar("buscar_lote", consultas, k)
+        resultados = [
+            self._juntar([p[0][i] for p in parciais], [p[1][i] for p in parciais], k)
+            for i in range(len(consultas))
+        ]
+        largura = min(k, self.n)
+        return (
+            np.array([r[0] for r in resultados], dtype=np.int64).reshape(len(consultas), largura),
+            np.array([r[1] for r in resultados], dtype=np.float64).reshape(len(consultas), largura)
+        )
+
+
+def executar_fragmento(entrada, saida):
+    """Laço de um processo de fragmento: lê (id, operação, consultas, k) e responde (id, top-k com posições globais)."""
+    from vector_index import IndiceExato
+    caminho, offset, n, dim, inicio, fim = pickle.load(entrada)
+    if fim > inicio:
+        vetores = np.memmap(caminho, dtype=np.float32, mode="r", offset=offset + inicio * dim * 4, shape=(fim - inicio, dim))
+    else:
+        vetores = np.empty((0, dim), dtype=np.float32)
+    indice = IndiceExato(vetores)
+    pickle.dump("pronto", saida)
+    saida.flush()
+    while True:
+        try:
+            id_consulta, operacao, consultas, k = pickle.load(entrada)
+        except EOFError:
+            return
+        try:
+            if operacao == "buscar":
+                indices, dists = indice.buscar(consultas, k)
+            else:
+                indices, dists = indice.buscar_lote(consultas, k)
+            resultado = (indices + inicio, dists)
+        except Exception as e:
+            resultado = RuntimeError(f"fragmento [{inicio}, {fim}): {e}")
+        pickle.dump((id_consulta, resultado), saida, protocol=pickle.HIGHEST_PROTOCOL)
+        saida.flush()
+
+
+if __name__ == "__main__":
+    executar_fragmento(sys.stdin.buffer, sys.stdout.buffer)
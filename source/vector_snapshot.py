@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+import os
+import json
+import time
+import pickle
+import numpy as np
+import oracledb
+import db_pool
+
+# === CONFIGURAÇÃO DO SNAPSHOT ===
+SNAPSHOT_VERSAO = 1
+SNAPSHOT_DIR = os.environ.get("SNAPSHOT_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "snapshot"))
+FETCH_ARRAYSIZE = 5000
+# Formato do BLOB em embeddings_produtos (gravado por process_vector_products): float32 | float16.
+# O snapshot local continua float32, pois é dele que a reordenação exata lê os vetores.
+FORMATO_VETOR = os.environ.get("VETOR_FORMATO", "float32")
+FORMATOS_VETOR = {"float32": np.float32, "float16": np.float16}
+
+ARQUIVO_VETORES = "vetores.f32"      # matriz float32 contígua (N x D), sem cabeçalho
+ARQUIVO_PRODUTOS = "produtos.pkl"    # lista [{id, codigo, descricao}] na mesma ordem dos vetores
+ARQUIVO_META = "snapshot.json"       # versão, watermark e formato; gravado por último
+
+
+def _blob_como_bytes(cursor, metadata):
+    # Lê o BLOB junto com a linha, evitando um round trip de LOB por produto
+    if metadata.type_code is oracledb.DB_TYPE_BLOB:
+        return cursor.var(oracledb.DB_TYPE_LONG_RAW, arraysize=cursor.arraysize)
+
+
+def ler_watermark(cursor):
+    """Assinatura barata de embeddings_produtos para detectar mudanças desde o snapshot."""
+    cursor.execute("SELECT COUNT(*), MAX(id), MAX(ORA_ROWSCN) FROM embeddings_produtos")
+    return [int(v) if v is not None else None for v in cursor.fetchone()]
+
+
+def _ler_meta(diretorio):
+    caminho = os.path.join(diretorio, ARQUIVO_META)
+    if not os.path.exists(caminho):
+        return None
+    with open(caminho) as f:
+        meta = json.load(f)
+    if meta.get("versao") != SNAPSHOT_VERSAO:
+        return None
+    tamanho_esperado = meta["n"] * meta["dim"] * np.dtype(np.float32).itemsize
+    caminho_vetores = os.path.join(diretorio, ARQUIVO_VETORES)
+    if not os.path.exists(caminho_vetores) or os.path.getsize(caminho_vetores) != tamanho_esperado:
+        return None
+    return meta
+
+
+def _abrir(diretorio, meta):
+    if meta["n"] == 0:
+        vetores = np.empty((0, meta["dim"]), dtype=np.float32)
+    else:
+        vetores = np.memmap(
+            os.path.join(diretorio, ARQUIVO_VETORES), dtype=np.float32, mode="r", shape=(meta["n"], meta["dim"])
+        )
+    with open(os.path.join(diretorio, ARQUIVO_PRODUTOS), "rb") as f:
+        produtos = pickle.load(f)
+    return vetores, produtos
+
+
+def _gravar(diretorio, cursor, watermark):
+    """Busca em streaming e grava o snapshot; o snapshot.json só é trocado no final."""
+    os.makedirs(diretorio, exist_ok=True)
+    # Temporários por processo: workers do servidor HTTP podem regravar o snapshot ao mesmo tempo
+    tmp_vetores = os.path.join(diretorio, f"{ARQUIVO_VETORES}.{os.getpid()}.tmp")
+    tmp_produtos = os.path.join(diretorio, f"{ARQUIVO_PRODUTOS}.{os.getpid()}.tmp")
+
+    cursor.arraysize = FETCH_ARRAYSIZE
+    cursor.prefetchrows = FETCH_ARRAYSIZE + 1
+    cursor.outputtypehandler = _blob_como_bytes
+    cursor.execute("SELECT id, codigo, descricao, vetor FROM embeddings_produtos ORDER BY id")
+
+    produtos = []
+    dim = 0
+    with open(tmp_vetores, "wb") as f:
+        while True:
+            rows = cursor.fetchmany()
+            if not rows:
+                break
+            for id_, codigo, descricao, vetor in rows:
+                dados = np.frombuffer(vetor, dtype=FORMATOS_VETOR[FORMATO_VETOR]).astype(np.float32, copy=False)
+                if dim == 0:
+                    dim = len(dados)
+                elif len(dados) != dim:
+                    raise ValueError(f"Vetor do produto {id_} tem dimensão {len(dados)}, esperado {dim}")
+                f.write(dados.tobytes())
+                produtos.append({"id": id_, "codigo": codigo, "descricao": descricao})
+
+    with open(tmp_produtos, "wb") as f:
+        pickle.dump(produtos, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    meta = {
+        "versao": SNAPSHOT_VERSAO,
+        "n": len(produtos),
+        "dim": dim,
+        "watermark": watermark,
+        "criado_em": time.time()
+    }
+    # Remove o meta antigo primeiro: um snapshot parcialmente trocado nunca é considerado válido
+    caminho_meta = os.path.join(diretorio, ARQUIVO_META)
+    if os.path.exists(caminho_meta):
+        os.remove(caminho_meta)
+    os.replace(tmp_vetores, os.path.join(diretorio, ARQUIVO_VETORES))
+    os.replace(tmp_produtos, os.path.join(diretorio, ARQUIVO_PRODUTOS))
+    tmp_meta = f"{caminho_meta}.{os.getpid()}.tmp"
+    with open(tmp_meta, "w") as f:
+        json.dump(meta, f)
+    os.replace(tmp_meta, caminho_meta)
+    return meta
+
+
+def carregar_snapshot(diretorio=SNAPSHOT_DIR, forcar=False):
+    """
+    Retorna (vetores, produtos, watermark, regravado). Usa o snapshot mapeado em memória
+    quando o watermark bate com o banco; senão (ou com forcar) refaz o snapshot a partir
+    de embeddings_produtos.
+    """
+    meta = _ler_meta(diretorio)
+    regravado = False
+    try:
+        with db_pool.conexao() as connection:
+            cursor = connection.cursor()
+            watermark = ler_watermark(cursor)
+            if forcar or meta is None or meta["watermark"] != watermark:
+                print("📦 Snapshot de vetores ausente ou desatualizado, recarregando do Oracle...")
+                meta = _gravar(diretorio, cursor, watermark)
+                regravado = True
+            cursor.close()
+    except Exception as e:
+        if meta is None:
+            raise
+        print(f"[ERRO] Não foi possível validar o snapshot ({e}); usando a cópia local.")
+    vetores, produtos = _abrir(diretorio, meta)
+    return vetores, produtos, meta["watermark"], regravado
+
+
+def carregar(diretorio=SNAPSHOT_DIR):
+    """Retorna (vetores, produtos) do snapshot; veja carregar_snapshot()."""
+    vetores, produtos, _, _ = carregar_snapshot(diretorio)
+    return vetores, produtos
+
+
+def ler_delta(cursor, watermark):
+    """
+    Linhas de embeddings_produtos alteradas desde `watermark` (ORA_ROWSCN maior que o
+    registrado). Retorna (watermark_atual, [(id, codigo, descricao, vetor float32)]).
+    ORA_ROWSCN é por bloco, então linhas inalteradas do mesmo bloco também podem vir;
+    aplicá-las de novo não muda nada.
+    """
+    atual = ler_watermark(cursor)
+    if atual == watermark:
+        return atual, []
+    cursor.arraysize = FETCH_ARRAYSIZE
+    cursor.outputtypehandler = _blob_como_bytes
+    cursor.execute(
+        "SELECT id, codigo, descricao, vetor FROM embeddings_produtos WHERE ORA_ROWSCN > :scn ORDER BY id",
+        {"scn": watermark[2] if watermark and watermark[2] is not None else -1}
+    )
+    dtype = FORMATOS_VETOR[FORMATO_VETOR]
+    return atual, [
+        (id_, codigo, descricao, np.frombuffer(vetor, dtype=dtype).astype(np.float32))
+        for id_, codigo, descricao, vetor in cursor
+    ]